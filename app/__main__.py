@@ -0,0 +1,5 @@
+# app/__main__.py
+# Permette di eseguire i comandi di gestione con: python -m app <comando>
+from app.cli import main
+
+main()
@@ -0,0 +1,34 @@
+# app/bootstrap.py
+import logging
+
+from app.database import engine, Base, SessionLocal
+from app.utils.db_migrations import add_missing_columns, add_missing_indexes
+
+logger = logging.getLogger(__name__)
+
+def bootstrap_database(create_tables: bool = True, migrate_schema: bool = True, seed: bool = True):
+    """
+    Prepara il database: tabelle, colonne/indici mancanti e dati iniziali
+
+    Args:
+        create_tables: Crea le tabelle mancanti con Base.metadata.create_all
+        migrate_schema: Aggiunge colonne e indici mancanti alle tabelle esistenti
+        seed: Popola il database con i dati iniziali (admin, piani, categorie, design)
+    """
+    # Importa tutti i modelli così che Base.metadata sia completo
+    import app.models  # noqa: F401
+    import app.models.shipment  # noqa: F401
+
+    if create_tables:
+        logger.info("Creazione tabelle del database...")
+        Base.metadata.create_all(bind=engine)
+
+    if migrate_schema:
+        add_missing_columns(engine)
+        add_missing_indexes(engine)
+
+    if seed:
+        from app.seed import seed_database
+
+        with SessionLocal() as db:
+            seed_database(db)
@@ -0,0 +1,343 @@
+# app/cli.py
+# Comandi di gestione, eseguibili con: python -m app <comando>
+import argparse
+import logging
+from datetime import datetime
+
+def bootstrap(args):
+    """Prima installazione: tabelle, colonne/indici mancanti e dati iniziali"""
+    from app.bootstrap import bootstrap_database
+
+    bootstrap_database(
+        create_tables=not args.skip_create_tables,
+        migrate_schema=not args.skip_migrate_schema,
+        seed=not args.skip_seed
+    )
+
+def calibrate_bcrypt(args):
+    """Sceglie il costo bcrypt più alto che rispetta la latenza di verifica richiesta"""
+    from app.utils.password_hasher import calibrate_bcrypt_rounds
+
+    rounds, timings = calibrate_bcrypt_rounds(args.target_ms, max_rounds=args.max_rounds)
+    for cost, median_ms in timings.items():
+        print(f"costo {cost:2d}: {median_ms:8.1f} ms")
+    print(f"\nCosto consigliato per {args.target_ms:.0f} ms: BCRYPT_ROUNDS={rounds}")
+
+def generate_boxes(args):
+    """Genera le box del mese per tutti gli abbonati attivi"""
+    import app.models  # noqa: F401
+    import app.models.shipment  # noqa: F401
+    from app.database import SessionLocal
+    from app.utils.monthly_boxes import generate_monthly_boxes
+
+    with SessionLocal() as db:
+        result = generate_monthly_boxes(db, args.month, chunk_size=args.chunk_size, dry_run=args.dry_run)
+
+    print(f"Box {result['month']}{' (dry run, nessuna modifica salvata)' if result['dry_run'] else ''}:")
+    print(f"  abbonati attivi:      {result['subscribers']}")
+    print(f"  spedizioni create:    {result['created']}")
+    print(f"  già generate:         {result['already_generated']}")
+    print(f"  senza design:         {result['without_designs']}")
+    print(f"  righe di spedizione:  {result['items']}")
+
+def smtp_sink(args):
+    """Server SMTP locale che accetta e scarta le email (richiede aiosmtpd, in requirements-dev.txt)"""
+    import time
+
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        raise SystemExit("Il comando richiede aiosmtpd: pip install -r requirements-dev.txt")
+
+    class Sink:
+        received = 0
+
+        async def handle_DATA(self, server, session, envelope):
+            Sink.received += 1
+            if args.verbose:
+                print(f"{envelope.mail_from} -> {', '.join(envelope.rcpt_tos)} ({len(envelope.content)} byte)")
+            return "250 OK"
+
+    logging.getLogger("mail.log").setLevel(logging.WARNING)
+    controller = Controller(Sink(), hostname=args.host, port=args.port)
+    controller.start()
+    print(f"SMTP sink in ascolto su {args.host}:{args.port} (EMAIL_USE_SSL=False, EMAIL_PASSWORD vuota)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        controller.stop()
+        print(f"Email ricevute: {Sink.received}")
+
+def benchmark_email(args):
+    """Confronta l'invio con una connessione per email e quello con il pool di connessioni"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from app.utils.email import SMTPConnectionPool, build_message, send_email
+
+    messages = [
+        (index, f"benchmark{index}@example.com", build_message(f"benchmark{index}@example.com", f"Benchmark {index}", "Corpo di prova"))
+        for index in range(args.count)
+    ]
+
+    # Verifica preliminare: senza un server raggiungibile il confronto non ha senso
+    if not send_email("benchmark@example.com", "Benchmark", "Corpo di prova"):
+        raise SystemExit("Invio di prova fallito: controllare EMAIL_SERVER/EMAIL_PORT (es. python -m app smtp-sink)")
+
+    started = time.perf_counter()
+    for index in range(args.count):
+        send_email(f"benchmark{index}@example.com", f"Benchmark {index}", "Corpo di prova")
+    single = time.perf_counter() - started
+    print(f"una connessione per email: {args.count / single:8.1f} email/s")
+
+    pool = SMTPConnectionPool(size=args.connections, idle_timeout=60, rate_per_second=0)
+    batches = [messages[start:start + args.batch_size] for start in range(0, len(messages), args.batch_size)]
+    started = time.perf_counter()
+    failures = 0
+    with ThreadPoolExecutor(max_workers=args.connections) as executor:
+        for results in executor.map(pool.send_batch, batches):
+            failures += sum(1 for error in results.values() if error is not None)
+    pooled = time.perf_counter() - started
+    pool.close()
+    print(f"pool ({args.connections} connessioni, gruppi da {args.batch_size}): {args.count / pooled:8.1f} email/s, {failures} errori")
+
+def archive_activities(args):
+    """Sposta le attività vecchie negli archivi mensili compressi e aggiorna i conteggi giornalieri"""
+    import app.models  # noqa: F401
+    import app.models.shipment  # noqa: F401
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.utils.activity_retention import archive_activities as run_archive
+
+    with SessionLocal() as db:
+        result = run_archive(
+            db,
+            settings.ACTIVITY_RETENTION_DAYS if args.retention_days is None else args.retention_days,
+            args.archive_dir or settings.ACTIVITY_ARCHIVE_DIR,
+            chunk_size=args.chunk_size,
+            dry_run=args.dry_run
+        )
+
+    print(f"Attività precedenti al {result['cutoff'][:10]}{' (dry run, nessuna modifica salvata)' if result['dry_run'] else ''}:")
+    print(f"  archiviate:          {result['archived']}")
+    print(f"  giorni aggregati:    {result['rolled_up_days']}")
+    for path in result["files"]:
+        print(f"  {path}")
+
+def benchmark_logging(args):
+    """Record di log al secondo con handler su file diretti e con la coda verso il listener"""
+    import queue
+    import tempfile
+    import time
+    from logging.handlers import QueueListener, RotatingFileHandler
+    from app.utils.logging import JsonFormatter, LogQueueHandler, orjson
+
+    def run(label, use_orjson, queued):
+        with tempfile.TemporaryDirectory() as directory:
+            file_handler = RotatingFileHandler(f"{directory}/benchmark.log", maxBytes=10485760, backupCount=3, encoding="utf8")
+            file_handler.setFormatter(JsonFormatter(use_orjson=use_orjson))
+            logger = logging.getLogger("benchmark")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            listener = None
+            if queued:
+                handler = LogQueueHandler(queue.Queue())
+                listener = QueueListener(handler.queue, file_handler)
+                listener.start()
+            else:
+                handler = file_handler
+            logger.handlers = [handler]
+
+            started = time.perf_counter()
+            for index in range(args.count):
+                logger.info("GET /api/products/designs - 200 - 0.0042s - 2 query (0.0011s)",
+                            extra={"db_queries": 2, "db_time": 0.0011, "request_index": index})
+            caller = time.perf_counter() - started
+            if listener is not None:
+                listener.stop()
+            total = time.perf_counter() - started
+            logger.handlers = []
+            file_handler.close()
+        print(f"{label:32s} chiamante: {args.count / caller:9.0f} record/s   scritti: {args.count / total:9.0f} record/s")
+
+    run("file diretto, json", False, False)
+    if orjson is not None:
+        run("file diretto, orjson", True, False)
+    run("coda + listener, json", False, True)
+    if orjson is not None:
+        run("coda + listener, orjson", True, True)
+
+def benchmark_middleware(args):
+    """Richieste al secondo su /api/health con il middleware ASGI e con un equivalente @app.middleware("http")"""
+    import asyncio
+    import time
+    from fastapi import FastAPI
+    from app.utils.query_stats import start_query_stats
+    from app.utils.security_middleware import SECURITY_HEADERS, SecurityMiddleware
+
+    # Stessa logica di SecurityMiddleware, nella forma dispatch(request, call_next)
+    async def http_middleware(request, call_next):
+        start_time = time.time()
+        query_stats = start_query_stats()
+        response = await call_next(request)
+        logging.getLogger("app.access").info(
+            f"{request.method} {request.url.path} - {response.status_code} - {time.time() - start_time:.4f}s "
+            f"- {query_stats.count} query ({query_stats.duration:.4f}s)"
+        )
+        query_stats.most_repeated()
+        response.headers["X-DB-Queries"] = str(query_stats.count)
+        for name, value in SECURITY_HEADERS:
+            response.headers[name.decode()] = value.decode()
+        return response
+
+    def build_app(middleware):
+        bench_app = FastAPI()
+
+        @bench_app.get("/api/health")
+        def health_check():
+            return {"status": "ok", "message": "Backend API is running"}
+
+        middleware(bench_app)
+        return bench_app
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/api/health", "raw_path": b"/api/health", "root_path": "",
+        "query_string": b"", "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 50000), "server": ("localhost", 8000),
+    }
+
+    async def request(bench_app):
+        # Come un client reale: il corpo una volta, poi la disconnessione solo a risposta finita
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        finished = asyncio.Event()
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished.set()
+
+        await bench_app(dict(scope), receive, send)
+
+    async def run(label, bench_app):
+        for _ in range(200):
+            await request(bench_app)
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            await request(bench_app)
+        elapsed = time.perf_counter() - started
+        print(f"{label:30s} {args.requests / elapsed:8.0f} richieste/s   {elapsed / args.requests * 1e6:7.1f} µs/richiesta")
+
+    # Il costo della scrittura dei log è lo stesso nei due casi e qui non interessa
+    logging.getLogger("app.access").disabled = True
+    asyncio.run(run("@app.middleware(\"http\")", build_app(lambda a: a.middleware("http")(http_middleware))))
+    asyncio.run(run("SecurityMiddleware (ASGI)", build_app(lambda a: a.add_middleware(SecurityMiddleware))))
+
+def worker(args):
+    """Processo worker per job, webhook, coda email e statistiche"""
+    import asyncio
+    from app.worker import run_worker
+
+    asyncio.run(run_worker(concurrency=args.concurrency))
+
+def _month(value: str) -> str:
+    try:
+        return datetime.strptime(value, "%Y-%m").strftime("%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError("formato atteso: YYYY-MM")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cookieflix", description="Comandi di gestione Cookieflix")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    bootstrap_parser = subparsers.add_parser(
+        "bootstrap",
+        help="Crea tabelle, colonne/indici mancanti e dati iniziali (prima installazione)"
+    )
+    bootstrap_parser.add_argument("--skip-create-tables", action="store_true", help="Non crea le tabelle mancanti")
+    bootstrap_parser.add_argument("--skip-migrate-schema", action="store_true", help="Non aggiunge colonne e indici mancanti")
+    bootstrap_parser.add_argument("--skip-seed", action="store_true", help="Non inserisce i dati iniziali")
+    bootstrap_parser.set_defaults(handler=bootstrap)
+
+    calibrate_parser = subparsers.add_parser(
+        "calibrate-bcrypt",
+        help="Misura bcrypt su questo hardware e suggerisce BCRYPT_ROUNDS"
+    )
+    calibrate_parser.add_argument("--target-ms", type=float, default=250, help="Latenza massima di una verifica (ms)")
+    calibrate_parser.add_argument("--max-rounds", type=int, default=16, help="Costo massimo da provare")
+    calibrate_parser.set_defaults(handler=calibrate_bcrypt)
+
+    boxes_parser = subparsers.add_parser(
+        "generate-boxes",
+        help="Genera le spedizioni del mese per gli abbonati attivi (rilanciabile: salta le box già create)"
+    )
+    boxes_parser.add_argument("--month", type=_month, default=datetime.utcnow().strftime("%Y-%m"), help="Mese delle box (YYYY-MM, default: mese corrente)")
+    boxes_parser.add_argument("--chunk-size", type=int, default=1000, help="Abbonati elaborati per transazione")
+    boxes_parser.add_argument("--dry-run", action="store_true", help="Calcola le box senza salvarle")
+    boxes_parser.set_defaults(handler=generate_boxes)
+
+    sink_parser = subparsers.add_parser(
+        "smtp-sink",
+        help="Avvia un server SMTP locale che scarta le email, per prove e benchmark (richiede aiosmtpd)"
+    )
+    sink_parser.add_argument("--host", default="127.0.0.1")
+    sink_parser.add_argument("--port", type=int, default=1025)
+    sink_parser.add_argument("--verbose", action="store_true", help="Stampa mittente e destinatari di ogni email")
+    sink_parser.set_defaults(handler=smtp_sink)
+
+    email_benchmark_parser = subparsers.add_parser(
+        "benchmark-email",
+        help="Misura l'invio di email verso il server configurato (es. smtp-sink)"
+    )
+    email_benchmark_parser.add_argument("--count", type=int, default=500, help="Email da inviare per ogni modalità")
+    email_benchmark_parser.add_argument("--connections", type=int, default=2, help="Connessioni del pool")
+    email_benchmark_parser.add_argument("--batch-size", type=int, default=20, help="Email per gruppo sulla stessa connessione")
+    email_benchmark_parser.set_defaults(handler=benchmark_email)
+
+    archive_parser = subparsers.add_parser(
+        "archive-activities",
+        help="Sposta le attività più vecchie di N giorni in archivi mensili .jsonl.gz"
+    )
+    archive_parser.add_argument("--retention-days", type=int, default=None, help="Giorni da tenere nella tabella (default: ACTIVITY_RETENTION_DAYS)")
+    archive_parser.add_argument("--archive-dir", default=None, help="Cartella degli archivi (default: ACTIVITY_ARCHIVE_DIR)")
+    archive_parser.add_argument("--chunk-size", type=int, default=5000, help="Attività archiviate per transazione")
+    archive_parser.add_argument("--dry-run", action="store_true", help="Conta le attività da archiviare senza spostarle")
+    archive_parser.set_defaults(handler=archive_activities)
+
+    logging_benchmark_parser = subparsers.add_parser(
+        "benchmark-logging",
+        help="Misura i record di log al secondo con e senza la coda verso il thread di scrittura"
+    )
+    logging_benchmark_parser.add_argument("--count", type=int, default=50000, help="Record da registrare per ogni modalità")
+    logging_benchmark_parser.set_defaults(handler=benchmark_logging)
+
+    middleware_benchmark_parser = subparsers.add_parser(
+        "benchmark-middleware",
+        help="Confronta le richieste al secondo su /api/health tra middleware ASGI e @app.middleware(\"http\")"
+    )
+    middleware_benchmark_parser.add_argument("--requests", type=int, default=20000, help="Richieste per ogni modalità")
+    middleware_benchmark_parser.set_defaults(handler=benchmark_middleware)
+
+    worker_parser = subparsers.add_parser(
+        "worker",
+        help="Esegue job, webhook, coda email e statistiche fuori dal processo web"
+    )
+    worker_parser.add_argument("--concurrency", type=int, default=None, help="Job eseguiti contemporaneamente (default: JOB_WORKERS)")
+    worker_parser.set_defaults(handler=worker)
+
+    return parser
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
@@ -13,15 +13,104 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./cookieflix.db")
+    # URL per l'engine async usato dai router (se vuoto viene derivato da DATABASE_URL)
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL", "")
+    
+    # Avvio: operazioni sul database eseguite dal lifespan di ogni worker.
+    # In produzione vanno disattivate (schema gestito da Alembic, seed con "python -m app bootstrap")
+    STARTUP_CREATE_TABLES: bool = os.getenv("STARTUP_CREATE_TABLES", "True") == "True"
+    STARTUP_MIGRATE_SCHEMA: bool = os.getenv("STARTUP_MIGRATE_SCHEMA", "True") == "True"
+    STARTUP_SEED_DATABASE: bool = os.getenv("STARTUP_SEED_DATABASE", "True") == "True"
+    
+    # Diagnostica query: avviso se una richiesta ripete la stessa query più di N volte (0 = disattivato)
+    SQL_REPEATED_QUERY_THRESHOLD: int = int(os.getenv("SQL_REPEATED_QUERY_THRESHOLD", "10"))
+    
+    # Logging: scritto su console e file da un thread dedicato tramite una coda
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Record in attesa oltre i quali si scartano (0 = illimitata)
+    LOG_USE_ORJSON: bool = os.getenv("LOG_USE_ORJSON", "True") == "True"  # Usato solo se installato
+    # Campionamento dei log INFO/DEBUG per logger, es. "app.access=0.1" (avvisi ed errori sempre registrati)
+    LOG_SAMPLE_RATES: str = os.getenv("LOG_SAMPLE_RATES", "")
+    
+    # Metriche Prometheus su /metrics, sommate tra i worker tramite un file SQLite condiviso
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "True") == "True"
+    METRICS_DB_PATH: str = os.getenv("METRICS_DB_PATH", "./metrics.db")
+    METRICS_FLUSH_SECONDS: float = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+    # Se impostato, /metrics richiede "Authorization: Bearer <token>"; se vuoto risponde solo a localhost
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
     
     # Sicurezza
     SECRET_KEY: str = os.getenv("SECRET_KEY", "supersecretkey")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "10080"))  # 7 giorni
+    # Access token a breve durata: i client lo rinnovano con il refresh token (POST /auth/refresh)
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+    REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+    
+    # Password: costo bcrypt (vedi "python -m app calibrate-bcrypt") e pool di processi per hash/verifica
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "0"))  # 0 = numero di core
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "0"))  # 0 = 4 per worker
+    
+    # Cache degli utenti autenticati (id, email, is_active, is_admin)
+    AUTH_USER_CACHE_SIZE: int = int(os.getenv("AUTH_USER_CACHE_SIZE", "10000"))
+    AUTH_USER_CACHE_TTL_SECONDS: int = int(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
+    
+    # Catalogo: ogni quanti secondi ogni worker controlla la versione (e i conteggi voti)
+    CATALOG_VERSION_CHECK_SECONDS: float = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "5"))
+    # Cache-Control delle risposte pubbliche del catalogo (proxy e browser)
+    CATALOG_CACHE_MAX_AGE: int = int(os.getenv("CATALOG_CACHE_MAX_AGE", "60"))
+    CATALOG_STALE_WHILE_REVALIDATE: int = int(os.getenv("CATALOG_STALE_WHILE_REVALIDATE", "300"))
+    
+    # Statistiche admin: aggiornate a ogni scrittura; ogni STATS_REFRESH_SECONDS un ricalcolo
+    # completo in background riallinea i contatori (0 = solo con il job refresh_stats)
+    STATS_REFRESH_SECONDS: int = int(os.getenv("STATS_REFRESH_SECONDS", "3600"))
+    
+    # Paginazione: oltre questo numero di righe il totale "approximate" non viene calcolato esattamente
+    PAGINATION_COUNT_CAP: int = int(os.getenv("PAGINATION_COUNT_CAP", "10000"))
+    
+    # Rate limiting: backend "memory" (per processo), "sqlite" (file condiviso) o "redis"
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "True") == "True"
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+    RATE_LIMIT_SQLITE_PATH: str = os.getenv("RATE_LIMIT_SQLITE_PATH", "./rate_limits.db")
+    RATE_LIMIT_REDIS_URL: str = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
     
     # Stripe
     STRIPE_API_KEY: str = os.getenv("STRIPE_API_KEY", "")
     STRIPE_WEBHOOK_SECRET: str = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+    # URL base dell'API (vuoto = api.stripe.com), utile per puntare a un server Stripe finto in locale
+    STRIPE_API_BASE: str = os.getenv("STRIPE_API_BASE", "")
+    STRIPE_TIMEOUT_SECONDS: float = float(os.getenv("STRIPE_TIMEOUT_SECONDS", "10"))
+    STRIPE_MAX_CONCURRENCY: int = int(os.getenv("STRIPE_MAX_CONCURRENCY", "8"))
+    
+    # Inbox webhook: elaborazione in background degli eventi Stripe (0 worker = nessuna elaborazione in questo processo)
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "2"))
+    WEBHOOK_POLL_INTERVAL_SECONDS: float = float(os.getenv("WEBHOOK_POLL_INTERVAL_SECONDS", "2"))
+    WEBHOOK_MAX_ATTEMPTS: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+    WEBHOOK_RETRY_BASE_SECONDS: float = float(os.getenv("WEBHOOK_RETRY_BASE_SECONDS", "5"))
+    
+    # Coda dei job in background (0 worker = nessuna esecuzione in questo processo)
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_POLL_INTERVAL_SECONDS: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+    JOB_RETRY_BASE_SECONDS: float = float(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))
+    # Un job "running" il cui locked_at non viene aggiornato da JOB_LOCK_TIMEOUT_SECONDS è
+    # considerato abbandonato (worker terminato) e rimesso in coda; il worker che lo esegue
+    # aggiorna locked_at ogni JOB_HEARTBEAT_SECONDS, che deve restare molto più piccolo
+    JOB_LOCK_TIMEOUT_SECONDS: float = float(os.getenv("JOB_LOCK_TIMEOUT_SECONDS", "900"))
+    JOB_HEARTBEAT_SECONDS: float = float(os.getenv("JOB_HEARTBEAT_SECONDS", "60"))
+    # False = webhook, email, statistiche e job non girano nei worker web ma in "python -m app worker"
+    WEB_RUNS_BACKGROUND_TASKS: bool = os.getenv("WEB_RUNS_BACKGROUND_TASKS", "True") == "True"
+    
+    # Registro attività: scritto in blocco ogni N attività o ogni intervallo
+    ACTIVITY_FLUSH_SIZE: int = int(os.getenv("ACTIVITY_FLUSH_SIZE", "200"))
+    ACTIVITY_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("ACTIVITY_FLUSH_INTERVAL_SECONDS", "2"))
+    ACTIVITY_BUFFER_SIZE: int = int(os.getenv("ACTIVITY_BUFFER_SIZE", "10000"))
+    ACTIVITY_ENQUEUE_TIMEOUT_SECONDS: float = float(os.getenv("ACTIVITY_ENQUEUE_TIMEOUT_SECONDS", "1"))
+    # Attività più vecchie di N giorni spostate negli archivi mensili (job archive_activities)
+    ACTIVITY_RETENTION_DAYS: int = int(os.getenv("ACTIVITY_RETENTION_DAYS", "90"))
+    ACTIVITY_ARCHIVE_DIR: str = os.getenv("ACTIVITY_ARCHIVE_DIR", "./archive/activities")
+    ACTIVITY_ARCHIVE_INTERVAL_HOURS: float = float(os.getenv("ACTIVITY_ARCHIVE_INTERVAL_HOURS", "24"))  # 0 = solo manuale
     
     # Frontend
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "../.env/FRONTEND_URL")
@@ -30,8 +119,21 @@ class Settings(BaseSettings):
     EMAIL_SERVER: str = os.getenv("EMAIL_SERVER", "smtp.gmail.com")
     EMAIL_PORT: int = int(os.getenv("EMAIL_PORT", "465"))
     EMAIL_SENDER: str = os.getenv("EMAIL_SENDER", "")
-    EMAIL_PASSWORD: str = os.getenv("EMAIL_PASSWORD", "")
+    EMAIL_PASSWORD: str = os.getenv("EMAIL_PASSWORD", "")  # Vuota = nessun login (es. server SMTP locale di test)
     ADMIN_EMAIL: str = os.getenv("ADMIN_EMAIL", "admin@cookieflix.com")
+    # SSL implicito (porta 465) oppure SMTP in chiaro con STARTTLS opzionale
+    EMAIL_USE_SSL: bool = os.getenv("EMAIL_USE_SSL", "True") == "True"
+    EMAIL_USE_STARTTLS: bool = os.getenv("EMAIL_USE_STARTTLS", "False") == "True"
+    EMAIL_TIMEOUT_SECONDS: float = float(os.getenv("EMAIL_TIMEOUT_SECONDS", "30"))
+    
+    # Coda email in uscita (0 connessioni = nessun invio da questo processo)
+    EMAIL_CONNECTIONS: int = int(os.getenv("EMAIL_CONNECTIONS", "2"))
+    EMAIL_BATCH_SIZE: int = int(os.getenv("EMAIL_BATCH_SIZE", "20"))  # Email inviate di fila sulla stessa connessione
+    EMAIL_RATE_PER_SECOND: float = float(os.getenv("EMAIL_RATE_PER_SECOND", "10"))  # 0 = nessun limite
+    EMAIL_IDLE_TIMEOUT_SECONDS: float = float(os.getenv("EMAIL_IDLE_TIMEOUT_SECONDS", "60"))
+    EMAIL_POLL_INTERVAL_SECONDS: float = float(os.getenv("EMAIL_POLL_INTERVAL_SECONDS", "5"))
+    EMAIL_MAX_ATTEMPTS: int = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+    EMAIL_RETRY_BASE_SECONDS: float = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
 
     print(f"FRONTEND_URL: {FRONTEND_URL}")
     
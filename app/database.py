@@ -1,8 +1,11 @@
 # app/database.py
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.utils.query_stats import install_query_hooks
+from app.utils.metrics import install_pool_metrics
 import logging
 
 # Configurazione logging
@@ -13,18 +16,52 @@ logger = logging.getLogger(__name__)
 logger.info(f"Connecting to database: {settings.DATABASE_URL}")
 connect_args = {"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
 
+# Engine sync: usato da script (seed.py, update_plans.py) e dall'avvio dell'app
 engine = create_engine(
-    settings.DATABASE_URL, 
+    settings.DATABASE_URL,
     connect_args=connect_args,
     pool_pre_ping=True  # Verifica connessione prima dell'utilizzo
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+install_query_hooks(engine)
+install_pool_metrics(engine, "sync")
 Base = declarative_base()
 
+def get_async_database_url(database_url: str) -> str:
+    """Converte l'URL del database nell'equivalente con driver async"""
+    if database_url.startswith("sqlite:"):
+        return database_url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if database_url.startswith("postgresql:"):
+        return database_url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    if database_url.startswith("postgres:"):
+        return database_url.replace("postgres:", "postgresql+asyncpg:", 1)
+    return database_url
+
+# Engine async: usato dai router, non blocca l'event loop durante le query
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or get_async_database_url(settings.DATABASE_URL),
+    pool_pre_ping=True
+)
+# expire_on_commit=False: gli oggetti restano leggibili dopo il commit senza
+# lazy load impliciti (non consentiti con AsyncSession)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+install_query_hooks(async_engine.sync_engine)
+install_pool_metrics(async_engine.sync_engine, "async")
+
 # Dependency per ottenere la sessione DB
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependency per ottenere la sessione DB async
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
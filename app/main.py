@@ -4,38 +4,69 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import hmac
 import logging
 import time
 import os
 from datetime import datetime
 
 from app.config import settings
-from app.database import engine, Base, SessionLocal
+from app.database import async_engine
 from app.routers import auth, users, products, subscriptions, webhooks, shipments, admin
-from app.seed import seed_database
-from app.utils.logging import setup_logging
-from app.utils.db_migrations import add_missing_columns
+from app.bootstrap import bootstrap_database
+from app.utils.logging import parse_sample_rates, setup_logging
+from app.utils.security_middleware import SecurityMiddleware
+from app.utils.stripe_gateway import stripe_gateway
+from app.utils.password_hasher import password_hasher
+from app.utils.rate_limit import rate_limit_backend
+from app.utils.activity import activity_writer
+from app.utils.metrics import is_local_request, metrics_store
+from app.worker import start_background_tasks, stop_background_tasks
 from app.models import User, Activity, SubscriptionPlan, Subscription, Category, Design, Vote
 
-# Crea tabelle del database
-Base.metadata.create_all(bind=engine)
-
-# Aggiungi colonne mancanti se necessario
-add_missing_columns(engine)
-
-# Seed database
-with SessionLocal() as db:
-    seed_database(db)
-
 # Configurazione logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+logger = setup_logging(
+    app_name="cookieflix",
+    log_level=settings.LOG_LEVEL,
+    queue_size=settings.LOG_QUEUE_SIZE,
+    sample_rates=parse_sample_rates(settings.LOG_SAMPLE_RATES),
+    use_orjson=settings.LOG_USE_ORJSON
 )
-logger = setup_logging(app_name="cookieflix", log_level=logging.INFO)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Avvio e arresto dell'applicazione"""
+    # Preparazione database, disattivabile dalle impostazioni STARTUP_*
+    if settings.STARTUP_CREATE_TABLES or settings.STARTUP_MIGRATE_SCHEMA or settings.STARTUP_SEED_DATABASE:
+        await run_in_threadpool(
+            bootstrap_database,
+            create_tables=settings.STARTUP_CREATE_TABLES,
+            migrate_schema=settings.STARTUP_MIGRATE_SCHEMA,
+            seed=settings.STARTUP_SEED_DATABASE
+        )
+    
+    activity_writer.start()
+    if settings.METRICS_ENABLED:
+        metrics_store.start()
+    # Job, webhook, email e statistiche: qui oppure nel processo "python -m app worker"
+    if settings.WEB_RUNS_BACKGROUND_TASKS:
+        start_background_tasks()
+    
+    yield
+    
+    await stop_background_tasks()
+    await activity_writer.stop()
+    await metrics_store.stop()
+    stripe_gateway.shutdown()
+    password_hasher.shutdown()
+    rate_limit_backend.close()
+    await async_engine.dispose()
 
 # Inizializzazione app
 app = FastAPI(
+    lifespan=lifespan,
     title=settings.PROJECT_NAME,
     description="API per il servizio di abbonamento Cookieflix",
     version="0.1.0",
@@ -58,6 +89,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 @app.get("/api")
@@ -68,23 +100,22 @@ def read_api_root():
 def health_check():
     return {"status": "ok", "message": "Backend API is running"}
 
-# Middleware per logging e sicurezza
-@app.middleware("http")
-async def unified_security_middleware(request: Request, call_next):
-    # Logging
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    logger.info(f"{request.method} {request.url.path} - {response.status_code} - {process_time:.4f}s")
-    
-    # Security headers
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; img-src 'self' data:;"
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-    response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-    
-    return response
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Metriche di tutti i worker in formato Prometheus"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metriche disattivate")
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}".encode()
+        if not hmac.compare_digest(request.headers.get("authorization", "").encode(), expected):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token delle metriche non valido")
+    elif not is_local_request(request.client.host if request.client else None, request.headers):
+        # Nessun token configurato: le metriche non sono esposte fuori da localhost
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return Response(content=await metrics_store.collect(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Middleware per logging e sicurezza (ASGI puro; aggiunto dopo CORS, quindi è il più esterno)
+app.add_middleware(SecurityMiddleware)
 
 
 # Registrazione routers
@@ -1,10 +1,15 @@
 # app/models/__init__.py
 # Questo file garantisce che tutti i modelli vengano importati nell'ordine corretto
 
-from app.models.activity import Activity
+from app.models.activity import Activity, ActivityDailyCount
 from app.models.user import User
 from app.models.subscription import SubscriptionPlan, Subscription
 from app.models.product import Category, Design, Vote
+from app.models.webhook_event import WebhookEvent
+from app.models.catalog import CatalogVersion
+from app.models.stats_snapshot import StatsSnapshot, StatsCounter
+from app.models.outbound_email import OutboundEmail
+from app.models.job import Job
 
 # Configura le relazioni dopo che tutte le classi sono definite
 from sqlalchemy.orm import relationship
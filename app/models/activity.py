@@ -1,5 +1,5 @@
 # app/models/activity.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -7,6 +7,11 @@ from app.database import Base
 
 class Activity(Base):
     __tablename__ = "activities"
+    __table_args__ = (
+        Index("ix_activities_user_id_created_at", "user_id", "created_at"),
+        Index("ix_activities_type_created_at", "type", "created_at"),
+        Index("ix_activities_created_at", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -18,4 +23,12 @@ class Activity(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relazioni
-    user = relationship("User", back_populates="activities")
\ No newline at end of file
+    user = relationship("User", back_populates="activities")
+
+class ActivityDailyCount(Base):
+    """Numero di attività per giorno e tipo: resta anche dopo l'archiviazione delle attività"""
+    __tablename__ = "activity_daily_counts"
+    
+    day = Column(Date, primary_key=True)
+    type = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,13 @@
+# app/models/catalog.py
+from sqlalchemy import Column, Integer, DateTime
+from datetime import datetime
+
+from app.database import Base
+
+class CatalogVersion(Base):
+    """Riga unica (id=1) incrementata a ogni modifica di piani, categorie o design"""
+    __tablename__ = "catalog_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, default=1, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,28 @@
+# app/models/job.py
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from datetime import datetime
+
+from app.database import Base
+
+class Job(Base):
+    """Lavoro in background persistente, eseguito da job_worker_pool (anche in un processo separato)"""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+        Index("ix_jobs_locked_by", "locked_by"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)  # Nome del gestore registrato con @job
+    payload = Column(Text)  # Argomenti serializzati in JSON
+    status = Column(String, default="queued")  # queued, running, succeeded, dead
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_at = Column(DateTime, default=datetime.utcnow)  # Prima esecuzione o prossimo tentativo
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # Risultato serializzato in JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
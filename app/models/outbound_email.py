@@ -0,0 +1,27 @@
+# app/models/outbound_email.py
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from datetime import datetime
+
+from app.database import Base
+
+class OutboundEmail(Base):
+    """Email in uscita: accodata dalle richieste, inviata in background da email_outbox"""
+    __tablename__ = "outbound_emails"
+    __table_args__ = (
+        Index("ix_outbound_emails_status_next_attempt_at", "status", "next_attempt_at"),
+        Index("ix_outbound_emails_locked_by", "locked_by"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    recipient = Column(String)
+    subject = Column(String)
+    body = Column(Text)
+    html_body = Column(Text, nullable=True)
+    status = Column(String, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    locked_by = Column(String, nullable=True)  # Identificativo del ciclo di invio che l'ha presa in carico
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
@@ -1,5 +1,5 @@
 # app/models/product.py
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Table, Text
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Table, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -20,6 +20,9 @@ class Category(Base):
 
 class Design(Base):
     __tablename__ = "designs"
+    __table_args__ = (
+        Index("ix_designs_category_id_is_active", "category_id", "is_active"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
@@ -29,6 +32,8 @@ class Design(Base):
     model_url = Column(String, nullable=True)  # Per il modello 3D
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    # Contatore denormalizzato, aggiornato da vote_for_design nella stessa transazione
+    votes_count = Column(Integer, default=0, server_default="0", nullable=False)
     
     # Relazioni
     category = relationship("Category", back_populates="designs")
@@ -36,6 +41,12 @@ class Design(Base):
 
 class Vote(Base):
     __tablename__ = "votes"
+    __table_args__ = (
+        # Un solo voto per utente e design, garantito dal database
+        Index("uq_votes_user_id_design_id", "user_id", "design_id", unique=True),
+        Index("ix_votes_design_id", "design_id"),
+        Index("ix_votes_user_id_created_at", "user_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -1,5 +1,5 @@
 # app/models/shipment.py
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -7,6 +7,11 @@ from app.database import Base
 
 class Shipment(Base):
     __tablename__ = "shipments"
+    __table_args__ = (
+        Index("ix_shipments_user_id_created_at", "user_id", "created_at"),
+        # Una sola box generata per utente e mese (rende il batch ripetibile)
+        Index("uq_shipments_user_id_box_month", "user_id", "box_month", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -16,6 +21,7 @@ class Shipment(Base):
     estimated_delivery_date = Column(DateTime, nullable=True)
     delivered_date = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    box_month = Column(String, nullable=True)  # "YYYY-MM" per le box generate dal batch mensile
     
     # Relazioni
     user = relationship("User", back_populates="shipments")
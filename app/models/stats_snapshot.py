@@ -0,0 +1,24 @@
+# app/models/stats_snapshot.py
+from sqlalchemy import Column, Integer, String, DateTime, Text
+from datetime import datetime
+
+from app.database import Base
+
+class StatsSnapshot(Base):
+    """Ultimo risultato calcolato di una statistica della dashboard admin"""
+    __tablename__ = "stats_snapshots"
+    
+    name = Column(String, primary_key=True)  # es. "users", "subscriptions"
+    payload = Column(Text)  # Statistiche serializzate in JSON
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+class StatsCounter(Base):
+    """
+    Contatore di una statistica (es. "users"/"active"), aggiornato a ogni
+    modifica di utenti e abbonamenti e riallineato dal ricalcolo completo
+    """
+    __tablename__ = "stats_counters"
+    
+    name = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)  # es. "total", "by_period.monthly"
+    value = Column(Integer, nullable=False, default=0)
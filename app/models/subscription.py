@@ -1,5 +1,5 @@
 # app/models/subscription.py
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Float
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime, timedelta
 
@@ -27,6 +27,10 @@ class SubscriptionPlan(Base):
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        Index("ix_subscriptions_user_id_is_active", "user_id", "is_active"),
+        Index("ix_subscriptions_stripe_subscription_id", "stripe_subscription_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
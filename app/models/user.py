@@ -1,5 +1,5 @@
 # app/models/user.py
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Float, Table
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Float, Table, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -16,6 +16,10 @@ user_category_preference = Table(
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Utenti recenti nelle statistiche admin: scansione solo delle iscrizioni recenti
+        Index("ix_users_created_at", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
@@ -0,0 +1,26 @@
+# app/models/webhook_event.py
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
+from datetime import datetime
+
+from app.database import Base
+
+class WebhookEvent(Base):
+    __tablename__ = "webhook_events"
+    __table_args__ = (
+        Index("ix_webhook_events_status_next_attempt_at", "status", "next_attempt_at"),
+        Index("ix_webhook_events_ordering_key_status", "ordering_key", "status"),
+    )
+    
+    id = Column(String, primary_key=True)  # event.id di Stripe: le consegne ripetute vengono scartate
+    type = Column(String)
+    payload = Column(Text)  # Evento Stripe serializzato in JSON
+    # Eventi con la stessa chiave (es. ID abbonamento Stripe) vengono elaborati in ordine
+    ordering_key = Column(String)
+    stripe_created = Column(Integer)  # Timestamp di creazione dell'evento su Stripe
+    status = Column(String, default="pending")  # pending, processing, processed, failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
@@ -0,0 +1,38 @@
+# app/reconcile_votes.py
+from sqlalchemy import func, select, update
+import logging
+
+from app.database import SessionLocal
+from app.models import Design, Vote
+
+logger = logging.getLogger(__name__)
+
+def reconcile_vote_counts(db):
+    """Ricalcola designs.votes_count dalla tabella votes con un unico UPDATE"""
+    votes_subquery = select(func.count(Vote.id))\
+        .where(Vote.design_id == Design.id)\
+        .scalar_subquery()
+
+    result = db.execute(
+        update(Design)
+        .values(votes_count=votes_subquery)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+def reconcile_designs_votes():
+    db = SessionLocal()
+    try:
+        logger.info("Ricalcolo dei contatori voti dei design...")
+        updated = reconcile_vote_counts(db)
+        logger.info(f"Contatori voti ricalcolati per {updated} design")
+    except Exception as e:
+        logger.error(f"Errore durante il ricalcolo dei contatori voti: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    reconcile_designs_votes()
@@ -1,16 +1,25 @@
 # app/routers/admin.py
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Date, func, select
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 
-from app.database import get_db
+from app.database import get_async_db
 from app.config import settings
 from app.models.user import User
 from app.models.subscription import Subscription, SubscriptionPlan
 from app.models.product import Category, Design, Vote
+from app.models.job import Job
+from app.models.activity import Activity, ActivityDailyCount
+from app.schemas import job as job_schemas
+from app.schemas import activity as activity_schemas
 from app.utils.auth import get_current_admin_user
+from app.utils.user_cache import AuthenticatedUser
+from app.utils.stripe_gateway import stripe_gateway
+from app.utils.pagination import fetch_page, count_rows
+from app.utils.admin_stats import get_stats
+from app.utils.jobs import enqueue_job, job_handlers, job_worker_pool
 
 import logging
 
@@ -24,7 +33,7 @@ logger = logging.getLogger(__name__)
 
 # Endpoint di health check
 @router.get("/health")
-async def health_check(current_user: User = Depends(get_current_admin_user)):
+async def health_check(current_user: AuthenticatedUser = Depends(get_current_admin_user)):
     """Verifica lo stato del server admin"""
     return {
         "status": "ok",
@@ -39,139 +48,98 @@ async def health_check(current_user: User = Depends(get_current_admin_user)):
 
 # Statistiche utenti
 @router.get("/users/stats")
-async def get_users_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_admin_user)):
-    """Ottiene statistiche sugli utenti"""
-    total_users = db.query(func.count(User.id)).scalar()
-    active_users = db.query(func.count(User.id)).filter(User.is_active == True).scalar()
-    inactive_users = db.query(func.count(User.id)).filter(User.is_active == False).scalar()
-    admin_users = db.query(func.count(User.id)).filter(User.is_admin == True).scalar()
-    recent_users = db.query(func.count(User.id)).filter(User.created_at >= datetime.utcnow() - timedelta(days=30)).scalar()
-    
-    return {
-        "total": total_users,
-        "active": active_users,
-        "inactive": inactive_users,
-        "admins": admin_users,
-        "recent": recent_users
-    }
+async def get_users_stats(
+    fresh: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)
+):
+    """Ottiene statistiche sugli utenti (contatori incrementali; fresh=true accoda anche un ricalcolo completo)"""
+    return await get_stats(db, "users", fresh)
 
 # Statistiche abbonamenti
 @router.get("/subscriptions/stats")
-async def get_subscriptions_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_admin_user)):
-    """Ottiene statistiche sugli abbonamenti"""
-    total_subscriptions = db.query(func.count(Subscription.id)).scalar()
-    active_subscriptions = db.query(func.count(Subscription.id)).filter(Subscription.is_active == True).scalar()
-    
-    monthly = db.query(func.count(Subscription.id)).filter(
-        Subscription.is_active == True, 
-        Subscription.billing_period == "monthly"
-    ).scalar()
-    
-    quarterly = db.query(func.count(Subscription.id)).filter(
-        Subscription.is_active == True, 
-        Subscription.billing_period == "quarterly"
-    ).scalar()
-    
-    semiannual = db.query(func.count(Subscription.id)).filter(
-        Subscription.is_active == True, 
-        Subscription.billing_period == "semiannual"
-    ).scalar()
-    
-    annual = db.query(func.count(Subscription.id)).filter(
-        Subscription.is_active == True, 
-        Subscription.billing_period == "annual"
-    ).scalar()
-    
-    return {
-        "total": total_subscriptions,
-        "active": active_subscriptions,
-        "by_period": {
-            "monthly": monthly,
-            "quarterly": quarterly,
-            "semiannual": semiannual,
-            "annual": annual
-        }
-    }
+async def get_subscriptions_stats(
+    fresh: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)
+):
+    """Ottiene statistiche sugli abbonamenti (contatori incrementali; fresh=true accoda anche un ricalcolo completo)"""
+    return await get_stats(db, "subscriptions", fresh)
 
 @router.get("/categories", dependencies=admin_dependency)
 async def get_admin_categories(
     skip: int = 0, 
     limit: int = 100,
+    cursor: Optional[str] = None,
+    count: str = Query("approximate", regex="^(none|approximate|exact)$"),
     search: Optional[str] = None,
     is_active: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Ottiene le categorie con filtri avanzati"""
-    query = db.query(Category)
+    """Ottiene le categorie con filtri avanzati (paginazione con skip o con next_cursor)"""
+    query = select(Category)
     
     # Applica filtri
     if search:
-        query = query.filter(Category.name.ilike(f"%{search}%"))
+        query = query.where(Category.name.ilike(f"%{search}%"))
     if is_active is not None:
-        query = query.filter(Category.is_active == is_active)
-    
-    # Conta il totale prima di applicare skip/limit
-    total = query.count()
+        query = query.where(Category.is_active == is_active)
     
-    # Applica paginazione
-    query = query.offset(skip).limit(limit)
+    total, total_is_exact = await count_rows(db, query, count)
+    categories, next_cursor = await fetch_page(db, query, (Category.id,), limit, cursor, skip)
     
-    categories = query.all()
-    
-    # Aggiungi conteggio design per ogni categoria
+    # Conteggio design delle categorie della pagina, in una sola query
+    design_counts = dict((await db.execute(
+        select(Design.category_id, func.count(Design.id))
+        .where(Design.category_id.in_([category.id for category in categories]))
+        .group_by(Design.category_id)
+    )).all()) if categories else {}
     for category in categories:
-        design_count = db.query(func.count(Design.id)).filter(
-            Design.category_id == category.id
-        ).scalar()
-        setattr(category, 'design_count', design_count)
+        setattr(category, 'design_count', design_counts.get(category.id, 0))
     
     return {
         "items": categories,
         "total": total,
+        "total_is_exact": total_is_exact,
         "skip": skip,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": next_cursor
     }
 
 @router.get("/designs", dependencies=admin_dependency)
 async def get_admin_designs(
     skip: int = 0, 
     limit: int = 100,
+    cursor: Optional[str] = None,
+    count: str = Query("approximate", regex="^(none|approximate|exact)$"),
     search: Optional[str] = None,
     category_id: Optional[int] = None,
     is_active: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Ottiene i design con filtri avanzati"""
-    query = db.query(Design)
+    """Ottiene i design con filtri avanzati (paginazione con skip o con next_cursor)"""
+    query = select(Design)
     
     # Applica filtri
     if search:
-        query = query.filter(Design.name.ilike(f"%{search}%"))
+        query = query.where(Design.name.ilike(f"%{search}%"))
     if category_id:
-        query = query.filter(Design.category_id == category_id)
+        query = query.where(Design.category_id == category_id)
     if is_active is not None:
-        query = query.filter(Design.is_active == is_active)
-    
-    # Conta il totale prima di applicare skip/limit
-    total = query.count()
+        query = query.where(Design.is_active == is_active)
     
-    # Applica paginazione
-    query = query.offset(skip).limit(limit)
+    total, total_is_exact = await count_rows(db, query, count)
     
-    designs = query.all()
-    
-    # Aggiungi conteggio voti per ogni design
-    for design in designs:
-        votes_count = db.query(func.count(Vote.id)).filter(
-            Vote.design_id == design.id
-        ).scalar()
-        setattr(design, 'votes_count', votes_count)
+    # Il conteggio voti è già presente in Design.votes_count
+    designs, next_cursor = await fetch_page(db, query, (Design.id,), limit, cursor, skip)
     
     return {
         "items": designs,
         "total": total,
+        "total_is_exact": total_is_exact,
         "skip": skip,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": next_cursor
     }
 
 @router.get("/system-info", dependencies=admin_dependency)
@@ -187,6 +155,178 @@ async def get_system_info():
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@router.get("/payments/metrics")
+async def get_payments_metrics(current_user: AuthenticatedUser = Depends(get_current_admin_user)):
+    """Latenze ed errori delle chiamate a Stripe del worker corrente"""
+    return {
+        "max_concurrency": stripe_gateway.max_workers,
+        "timeout_seconds": stripe_gateway.timeout,
+        "operations": stripe_gateway.metrics.snapshot()
+    }
+
+# Registro attività
+@router.get("/users/{user_id}/activity")
+async def get_user_activity(
+    user_id: int,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    activity_type: Optional[str] = Query(None, alias="type"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)
+):
+    """Attività recenti di un utente, dalla più recente (le più vecchie sono negli archivi)"""
+    query = select(Activity).where(Activity.user_id == user_id)
+    if activity_type:
+        query = query.where(Activity.type == activity_type)
+    
+    activities, next_cursor = await fetch_page(
+        db, query, (Activity.created_at, Activity.id), limit, cursor, descending=True
+    )
+    return {
+        "items": [activity_schemas.Activity.from_orm(activity) for activity in activities],
+        "limit": limit,
+        "next_cursor": next_cursor
+    }
+
+@router.get("/activity/daily")
+async def get_activity_daily_counts(
+    days: int = Query(30, ge=1, le=366),
+    activity_type: Optional[str] = Query(None, alias="type"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)
+):
+    """Attività per giorno e tipo: giorni già aggregati da activity_daily_counts, i successivi dalla tabella activities"""
+    first_day = datetime.utcnow().date() - timedelta(days=days - 1)
+    last_rolled_day = await db.scalar(select(func.max(ActivityDailyCount.day)))
+    live_from = max(first_day, last_rolled_day + timedelta(days=1)) if last_rolled_day else first_day
+    
+    query = select(ActivityDailyCount).where(ActivityDailyCount.day >= first_day, ActivityDailyCount.day < live_from)
+    if activity_type:
+        query = query.where(ActivityDailyCount.type == activity_type)
+    counts = [
+        activity_schemas.ActivityDailyCount.from_orm(row)
+        for row in (await db.scalars(query.order_by(ActivityDailyCount.day, ActivityDailyCount.type))).all()
+    ]
+    
+    # Giorni non ancora aggregati (almeno quello in corso)
+    day = func.date(Activity.created_at, type_=Date)
+    live_query = (
+        select(day, Activity.type, func.count(Activity.id))
+        .where(Activity.created_at >= datetime.combine(live_from, time.min))
+        .group_by(day, Activity.type)
+        .order_by(day, Activity.type)
+    )
+    if activity_type:
+        live_query = live_query.where(Activity.type == activity_type)
+    counts.extend(
+        activity_schemas.ActivityDailyCount(day=row_day, type=row_type or "unknown", count=count)
+        for row_day, row_type, count in (await db.execute(live_query)).all()
+    )
+    
+    return {"days": days, "items": counts}
+
+# Coda dei job in background
+@router.get("/jobs")
+async def get_jobs(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status", regex="^(queued|running|succeeded|dead)$"),
+    name: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)
+):
+    """Job in coda, in esecuzione o terminati, dal più recente (paginazione con next_cursor)"""
+    query = select(Job)
+    if status_filter:
+        query = query.where(Job.status == status_filter)
+    if name:
+        query = query.where(Job.name == name)
+    
+    jobs, next_cursor = await fetch_page(db, query, (Job.id,), limit, cursor, descending=True)
+    return {
+        "items": [job_schemas.Job.from_orm(job) for job in jobs],
+        "limit": limit,
+        "next_cursor": next_cursor
+    }
+
+@router.get("/jobs/stats")
+async def get_jobs_stats(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)
+):
+    """Numero di job per stato e per tipo"""
+    rows = (await db.execute(
+        select(Job.name, Job.status, func.count(Job.id)).group_by(Job.name, Job.status)
+    )).all()
+    
+    by_status = {"queued": 0, "running": 0, "succeeded": 0, "dead": 0}
+    by_name: Dict[str, Dict[str, int]] = {}
+    for name, job_status, count in rows:
+        by_status[job_status] = by_status.get(job_status, 0) + count
+        by_name.setdefault(name, {})[job_status] = count
+    
+    return {
+        "by_status": by_status,
+        "by_name": by_name,
+        "available": sorted(job_handlers)
+    }
+
+@router.get("/jobs/{job_id}", response_model=job_schemas.Job)
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)
+):
+    """Dettaglio di un job"""
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job non trovato"
+        )
+    return job
+
+@router.post("/jobs", response_model=job_schemas.Job, status_code=status.HTTP_201_CREATED)
+async def create_job(
+    job_data: job_schemas.JobCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)
+):
+    """Accoda un job (es. generate_monthly_boxes, refresh_stats)"""
+    if job_data.name not in job_handlers:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Job sconosciuto. Disponibili: {', '.join(sorted(job_handlers))}"
+        )
+    return await enqueue_job(db, job_data.name, job_data.payload, run_at=job_data.run_at)
+
+@router.post("/jobs/{job_id}/retry", response_model=job_schemas.Job)
+async def retry_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)
+):
+    """Rimette in coda un job fallito definitivamente (dead), azzerando i tentativi"""
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job non trovato"
+        )
+    if job.status != "dead":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Solo i job falliti definitivamente possono essere ritentati"
+        )
+    
+    job.status = "queued"
+    job.attempts = 0
+    job.run_at = datetime.utcnow()
+    job.finished_at = None
+    await db.commit()
+    job_worker_pool.notify()
+    return job
+
 # Endpoint pubblico per health check (senza autenticazione)
 @router.get("/public-health")
 async def public_health_check():
@@ -1,18 +1,25 @@
 # app/routers/auth.py
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta, datetime
+from typing import Optional
+from jose import JWTError
 
 from app.schemas import user as schemas
 from app.models.user import User
 from app.utils.auth import (
-    verify_password, get_password_hash, create_access_token,
-    get_current_active_user
+    create_access_token, create_token_pair, decode_token,
+    get_current_user_model, get_current_user_optional
 )
+from app.utils.user_cache import AuthenticatedUser, auth_user_cache
+from app.utils.password_hasher import password_hasher
 from app.utils.csrf import generate_csrf_token
-from app.database import get_db
+from app.utils.activity import log_activity
+from app.utils.rate_limit import login_limiter, register_limiter
+from app.database import get_async_db
 from app.config import settings
 
 # Configurazione logger
@@ -20,10 +27,10 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix=f"{settings.API_PREFIX}/auth", tags=["Authentication"])
 
-@router.post("/register", response_model=schemas.User)
-async def register(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
+@router.post("/register", response_model=schemas.User, dependencies=[Depends(register_limiter)])
+async def register(user_data: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Verifica se l'utente esiste già
-    db_user = db.query(User).filter(User.email == user_data.email).first()
+    db_user = await db.scalar(select(User).where(User.email == user_data.email))
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -31,7 +38,7 @@ async def register(user_data: schemas.UserCreate, db: Session = Depends(get_db))
         )
     
     # Crea il nuovo utente
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     db_user = User(
         email=user_data.email,
         hashed_password=hashed_password,
@@ -40,18 +47,19 @@ async def register(user_data: schemas.UserCreate, db: Session = Depends(get_db))
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return db_user
 
-@router.post("/token", response_model=schemas.Token)
+@router.post("/token", response_model=schemas.Token, dependencies=[Depends(login_limiter)])
 async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Verifica credenziali
-    user = db.query(User).filter(User.email == form_data.username).first()
+    user = await db.scalar(select(User).where(User.email == form_data.username))
     
     # Verifica se l'account è bloccato
     if user and user.account_locked_until and user.account_locked_until > datetime.utcnow():
@@ -62,7 +70,7 @@ async def login(
         )
     
     # Verifica credenziali
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await password_hasher.verify(form_data.password, user.hashed_password):
         # Gestione tentativi falliti
         if user:
             user.failed_login_attempts += 1
@@ -72,7 +80,8 @@ async def login(
                 user.account_locked_until = datetime.utcnow() + timedelta(minutes=15)
                 logger.warning(f"Account bloccato per {user.email} dopo 5 tentativi falliti")
             
-            db.commit()
+            await db.commit()
+            await log_activity("login_failed", "Tentativo di accesso fallito", user_id=user.id, request=request)
         
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -84,21 +93,18 @@ async def login(
     if user.failed_login_attempts > 0:
         user.failed_login_attempts = 0
         user.account_locked_until = None
-        db.commit()
+        await db.commit()
     
-    # Genera token
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(user.id)},
-        expires_delta=access_token_expires
-    )
+    await log_activity("login", "Accesso effettuato", user_id=user.id, request=request)
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Genera token (i claim vengono dall'utente già caricato)
+    return create_token_pair(user)
 
-@router.post("/admin-login", response_model=schemas.Token)
+@router.post("/admin-login", response_model=schemas.Token, dependencies=[Depends(login_limiter)])
 async def admin_login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Endpoint per login amministratore"""
     import logging
@@ -107,7 +113,7 @@ async def admin_login(
     logger.info(f"Tentativo di login admin per: {form_data.username}")
     
     # Verifica credenziali
-    user = db.query(User).filter(User.email == form_data.username).first()
+    user = await db.scalar(select(User).where(User.email == form_data.username))
     
     if not user:
         logger.warning(f"Tentativo di login admin fallito: utente {form_data.username} non trovato")
@@ -118,10 +124,11 @@ async def admin_login(
         )
     
     # Verifica password
-    if not verify_password(form_data.password, user.hashed_password):
+    if not await password_hasher.verify(form_data.password, user.hashed_password):
         # Gestione tentativi falliti
         user.failed_login_attempts += 1
-        db.commit()
+        await db.commit()
+        await log_activity("login_failed", "Tentativo di accesso admin fallito", user_id=user.id, request=request)
         
         logger.warning(f"Tentativo di login admin fallito: password non valida per {user.email}")
         raise HTTPException(
@@ -144,33 +151,53 @@ async def admin_login(
     if user.failed_login_attempts > 0:
         user.failed_login_attempts = 0
         user.account_locked_until = None
-        db.commit()
+        await db.commit()
     
-    # Genera token INCLUDENDO esplicitamente is_admin=True
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(user.id), "is_admin": True},
-        expires_delta=access_token_expires
-    )
+    await log_activity("login", "Accesso admin effettuato", user_id=user.id, request=request)
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Genera token (is_admin=True, verificato sopra)
+    return create_token_pair(user)
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh_access_token(
+    refresh_data: schemas.RefreshTokenRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Emette una nuova coppia di token a partire da un refresh token valido"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Refresh token non valido",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = decode_token(refresh_data.refresh_token, token_type="refresh")
+        user_id = int(payload["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        raise credentials_exception
+    
+    # Unico accesso al database: stato e permessi aggiornati dell'utente
+    user = await db.get(User, user_id)
+    if user is None or not user.is_active:
+        raise credentials_exception
+    
+    return create_token_pair(user)
 
 @router.get("/me", response_model=schemas.User)
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
+async def read_users_me(current_user: User = Depends(get_current_user_model)):
     return current_user
 
 @router.get("/csrf-token")
-async def get_csrf_token():
-    """Genera un nuovo token CSRF"""
-    token = generate_csrf_token()
+async def get_csrf_token(current_user: Optional[AuthenticatedUser] = Depends(get_current_user_optional)):
+    """Genera un nuovo token CSRF, legato all'utente se autenticato"""
+    token = generate_csrf_token(current_user.id if current_user else None)
     return {"csrf_token": token}
 
 # Endpoint temporaneo per il debug
 @router.get("/debug/admin-token")
-async def get_admin_token(db: Session = Depends(get_db)):
+async def get_admin_token(db: AsyncSession = Depends(get_async_db)):
     """Endpoint temporaneo per debugging - RIMUOVERE IN PRODUZIONE"""
     # Troviamo l'utente admin
-    admin_user = db.query(User).filter(User.email == "admin@cookieflix.com").first()
+    admin_user = await db.scalar(select(User).where(User.email == "admin@cookieflix.com"))
     
     if not admin_user:
         raise HTTPException(status_code=404, detail="Utente admin non trovato")
@@ -178,8 +205,9 @@ async def get_admin_token(db: Session = Depends(get_db)):
     # Assicuriamoci che sia admin
     if not admin_user.is_admin:
         admin_user.is_admin = True
-        db.commit()
-        db.refresh(admin_user)
+        await db.commit()
+        auth_user_cache.invalidate(admin_user.id)
+        await db.refresh(admin_user)
     
     # Generiamo il token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -1,45 +1,52 @@
 # app/routers/products.py
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 import os
 from datetime import datetime, timedelta
 
 from app.schemas import product as schemas
 from app.models.product import Category, Design, Vote
-from app.models.user import User
+from app.utils.user_cache import AuthenticatedUser
 from app.models.subscription import Subscription
 from app.utils.auth import get_current_active_user, get_current_admin_user
-from app.database import get_db
+from app.utils.rate_limit import vote_limiter
+from app.utils.catalog import catalog_cache
+from app.utils.http_cache import catalog_response
+from app.utils.pagination import paginate_sorted
+from app.utils.activity import log_activity
+from app.database import get_async_db
 from app.config import settings
 
 router = APIRouter(prefix=f"{settings.API_PREFIX}/products", tags=["Products"])
 
 @router.get("/categories", response_model=List[schemas.Category])
 async def get_categories(
+    request: Request,
     skip: int = 0, 
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Ottiene tutte le categorie attive"""
-    categories = db.query(Category)\
-        .filter(Category.is_active == True)\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
-    
-    return categories
+    """Ottiene tutte le categorie attive (pagina successiva: header X-Next-Cursor)"""
+    catalog = await catalog_cache.get(db)
+    categories, next_cursor = paginate_sorted(catalog.categories, limit, cursor, skip)
+    return catalog_response(
+        request, catalog, f"categories:{cursor}:{skip}:{limit}",
+        lambda: categories, next_cursor
+    )
 
 @router.get("/categories/{slug}", response_model=schemas.Category)
 async def get_category(
+    request: Request,
     slug: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Ottiene i dettagli di una categoria specifica"""
-    category = db.query(Category)\
-        .filter(Category.slug == slug, Category.is_active == True)\
-        .first()
+    catalog = await catalog_cache.get(db)
+    category = catalog.categories_by_slug.get(slug)
     
     if not category:
         raise HTTPException(
@@ -47,45 +54,40 @@ async def get_category(
             detail="Categoria non trovata"
         )
     
-    return category
+    return catalog_response(request, catalog, f"category:{slug}", lambda: category)
 
 @router.get("/designs", response_model=List[schemas.Design])
 async def get_designs(
+    request: Request,
     category_id: Optional[int] = None,
     skip: int = 0, 
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Ottiene tutti i design attivi, opzionalmente filtrati per categoria"""
-    query = db.query(Design).join(Category)\
-        .filter(Design.is_active == True, Category.is_active == True)
-    
-    if category_id:
-        query = query.filter(Design.category_id == category_id)
-    
-    # Aggiungi conteggio voti
-    designs = query.offset(skip).limit(limit).all()
-    
-    # Aggiungi conteggio voti per ogni design
-    for design in designs:
-        votes_count = db.query(func.count(Vote.id))\
-            .filter(Vote.design_id == design.id)\
-            .scalar()
-        setattr(design, 'votes_count', votes_count)
-    
-    return designs
+    """Ottiene tutti i design attivi, opzionalmente filtrati per categoria (pagina successiva: header X-Next-Cursor)"""
+    catalog = await catalog_cache.get(db)
+    designs = catalog.designs_by_category.get(category_id, []) if category_id else catalog.designs
+    designs, next_cursor = paginate_sorted(designs, limit, cursor, skip)
+    
+    return catalog_response(
+        request, catalog, f"designs:{category_id}:{cursor}:{skip}:{limit}",
+        lambda: designs, next_cursor
+    )
 
-@router.post("/vote", response_model=schemas.Vote)
+@router.post("/vote", response_model=schemas.Vote, dependencies=[Depends(vote_limiter)])
 async def vote_for_design(
     vote_data: schemas.VoteCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
     """Vota per un design"""
     # Verifica se l'utente ha un abbonamento attivo
-    subscription = db.query(Subscription)\
-        .filter(Subscription.user_id == current_user.id, Subscription.is_active == True)\
-        .first()
+    subscription = await db.scalar(
+        select(Subscription)
+        .where(Subscription.user_id == current_user.id, Subscription.is_active == True)
+    )
     
     if not subscription:
         raise HTTPException(
@@ -94,7 +96,7 @@ async def vote_for_design(
         )
     
     # Verifica se il design esiste ed è attivo
-    design = db.query(Design).filter(Design.id == vote_data.design_id, Design.is_active == True).first()
+    design = await db.scalar(select(Design).where(Design.id == vote_data.design_id, Design.is_active == True))
     if not design:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -102,9 +104,10 @@ async def vote_for_design(
         )
     
     # Verifica se l'utente ha già votato questo design
-    existing_vote = db.query(Vote)\
-        .filter(Vote.user_id == current_user.id, Vote.design_id == vote_data.design_id)\
-        .first()
+    existing_vote = await db.scalar(
+        select(Vote)
+        .where(Vote.user_id == current_user.id, Vote.design_id == vote_data.design_id)
+    )
     
     if existing_vote:
         raise HTTPException(
@@ -117,14 +120,16 @@ async def vote_for_design(
     next_month = month_start + timedelta(days=32)
     next_month_start = next_month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    votes_count = db.query(func.count(Vote.id))\
-        .join(Design, Vote.design_id == Design.id)\
-        .filter(
+    votes_count = await db.scalar(
+        select(func.count(Vote.id))
+        .join(Design, Vote.design_id == Design.id)
+        .where(
             Vote.user_id == current_user.id,
             Design.category_id == design.category_id,
             Vote.created_at >= month_start,
             Vote.created_at < next_month_start
-        ).scalar()
+        )
+    )
     
     if votes_count >= 3:
         raise HTTPException(
@@ -138,32 +143,52 @@ async def vote_for_design(
         design_id=vote_data.design_id
     )
     db.add(new_vote)
-    db.commit()
-    db.refresh(new_vote)
+    
+    # Aggiorna il contatore denormalizzato nella stessa transazione
+    await db.execute(
+        update(Design)
+        .where(Design.id == vote_data.design_id)
+        .values(votes_count=Design.votes_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Voto concorrente sullo stesso design: bloccato dall'indice univoco
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Hai già votato per questo design"
+        )
+    await db.refresh(new_vote)
+    
+    # Nessuna invalidazione del catalogo: i conteggi voti in cache vengono
+    # aggiornati al controllo periodico (CATALOG_VERSION_CHECK_SECONDS)
+    
+    await log_activity(
+        "vote",
+        f"Voto per il design {design.name}",
+        user_id=current_user.id,
+        metadata={"design_id": design.id, "category_id": design.category_id},
+        request=request
+    )
     
     return new_vote
 
 @router.get("/my-votes", response_model=List[schemas.Design])
 async def get_my_votes(
     category_id: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
     """Ottiene i design votati dall'utente, opzionalmente filtrati per categoria"""
-    query = db.query(Design)\
+    query = select(Design)\
         .join(Vote, Design.id == Vote.design_id)\
-        .filter(Vote.user_id == current_user.id, Design.is_active == True)
+        .where(Vote.user_id == current_user.id, Design.is_active == True)
     
     if category_id:
-        query = query.filter(Design.category_id == category_id)
-    
-    designs = query.all()
+        query = query.where(Design.category_id == category_id)
     
-    # Aggiungi conteggio voti per ogni design
-    for design in designs:
-        votes_count = db.query(func.count(Vote.id))\
-            .filter(Vote.design_id == design.id)\
-            .scalar()
-        setattr(design, 'votes_count', votes_count)
+    designs = (await db.scalars(query)).all()
     
     return designs
\ No newline at end of file
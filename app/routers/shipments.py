@@ -1,60 +1,85 @@
 # app/routers/shipments.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional, Union
 from datetime import datetime
 
 from app.schemas import shipment as schemas
 from app.models.shipment import Shipment, ShipmentItem
 from app.models.product import Design
-from app.models.user import User
+from app.utils.user_cache import AuthenticatedUser
 from app.utils.auth import get_current_active_user, get_current_admin_user
-from app.database import get_db
+from app.utils.pagination import fetch_page
+from app.database import get_async_db
 from app.config import settings
 
 router = APIRouter(prefix=f"{settings.API_PREFIX}/shipments", tags=["Shipments"])
 
-@router.get("/my", response_model=List[schemas.ShipmentWithItems])
+@router.get("/my", response_model=List[Union[schemas.ShipmentWithItems, schemas.Shipment]])
 async def get_my_shipments(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    compact: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
-    """Ottiene le spedizioni dell'utente corrente"""
-    shipments = db.query(Shipment)\
-        .filter(Shipment.user_id == current_user.id)\
-        .order_by(Shipment.created_at.desc())\
-        .all()
+    """
+    Ottiene le spedizioni dell'utente corrente, dalla più recente.
+    Senza limit né cursor le restituisce tutte, come prima della paginazione;
+    con limit (default 50 se è indicato solo cursor) la pagina successiva è
+    nell'header X-Next-Cursor.
+    Con compact=true gli item contengono solo design_id, senza i dati del design.
+    """
+    if cursor and limit is None:
+        limit = 50
+    # Item e design caricati in blocco: una query per livello, non una per item
+    items_loader = selectinload(Shipment.shipment_items)
+    if not compact:
+        items_loader = items_loader.selectinload(ShipmentItem.design)
     
-    # Carica i design per ogni item
-    for shipment in shipments:
-        for item in shipment.shipment_items:
-            item.design = db.query(Design).filter(Design.id == item.design_id).first()
+    shipments, next_cursor = await fetch_page(
+        db,
+        select(Shipment)
+        .options(items_loader)
+        .where(Shipment.user_id == current_user.id),
+        (Shipment.created_at, Shipment.id),
+        limit,
+        cursor,
+        descending=True
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
+    if compact:
+        return [schemas.Shipment.from_orm(shipment) for shipment in shipments]
     return shipments
 
 @router.post("/", response_model=schemas.Shipment, status_code=status.HTTP_201_CREATED)
 async def create_shipment(
     shipment_data: schemas.ShipmentCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)  # Solo admin
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)  # Solo admin
 ):
     """Crea una nuova spedizione (solo admin)"""
     new_shipment = Shipment(**shipment_data.dict())
     db.add(new_shipment)
-    db.commit()
-    db.refresh(new_shipment)
+    await db.commit()
+    await db.refresh(new_shipment, ["created_at", "shipment_items"])
     return new_shipment
 
 @router.post("/{shipment_id}/items", response_model=schemas.ShipmentItem)
 async def add_shipment_item(
     shipment_id: int,
     item_data: schemas.ShipmentItemCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_admin_user)  # Solo admin
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_admin_user)  # Solo admin
 ):
     """Aggiunge un item a una spedizione (solo admin)"""
     # Verifica che la spedizione esista
-    shipment = db.query(Shipment).filter(Shipment.id == shipment_id).first()
+    shipment = await db.scalar(select(Shipment).where(Shipment.id == shipment_id))
     if not shipment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -62,7 +87,7 @@ async def add_shipment_item(
         )
     
     # Verifica che il design esista
-    design = db.query(Design).filter(Design.id == item_data.design_id).first()
+    design = await db.scalar(select(Design).where(Design.id == item_data.design_id))
     if not design:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -77,7 +102,7 @@ async def add_shipment_item(
     )
     
     db.add(new_item)
-    db.commit()
-    db.refresh(new_item)
+    await db.commit()
+    await db.refresh(new_item)
     
     return new_item
\ No newline at end of file
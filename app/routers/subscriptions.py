@@ -1,7 +1,8 @@
 # app/routers/subscriptions.py
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import json, logging
 from typing import List, Optional
 from datetime import datetime, timedelta
@@ -12,12 +13,16 @@ from app.schemas import subscription as schemas
 from app.models.subscription import SubscriptionPlan, Subscription
 from app.models.user import User
 from app.models.product import Category
-from app.utils.auth import get_current_active_user, get_current_admin_user, get_current_user_optional
-from app.utils.payments import (
-    create_stripe_customer, create_stripe_checkout_session,
-    PLAN_MAPPING, calculate_next_billing_date
-)
-from app.database import get_db
+from app.utils.auth import get_current_active_user, get_current_admin_user, get_current_user_optional, get_current_user_model
+from app.utils.user_cache import AuthenticatedUser
+from app.utils.payments import PLAN_MAPPING, calculate_next_billing_date
+from app.utils.stripe_gateway import stripe_gateway
+from app.utils.rate_limit import checkout_limiter
+from app.utils.catalog import catalog_cache
+from app.utils.http_cache import catalog_response
+from app.utils.pagination import paginate_sorted
+from app.utils.activity import log_activity
+from app.database import get_async_db
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -26,32 +31,29 @@ router = APIRouter(prefix=f"{settings.API_PREFIX}/subscriptions", tags=["Subscri
 
 @router.get("/plans", response_model=List[schemas.SubscriptionPlan])
 async def get_subscription_plans(
+    request: Request,
     skip: int = 0, 
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Ottiene tutti i piani di abbonamento attivi"""
-    plans = db.query(SubscriptionPlan)\
-        .filter(SubscriptionPlan.is_active == True)\
-        .offset(skip)\
-        .limit(limit)\
-        .all()
-    
-    # Deserializza la lista di feature
-    for plan in plans:
-        plan.features = json.loads(plan.features) if plan.features else []
-        
-    return plans
+    """Ottiene tutti i piani di abbonamento attivi (pagina successiva: header X-Next-Cursor)"""
+    catalog = await catalog_cache.get(db)
+    plans, next_cursor = paginate_sorted(catalog.plans, limit, cursor, skip)
+    return catalog_response(
+        request, catalog, f"plans:{cursor}:{skip}:{limit}",
+        lambda: plans, next_cursor
+    )
 
 @router.get("/plans/{slug}", response_model=schemas.SubscriptionPlan)
 async def get_subscription_plan(
+    request: Request,
     slug: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Ottiene i dettagli di un piano specifico"""
-    plan = db.query(SubscriptionPlan)\
-        .filter(SubscriptionPlan.slug == slug, SubscriptionPlan.is_active == True)\
-        .first()
+    catalog = await catalog_cache.get(db)
+    plan = catalog.plans_by_slug.get(slug)
     
     if not plan:
         raise HTTPException(
@@ -59,23 +61,21 @@ async def get_subscription_plan(
             detail="Piano non trovato"
         )
     
-    # Deserializza la lista di feature
-    plan.features = json.loads(plan.features) if plan.features else []
-    
-    return plan
+    return catalog_response(request, catalog, f"plan:{slug}", lambda: plan)
 
-@router.post("/checkout", response_model=schemas.CheckoutSessionResponse)
+@router.post("/checkout", response_model=schemas.CheckoutSessionResponse, dependencies=[Depends(checkout_limiter)])
 async def create_checkout_session(
     checkout_data: schemas.CreateCheckoutSession,
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_model)
 ):
     """Crea una sessione di checkout Stripe per l'abbonamento"""
     # Verifica piano e periodo
-    plan = db.query(SubscriptionPlan)\
-        .filter(SubscriptionPlan.slug == checkout_data.plan_slug, SubscriptionPlan.is_active == True)\
-        .first()
+    plan = await db.scalar(
+        select(SubscriptionPlan)
+        .where(SubscriptionPlan.slug == checkout_data.plan_slug, SubscriptionPlan.is_active == True)
+    )
     
     if not plan:
         raise HTTPException(
@@ -90,9 +90,10 @@ async def create_checkout_session(
         )
     
     # Verifica se l'utente ha già un abbonamento attivo
-    active_subscription = db.query(Subscription)\
-        .filter(Subscription.user_id == current_user.id, Subscription.is_active == True)\
-        .first()
+    active_subscription = await db.scalar(
+        select(Subscription)
+        .where(Subscription.user_id == current_user.id, Subscription.is_active == True)
+    )
     
     if active_subscription:
         raise HTTPException(
@@ -112,14 +113,14 @@ async def create_checkout_session(
     
     # Crea o ottieni customer Stripe
     if not current_user.stripe_customer_id:
-        stripe_customer_id = create_stripe_customer(
+        stripe_customer_id = await stripe_gateway.create_customer(
             email=current_user.email,
             name=current_user.full_name,
             metadata={"user_id": current_user.id}
         )
         # Aggiorna l'utente con l'ID cliente Stripe
         current_user.stripe_customer_id = stripe_customer_id
-        db.commit()
+        await db.commit()
     else:
         stripe_customer_id = current_user.stripe_customer_id
     
@@ -141,7 +142,7 @@ async def create_checkout_session(
         "billing_period": checkout_data.billing_period
     }
     
-    checkout_session = create_stripe_checkout_session(
+    checkout_session = await stripe_gateway.create_checkout_session(
         customer_id=stripe_customer_id,
         price_id=stripe_price_id,
         success_url=success_url,
@@ -153,13 +154,14 @@ async def create_checkout_session(
 
 @router.get("/my", response_model=schemas.SubscriptionWithPlan)
 async def get_my_subscription(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
     """Ottiene l'abbonamento attivo dell'utente"""
-    subscription = db.query(Subscription)\
-        .filter(Subscription.user_id == current_user.id, Subscription.is_active == True)\
-        .first()
+    subscription = await db.scalar(
+        select(Subscription)
+        .where(Subscription.user_id == current_user.id, Subscription.is_active == True)
+    )
     
     if not subscription:
         raise HTTPException(
@@ -168,7 +170,7 @@ async def get_my_subscription(
         )
     
     # Carica il piano
-    plan = db.query(SubscriptionPlan).filter(SubscriptionPlan.id == subscription.plan_id).first()
+    plan = await db.scalar(select(SubscriptionPlan).where(SubscriptionPlan.id == subscription.plan_id))
     if plan:
         plan.features = json.loads(plan.features) if plan.features else []
     
@@ -179,14 +181,15 @@ async def get_my_subscription(
 @router.post("/update-categories")
 async def update_subscription_categories(
     category_ids: List[int],
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_model)
 ):
     """Aggiorna le categorie preferite dell'utente"""
     # Verifica se l'utente ha un abbonamento attivo
-    subscription = db.query(Subscription)\
-        .filter(Subscription.user_id == current_user.id, Subscription.is_active == True)\
-        .first()
+    subscription = await db.scalar(
+        select(Subscription)
+        .where(Subscription.user_id == current_user.id, Subscription.is_active == True)
+    )
     
     if not subscription:
         raise HTTPException(
@@ -195,7 +198,7 @@ async def update_subscription_categories(
         )
     
     # Verifica il limite di categorie
-    plan = db.query(SubscriptionPlan).filter(SubscriptionPlan.id == subscription.plan_id).first()
+    plan = await db.scalar(select(SubscriptionPlan).where(SubscriptionPlan.id == subscription.plan_id))
     if len(category_ids) > plan.categories_count:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -203,9 +206,10 @@ async def update_subscription_categories(
         )
     
     # Verifica che le categorie esistano
-    categories = db.query(Category)\
-        .filter(Category.id.in_(category_ids), Category.is_active == True)\
-        .all()
+    categories = (await db.scalars(
+        select(Category)
+        .where(Category.id.in_(category_ids), Category.is_active == True)
+    )).all()
     
     if len(categories) != len(category_ids):
         raise HTTPException(
@@ -213,21 +217,22 @@ async def update_subscription_categories(
             detail="Una o più categorie non esistono o non sono attive"
         )
     
-    # Aggiorna le categorie preferite
-    current_user.preferred_categories = categories
-    db.commit()
+    # Aggiorna le categorie preferite (la collezione va caricata prima di sostituirla)
+    await db.refresh(current_user, ["preferred_categories"])
+    current_user.preferred_categories = list(categories)
+    await db.commit()
     
     return {"status": "success", "categories": categories}
 
 @router.get("/verify-session/{session_id}")
 async def verify_checkout_session(
     session_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Verifica una sessione di checkout Stripe"""
     try:
         # Recupera la sessione da Stripe
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = await stripe_gateway.retrieve_checkout_session(session_id)
         logger.info(f"Sessione recuperata: {session.id}, stato pagamento: {session.payment_status}")
         
         # Verifica se la sessione è stata pagata
@@ -248,7 +253,7 @@ async def verify_checkout_session(
             }
         
         # Trova l'utente nel database
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.scalar(select(User).where(User.id == user_id))
         if not user:
             logger.error(f"Utente non trovato: {user_id}")
             return {
@@ -257,10 +262,10 @@ async def verify_checkout_session(
             }
         
         # Controlla se esiste già un abbonamento per questa sessione
-        existing_subscription = db.query(Subscription).filter(
+        existing_subscription = await db.scalar(select(Subscription).where(
             Subscription.user_id == user_id,
             Subscription.stripe_subscription_id == session.subscription
-        ).first()
+        ))
         
         if existing_subscription:
             logger.info(f"Abbonamento già esistente per la sessione: {session_id}")
@@ -276,7 +281,7 @@ async def verify_checkout_session(
         billing_period = session.metadata.get("billing_period")
         
         # Ottieni il piano
-        plan = db.query(SubscriptionPlan).filter(SubscriptionPlan.id == plan_id).first()
+        plan = await db.scalar(select(SubscriptionPlan).where(SubscriptionPlan.id == plan_id))
         if not plan:
             logger.error(f"Piano non trovato: {plan_id}")
             return {
@@ -302,10 +307,16 @@ async def verify_checkout_session(
         )
         
         db.add(subscription)
-        db.commit()
-        db.refresh(subscription)
+        await db.commit()
+        await db.refresh(subscription)
         
         logger.info(f"Abbonamento creato con successo: {subscription.id}")
+        await log_activity(
+            "subscription",
+            "Abbonamento attivato",
+            user_id=subscription.user_id,
+            metadata={"subscription_id": subscription.id, "plan_id": subscription.plan_id, "billing_period": billing_period}
+        )
         
         return {
             "status": "success",
@@ -330,7 +341,7 @@ async def verify_checkout_session(
 @router.get("/cancel-checkout")
 async def cancel_checkout(
     session_id: Optional[str] = Query(None),
-    current_user: User = Depends(get_current_active_user)
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
     """Gestisce l'annullamento di un checkout"""
     logger.info(f"Checkout annullato dall'utente {current_user.id} - Sessione: {session_id}")
@@ -343,13 +354,13 @@ async def cancel_checkout(
 @router.get("/verify-session/{session_id}")
 async def verify_checkout_session(
     session_id: str,
-    db: Session = Depends(get_db),
-    current_user: Optional[User] = Depends(get_current_user_optional)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[AuthenticatedUser] = Depends(get_current_user_optional)
 ):
     """Verifica una sessione di checkout Stripe e conferma l'abbonamento"""
     try:
         # Recupera la sessione da Stripe
-        session = stripe.checkout.Session.retrieve(session_id)
+        session = await stripe_gateway.retrieve_checkout_session(session_id)
         
         # Se l'utente non è autenticato, richiedi login
         if not current_user:
@@ -377,10 +388,10 @@ async def verify_checkout_session(
             }
         
         # Controlla se esiste già un abbonamento per questa sessione
-        existing_subscription = db.query(Subscription).filter(
+        existing_subscription = await db.scalar(select(Subscription).where(
             Subscription.user_id == current_user.id,
             Subscription.stripe_subscription_id == session.subscription
-        ).first()
+        ))
         
         if existing_subscription:
             logger.info(f"Abbonamento già esistente per la sessione: {session_id}")
@@ -395,7 +406,7 @@ async def verify_checkout_session(
         billing_period = session.metadata.get("billing_period")
         
         # Ottieni il piano
-        plan = db.query(SubscriptionPlan).filter(SubscriptionPlan.id == plan_id).first()
+        plan = await db.scalar(select(SubscriptionPlan).where(SubscriptionPlan.id == plan_id))
         if not plan:
             logger.error(f"Piano non trovato: {plan_id}")
             return {
@@ -421,10 +432,16 @@ async def verify_checkout_session(
         )
         
         db.add(subscription)
-        db.commit()
-        db.refresh(subscription)
+        await db.commit()
+        await db.refresh(subscription)
         
         logger.info(f"Abbonamento creato con successo: {subscription.id}")
+        await log_activity(
+            "subscription",
+            "Abbonamento attivato",
+            user_id=subscription.user_id,
+            metadata={"subscription_id": subscription.id, "plan_id": subscription.plan_id, "billing_period": billing_period}
+        )
         
         return {
             "status": "success",
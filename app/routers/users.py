@@ -1,6 +1,6 @@
 # app/routers/users.py
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from datetime import datetime
 import logging
@@ -13,9 +13,11 @@ from app.schemas import user as schemas
 from app.schemas import product as product_schemas
 from app.models.user import User, user_category_preference
 from app.models.product import Category
-from app.utils.auth import get_current_active_user, get_password_hash, verify_password
-from app.utils.email import send_email
-from app.database import get_db
+from app.utils.auth import get_current_active_user, get_current_user_model
+from app.utils.user_cache import AuthenticatedUser, auth_user_cache
+from app.utils.password_hasher import password_hasher
+from app.utils.email import queue_email
+from app.database import get_async_db
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -23,15 +25,15 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix=f"{settings.API_PREFIX}/users", tags=["Users"])
 
 @router.get("/me", response_model=schemas.User)
-async def get_current_user_me(current_user: User = Depends(get_current_active_user)):
+async def get_current_user_me(current_user: User = Depends(get_current_user_model)):
     """Ottiene i dati dell'utente corrente"""
     return current_user
 
 @router.put("/me", response_model=schemas.User)
 async def update_user_me(
     user_data: schemas.UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_model)
 ):
     """Aggiorna i dati dell'utente corrente"""
     # Estrai i dati da aggiornare
@@ -86,8 +88,9 @@ async def update_user_me(
         setattr(current_user, field, value)
     
     # 4. Salva le modifiche
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    auth_user_cache.invalidate(current_user.id)
+    await db.refresh(current_user)
     
     print("Utente aggiornato con successo:", current_user.__dict__)
     
@@ -95,7 +98,7 @@ async def update_user_me(
 
 @router.get("/referral-code", response_model=dict)
 async def get_referral_code(
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_user_model)
 ):
     """Ottiene il codice referral dell'utente corrente"""
     return {"referral_code": current_user.referral_code}
@@ -103,12 +106,12 @@ async def get_referral_code(
 @router.post("/change-password", response_model=dict)
 async def change_password(
     password_data: schemas.PasswordChange,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_model)
 ):
     """Cambia la password dell'utente"""
     # Verifica la password attuale
-    if not verify_password(password_data.current_password, current_user.hashed_password):
+    if not await password_hasher.verify(password_data.current_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Password attuale non corretta"
@@ -122,13 +125,14 @@ async def change_password(
         )
     
     # Aggiorna la password
-    current_user.hashed_password = get_password_hash(password_data.new_password)
-    db.commit()
+    current_user.hashed_password = await password_hasher.hash(password_data.new_password)
+    await db.commit()
+    auth_user_cache.invalidate(current_user.id)
     
     return {"message": "Password aggiornata con successo"}
 
-def send_deletion_email(admin_email: str, user_email: str, reason: str):
-    """Invia email di richiesta cancellazione account"""
+async def send_deletion_email(db: AsyncSession, admin_email: str, user_email: str, reason: str):
+    """Accoda l'email di richiesta cancellazione account"""
     subject = f"Richiesta di cancellazione account - {user_email}"
     
     # Corpo del messaggio
@@ -160,25 +164,23 @@ def send_deletion_email(admin_email: str, user_email: str, reason: str):
     </html>
     """
     
-    # Invia l'email
-    return send_email(admin_email, subject, body, html_body)
+    # Accoda l'email: verrà inviata in background
+    return await queue_email(db, admin_email, subject, body, html_body)
 
 @router.post("/request-deletion", response_model=dict)
 async def request_account_deletion(
     deletion_data: schemas.AccountDeletionRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
     """Richiede la cancellazione dell'account"""
     # Registra la richiesta nel log
     logger.info(f"Richiesta di cancellazione account ricevuta da {current_user.email}: {deletion_data.reason}")
     
-    # Invia una email di notifica all'amministratore (in background)
-    admin_email = settings.ADMIN_EMAIL
-    background_tasks.add_task(
-        send_deletion_email, 
-        admin_email=admin_email,
+    # Email di notifica all'amministratore, inviata in background dalla coda email
+    await send_deletion_email(
+        db,
+        admin_email=settings.ADMIN_EMAIL,
         user_email=current_user.email,
         reason=deletion_data.reason
     )
@@ -187,10 +189,12 @@ async def request_account_deletion(
 
 @router.get("/preferred-categories", response_model=List[product_schemas.Category])
 async def get_preferred_categories(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_model)
 ):
     """Ottiene le categorie preferite dell'utente"""
     from app.schemas.product import Category as CategorySchema
     
+    # Con AsyncSession le relazioni non possono essere caricate in modo lazy
+    await db.refresh(current_user, ["preferred_categories"])
     return current_user.preferred_categories
\ No newline at end of file
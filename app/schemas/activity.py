@@ -0,0 +1,25 @@
+# app/schemas/activity.py
+from typing import Any, Optional
+from pydantic import BaseModel
+from datetime import date, datetime
+
+class Activity(BaseModel):
+    id: int
+    user_id: Optional[int] = None
+    type: Optional[str] = None
+    description: Optional[str] = None
+    ip_address: Optional[str] = None
+    user_agent: Optional[str] = None
+    activity_data: Any = None
+    created_at: Optional[datetime] = None
+    
+    class Config:
+        orm_mode = True
+
+class ActivityDailyCount(BaseModel):
+    day: date
+    type: str
+    count: int
+    
+    class Config:
+        orm_mode = True
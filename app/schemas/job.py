@@ -0,0 +1,31 @@
+# app/schemas/job.py
+import json
+from typing import Any, Optional
+from pydantic import BaseModel, validator
+from datetime import datetime
+
+class JobCreate(BaseModel):
+    name: str
+    payload: dict = {}
+    run_at: Optional[datetime] = None
+
+class Job(BaseModel):
+    id: int
+    name: str
+    payload: Any = None
+    status: str
+    attempts: int
+    max_attempts: int
+    run_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    result: Any = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    @validator('payload', 'result', pre=True)
+    def parse_json(cls, v):
+        return json.loads(v) if isinstance(v, str) else v
+    
+    class Config:
+        orm_mode = True
@@ -32,6 +32,7 @@ class Shipment(ShipmentBase):
     id: int
     user_id: int
     created_at: datetime
+    box_month: Optional[str] = None
     shipment_items: List[ShipmentItem] = []
     
     class Config:
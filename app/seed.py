@@ -6,6 +6,7 @@ import logging
 from app.models import User, SubscriptionPlan, Category, Design
 
 from app.utils.auth import get_password_hash
+from app.utils.catalog import bump_catalog_version_sync
 
 logger = logging.getLogger(__name__)
 
@@ -314,6 +315,9 @@ def seed_database(db: Session):
             
             db.commit()
     
+    # I worker già avviati ricaricano il catalogo
+    bump_catalog_version_sync(db)
+    
     logger.info("Seed del database completato!")
 
 # Funzione per esecuzione diretta
@@ -5,6 +5,7 @@ import logging
 
 from app.database import SessionLocal
 from app.models import SubscriptionPlan
+from app.utils.catalog import bump_catalog_version_sync
 
 logger = logging.getLogger(__name__)
 
@@ -118,7 +119,8 @@ def update_subscription_plans():
                     db.add(plan)
                     logger.info(f"Aggiunto nuovo piano: {plan_data['name']}")
         
-        db.commit()
+        # Salva e segnala ai worker che il catalogo è cambiato
+        bump_catalog_version_sync(db)
         logger.info("Aggiornamento dei piani completato!")
         
         # Verifica gli slug aggiornati
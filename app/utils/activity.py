@@ -1,36 +1,141 @@
 # app/utils/activity.py
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional
+
 from fastapi import Request
-from sqlalchemy.orm import Session
-import json
+from sqlalchemy import insert
 
+from app.config import settings
+from app.database import AsyncSessionLocal
 from app.models.activity import Activity
 
+logger = logging.getLogger(__name__)
+
+class ActivityLogWriter:
+    """
+    Buffer in memoria delle attività da registrare, scritte nella tabella
+    activities con un unico INSERT multiplo quando il buffer raggiunge
+    flush_size oppure ogni flush_interval secondi. Così una richiesta non
+    paga una transazione (e un fsync) per ogni attività registrata.
+
+    Se il buffer è pieno (es. database lento) chi registra attende fino a
+    enqueue_timeout secondi, poi l'attività viene scartata con un avviso.
+    """
+
+    def __init__(self, flush_size: int, flush_interval: float, max_buffer: int, enqueue_timeout: float):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.enqueue_timeout = enqueue_timeout
+        self.dropped = 0
+        self._buffer: List[dict] = []
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Arresta il writer scrivendo le attività ancora nel buffer"""
+        if self._task is not None:
+            # Nessuna cancellazione: un INSERT interrotto a metà perderebbe il blocco in corso
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while self._buffer:
+            if not await self.flush():
+                logger.error(f"{len(self._buffer)} attività non salvate all'arresto")
+                break
+
+    async def add(self, record: dict):
+        if len(self._buffer) >= self.max_buffer:
+            async with self._space:
+                try:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: len(self._buffer) < self.max_buffer),
+                        timeout=self.enqueue_timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.dropped += 1
+                    logger.warning(f"Buffer attività pieno: attività {record['type']} scartata ({self.dropped} finora)")
+                    return
+        self._buffer.append(record)
+        if len(self._buffer) >= self.flush_size:
+            self._wakeup.set()
+
+    async def flush(self) -> bool:
+        """Scrive il contenuto attuale del buffer; False se la scrittura è fallita"""
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return True
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(Activity), batch)
+                await db.commit()
+        except Exception as e:
+            # Le attività restano nel buffer (davanti a quelle nuove) per il prossimo tentativo,
+            # ma solo nello spazio rimasto: il buffer non supera mai max_buffer
+            logger.error(f"Errore nel salvataggio di {len(batch)} attività: {e}")
+            requeued = batch[:max(self.max_buffer - len(self._buffer), 0)]
+            lost = len(batch) - len(requeued)
+            if lost:
+                self.dropped += lost
+                logger.warning(f"Buffer attività pieno: {lost} attività non salvate scartate ({self.dropped} finora)")
+            self._buffer = requeued + self._buffer
+            return False
+        finally:
+            # Anche dopo un errore: chi attende spazio ricontrolla il buffer invece di aspettare il timeout
+            async with self._space:
+                self._space.notify_all()
+        return True
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+activity_writer = ActivityLogWriter(
+    flush_size=settings.ACTIVITY_FLUSH_SIZE,
+    flush_interval=settings.ACTIVITY_FLUSH_INTERVAL_SECONDS,
+    max_buffer=settings.ACTIVITY_BUFFER_SIZE,
+    enqueue_timeout=settings.ACTIVITY_ENQUEUE_TIMEOUT_SECONDS
+)
+
 async def log_activity(
-    db: Session, 
-    activity_type: str, 
-    description: str, 
-    user_id: int = None, 
+    activity_type: str,
+    description: str,
+    user_id: int = None,
     metadata: dict = None,
     request: Request = None
 ):
-    """Registra un'attività nel database"""
+    """Registra un'attività (salvata in blocco da activity_writer, senza attendere il database)"""
     ip_address = None
     user_agent = None
-    
+
     if request:
-        ip_address = request.client.host
+        ip_address = request.client.host if request.client else None
         user_agent = request.headers.get("user-agent")
-    
-    activity = Activity(
-        user_id=user_id,
-        type=activity_type,
-        description=description,
-        ip_address=ip_address,
-        user_agent=user_agent,
-        activity_data=metadata
-    )
-    
-    db.add(activity)
-    db.commit()
-    
-    return activity
\ No newline at end of file
+
+    await activity_writer.add({
+        "user_id": user_id,
+        "type": activity_type,
+        "description": description,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "activity_data": metadata,
+        "created_at": datetime.utcnow()
+    })
@@ -0,0 +1,130 @@
+# app/utils/activity_retention.py
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import Date, delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.activity import Activity, ActivityDailyCount
+
+logger = logging.getLogger(__name__)
+
+# Conservazione del registro attività: la tabella activities tiene solo gli
+# ultimi retention_days giorni. Le righe più vecchie vengono spostate, a blocchi,
+# in file mensili JSONL compressi (activities-YYYY-MM.jsonl.gz) e i conteggi per
+# giorno e tipo restano in activity_daily_counts per la dashboard.
+
+def rollup_daily_counts(db: Session, until: Optional[date] = None) -> int:
+    """
+    Aggiorna activity_daily_counts per i giorni completi (fino a until escluso,
+    default oggi) ancora presenti in activities. Restituisce i giorni ricalcolati.
+    """
+    until = until or datetime.utcnow().date()
+    first_created = db.scalar(select(func.min(Activity.created_at)))
+    if first_created is None:
+        return 0
+    # L'ultimo giorno aggregato si ricalcola: può aver ricevuto attività in ritardo.
+    # I giorni già archiviati non sono più in activities e non vanno toccati.
+    last_day = db.scalar(select(func.max(ActivityDailyCount.day)))
+    start = max(last_day, first_created.date()) if last_day else first_created.date()
+    if start >= until:
+        return 0
+
+    day = func.date(Activity.created_at, type_=Date)
+    rows = db.execute(
+        select(day, Activity.type, func.count(Activity.id))
+        .where(
+            Activity.created_at >= datetime.combine(start, time.min),
+            Activity.created_at < datetime.combine(until, time.min)
+        )
+        .group_by(day, Activity.type)
+    ).all()
+    db.execute(delete(ActivityDailyCount).where(ActivityDailyCount.day >= start, ActivityDailyCount.day < until))
+    if rows:
+        db.execute(insert(ActivityDailyCount), [
+            {"day": row_day, "type": activity_type or "unknown", "count": count}
+            for row_day, activity_type, count in rows
+        ])
+    db.commit()
+    return (until - start).days
+
+def archive_path(archive_dir: str, month: str) -> str:
+    return os.path.join(archive_dir, f"activities-{month}.jsonl.gz")
+
+def _append_to_archive(path: str, rows: List[dict]):
+    """Accoda le righe al file (un nuovo membro gzip) e lo forza su disco"""
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="ab") as archive:
+            for row in rows:
+                archive.write(json.dumps(row, default=str, separators=(",", ":")).encode() + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+
+def archive_activities(
+    db: Session,
+    retention_days: int,
+    archive_dir: str,
+    chunk_size: int = 5000,
+    dry_run: bool = False
+) -> dict:
+    """
+    Sposta negli archivi mensili le attività precedenti agli ultimi retention_days
+    giorni, dopo averle contate in activity_daily_counts. Con dry_run conta
+    soltanto le righe da archiviare.
+    """
+    if retention_days < 1:
+        raise ValueError("retention_days deve essere almeno 1")
+    cutoff = datetime.combine(datetime.utcnow().date() - timedelta(days=retention_days), time.min)
+    result = {"cutoff": cutoff.isoformat(), "dry_run": dry_run, "rolled_up_days": 0,
+              "archived": 0, "chunks": 0, "files": []}
+
+    if dry_run:
+        result["archived"] = db.scalar(select(func.count(Activity.id)).where(Activity.created_at < cutoff))
+        return result
+
+    result["rolled_up_days"] = rollup_daily_counts(db)
+    os.makedirs(archive_dir, exist_ok=True)
+    files = set()
+    columns = Activity.__table__.c
+    while True:
+        rows = db.execute(
+            select(columns).where(columns.created_at < cutoff).order_by(columns.id).limit(chunk_size)
+        ).mappings().all()
+        if not rows:
+            break
+
+        ids = [row["id"] for row in rows]
+        deleted = db.execute(
+            delete(Activity).where(Activity.id.in_(ids)).execution_options(synchronize_session=False)
+        ).rowcount
+        if deleted != len(ids):
+            # Un'altra archiviazione ha già preso queste righe: si lascia proseguire quella
+            db.rollback()
+            logger.warning("Archiviazione attività già in corso in un altro processo, interrotta")
+            break
+
+        by_month: Dict[str, List[dict]] = {}
+        for row in rows:
+            by_month.setdefault(row["created_at"].strftime("%Y-%m"), []).append(dict(row))
+        try:
+            # Il file viene scritto prima del commit: in caso di crash le righe
+            # restano nella tabella (al più compaiono due volte nell'archivio)
+            for month, month_rows in by_month.items():
+                path = archive_path(archive_dir, month)
+                _append_to_archive(path, month_rows)
+                files.add(path)
+        except Exception:
+            db.rollback()
+            raise
+        db.commit()
+
+        result["archived"] += deleted
+        result["chunks"] += 1
+        logger.info(f"Archiviate {result['archived']} attività precedenti al {cutoff.date()}")
+
+    result["files"] = sorted(files)
+    return result
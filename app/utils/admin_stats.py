@@ -0,0 +1,301 @@
+# app/utils/admin_stats.py
+import asyncio
+import copy
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import case, delete, event, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.job import Job
+from app.models.stats_snapshot import StatsCounter, StatsSnapshot
+from app.models.subscription import Subscription
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Le statistiche della dashboard admin sono mantenute in modo incrementale:
+# ogni flush che inserisce, modifica o elimina utenti e abbonamenti aggiorna i
+# contatori di stats_counters nella stessa transazione, quindi leggerle non
+# richiede scansioni delle tabelle. Il ricalcolo completo (refresh_snapshot)
+# gira solo in background e riallinea i contatori a eventuali modifiche fatte
+# fuori dall'ORM (script, SQL manuale).
+
+BILLING_PERIODS = ("monthly", "quarterly", "semiannual", "annual")
+
+def _count_where(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+async def compute_users_stats(db: AsyncSession) -> dict:
+    """Statistiche utenti con un'unica scansione della tabella"""
+    row = (await db.execute(
+        select(
+            func.count(User.id),
+            _count_where(User.is_active == True),
+            _count_where(User.is_active == False),
+            _count_where(User.is_admin == True),
+            _count_where(User.created_at >= datetime.utcnow() - timedelta(days=30)),
+        )
+    )).one()
+
+    return {
+        "total": row[0],
+        "active": row[1],
+        "inactive": row[2],
+        "admins": row[3],
+        "recent": row[4]
+    }
+
+async def compute_subscriptions_stats(db: AsyncSession) -> dict:
+    """Statistiche abbonamenti con un'unica query raggruppata"""
+    rows = (await db.execute(
+        select(Subscription.is_active, Subscription.billing_period, func.count(Subscription.id))
+        .group_by(Subscription.is_active, Subscription.billing_period)
+    )).all()
+
+    by_period = {period: 0 for period in BILLING_PERIODS}
+    total = active = 0
+    for is_active, billing_period, count in rows:
+        total += count
+        if is_active:
+            active += count
+            if billing_period in by_period:
+                by_period[billing_period] += count
+
+    return {
+        "total": total,
+        "active": active,
+        "by_period": by_period
+    }
+
+STATS = {
+    "users": compute_users_stats,
+    "subscriptions": compute_subscriptions_stats,
+}
+
+# Forma delle statistiche con tutti i valori a zero
+EMPTY_STATS = {
+    "users": {"total": 0, "active": 0, "inactive": 0, "admins": 0, "recent": 0},
+    "subscriptions": {"total": 0, "active": 0, "by_period": {period: 0 for period in BILLING_PERIODS}},
+}
+
+# Valori che dipendono dall'ora corrente: non sono contatori, si calcolano alla lettura
+RECENT_USERS_DAYS = 30
+
+def user_counters(is_active, is_admin) -> Dict[str, int]:
+    """Contributo di un utente ai contatori della statistica "users" """
+    return {"total": 1, "active" if is_active else "inactive": 1, "admins": 1 if is_admin else 0}
+
+def subscription_counters(is_active, billing_period) -> Dict[str, int]:
+    """Contributo di un abbonamento ai contatori della statistica "subscriptions" """
+    counters = {"total": 1}
+    if is_active:
+        counters["active"] = 1
+        if billing_period in BILLING_PERIODS:
+            counters[f"by_period.{billing_period}"] = 1
+    return counters
+
+# Modello -> (statistica, attributi da cui dipende, contributo di una riga)
+TRACKED_MODELS = {
+    User: ("users", ("is_active", "is_admin"), user_counters),
+    Subscription: ("subscriptions", ("is_active", "billing_period"), subscription_counters),
+}
+
+def _previous_values(obj, attributes) -> Optional[tuple]:
+    """Valori degli attributi prima del flush; None se un valore modificato non era stato caricato"""
+    state = inspect(obj)
+    values = []
+    for attribute in attributes:
+        history = state.attrs[attribute].history
+        if history.deleted:
+            values.append(history.deleted[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        elif history.added:
+            return None
+        else:
+            values.append(None)
+    return tuple(values)
+
+@event.listens_for(Session, "after_flush")
+def track_stats_changes(session: Session, flush_context):
+    """Applica ai contatori le variazioni dovute agli utenti e abbonamenti appena scritti"""
+    deltas: Dict[Tuple[str, str], int] = {}
+
+    def add(name: str, counters: Dict[str, int], sign: int):
+        for key, value in counters.items():
+            deltas[(name, key)] = deltas.get((name, key), 0) + sign * value
+
+    for obj in session.new:
+        tracked = TRACKED_MODELS.get(type(obj))
+        if tracked:
+            name, attributes, contribution = tracked
+            add(name, contribution(*(getattr(obj, attribute) for attribute in attributes)), 1)
+
+    for obj in session.deleted:
+        tracked = TRACKED_MODELS.get(type(obj))
+        if tracked:
+            name, attributes, contribution = tracked
+            previous = _previous_values(obj, attributes)
+            if previous is not None:
+                add(name, contribution(*previous), -1)
+
+    for obj in session.dirty:
+        tracked = TRACKED_MODELS.get(type(obj))
+        if not tracked:
+            continue
+        name, attributes, contribution = tracked
+        state = inspect(obj)
+        if not any(state.attrs[attribute].history.has_changes() for attribute in attributes):
+            continue
+        previous = _previous_values(obj, attributes)
+        if previous is None:
+            # Riallineato al prossimo ricalcolo completo
+            logger.warning(f"Statistiche {name}: valore precedente non disponibile, contatori non aggiornati")
+            continue
+        add(name, contribution(*previous), -1)
+        add(name, contribution(*(getattr(obj, attribute) for attribute in attributes)), 1)
+
+    deltas = {counter: delta for counter, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    connection = session.connection()
+    for (name, key), delta in deltas.items():
+        # Nessuna riga = contatori non ancora inizializzati dal ricalcolo completo
+        connection.execute(
+            update(StatsCounter)
+            .where(StatsCounter.name == name, StatsCounter.key == key)
+            .values(value=StatsCounter.value + delta)
+        )
+
+def to_counters(name: str, stats: dict) -> Dict[str, int]:
+    """Da {"by_period": {"monthly": 3}, ...} a {"by_period.monthly": 3, ...}, senza i valori non contatori"""
+    counters = {}
+    for key, value in stats.items():
+        if name == "users" and key == "recent":
+            continue
+        if isinstance(value, dict):
+            for sub_key, sub_value in value.items():
+                counters[f"{key}.{sub_key}"] = sub_value
+        else:
+            counters[key] = value
+    return counters
+
+def from_counters(name: str, counters: Dict[str, int]) -> dict:
+    stats = copy.deepcopy(EMPTY_STATS[name])
+    for key, value in counters.items():
+        group, _, sub_key = key.partition(".")
+        if sub_key:
+            stats.setdefault(group, {})[sub_key] = value
+        else:
+            stats[key] = value
+    return stats
+
+async def count_recent_users(db: AsyncSession) -> int:
+    """Iscritti negli ultimi 30 giorni (indice su created_at: si leggono solo le righe recenti)"""
+    return await db.scalar(
+        select(func.count(User.id)).where(User.created_at >= datetime.utcnow() - timedelta(days=RECENT_USERS_DAYS))
+    )
+
+async def refresh_snapshot(db: AsyncSession, name: str) -> dict:
+    """Ricalcolo completo: riallinea i contatori e salva lo snapshot (eseguito in background)"""
+    stats = await STATS[name](db)
+    computed_at = datetime.utcnow()
+
+    await db.execute(delete(StatsCounter).where(StatsCounter.name == name))
+    await db.execute(insert(StatsCounter), [
+        {"name": name, "key": key, "value": value} for key, value in to_counters(name, stats).items()
+    ])
+
+    snapshot = await db.get(StatsSnapshot, name)
+    if snapshot is None:
+        db.add(StatsSnapshot(name=name, payload=json.dumps(stats), computed_at=computed_at))
+    else:
+        snapshot.payload = json.dumps(stats)
+        snapshot.computed_at = computed_at
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Un altro worker ha riallineato la stessa statistica nello stesso momento
+        await db.rollback()
+
+    return {**stats, "computed_at": computed_at}
+
+async def enqueue_refresh(db: AsyncSession, name: str):
+    """Accoda il ricalcolo completo, se non ce n'è già uno in attesa o in corso"""
+    from app.utils.jobs import enqueue_job
+
+    payload = {"name": name}
+    pending = await db.scalar(
+        select(Job.id).where(
+            Job.name == "refresh_stats",
+            Job.payload == json.dumps(payload),
+            Job.status.in_(("queued", "running"))
+        ).limit(1)
+    )
+    if pending is None:
+        await enqueue_job(db, "refresh_stats", payload)
+
+async def get_stats(db: AsyncSession, name: str, fresh: bool = False) -> dict:
+    """
+    Statistica corrente dai contatori incrementali, senza scansioni delle tabelle.
+    Con fresh viene anche accodato un ricalcolo completo. Se i contatori non sono
+    ancora inizializzati si restituisce l'ultimo snapshot (o valori a zero) e il
+    ricalcolo viene accodato: nessun aggregato completo gira durante la richiesta.
+    """
+    counters = dict((await db.execute(
+        select(StatsCounter.key, StatsCounter.value).where(StatsCounter.name == name)
+    )).all())
+    if fresh or not counters:
+        await enqueue_refresh(db, name)
+
+    if counters:
+        stats = from_counters(name, counters)
+        if name == "users":
+            stats["recent"] = await count_recent_users(db)
+        return {**stats, "computed_at": datetime.utcnow()}
+
+    snapshot = await db.get(StatsSnapshot, name)
+    if snapshot is not None:
+        return {**json.loads(snapshot.payload), "computed_at": snapshot.computed_at}
+    return {**copy.deepcopy(EMPTY_STATS[name]), "computed_at": None}
+
+class StatsRefresher:
+    """Esegue periodicamente il ricalcolo completo che riallinea i contatori delle statistiche"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            for name in STATS:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        snapshot = await db.get(StatsSnapshot, name)
+                        # Con più worker basta che uno solo esegua il ricalcolo
+                        if snapshot is None or datetime.utcnow() - snapshot.computed_at >= timedelta(seconds=self.interval):
+                            await refresh_snapshot(db, name)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Errore nell'aggiornamento delle statistiche {name}: {e}")
+            await asyncio.sleep(self.interval)
+
+stats_refresher = StatsRefresher(interval=settings.STATS_REFRESH_SECONDS)
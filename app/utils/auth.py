@@ -2,23 +2,23 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import secrets
 import string
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
 from app.config import settings
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.utils.password_hasher import pwd_context
+from app.utils.user_cache import AuthenticatedUser, auth_user_cache
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_PREFIX}/auth/token")
 
+# Versioni sincrone per gli script (seed.py, ...): nei router usare password_hasher
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -26,41 +26,80 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    """Firma un access token con i claim ricevuti (sub, is_admin, ...), senza accedere al database"""
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    
-    # Se stiamo creando un token per un utente admin, aggiungiamo l'attributo is_admin
-    if "is_admin" not in to_encode and "sub" in to_encode:
-        # Recupera l'utente dal DB per aggiungere is_admin
-        try:
-            db = next(get_db())
-            user_id = to_encode["sub"]
-            user = db.query(User).filter(User.id == user_id).first()
-            if user and user.is_admin:
-                to_encode["is_admin"] = True
-        except Exception as e:
-            # In caso di errore, continuiamo senza aggiungere l'attributo
-            print(f"Errore nel recupero info utente per token: {e}")
+    to_encode.update({"exp": expire, "type": "access"})
     
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def create_refresh_token(user_id, expires_delta: Optional[timedelta] = None):
+    """Firma un refresh token: contiene solo l'id utente, i permessi vengono riletti al rinnovo"""
+    expire = datetime.utcnow() + (expires_delta or timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS))
+    to_encode = {
+        "sub": str(user_id),
+        "exp": expire,
+        "type": "refresh",
+        "jti": secrets.token_urlsafe(16)
+    }
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+def create_token_pair(user: User) -> dict:
+    """Access token e refresh token per un utente già caricato"""
+    return {
+        "access_token": create_access_token(data={"sub": str(user.id), "is_admin": user.is_admin}),
+        "refresh_token": create_refresh_token(user.id),
+        "token_type": "bearer",
+        "expires_in": settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+
+def decode_token(token: str, token_type: str = "access") -> dict:
+    """
+    Verifica firma, scadenza e tipo del token.
+    I token emessi prima dell'introduzione del claim "type" valgono come access token.
+    """
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    if payload.get("type", "access") != token_type:
+        raise JWTError(f"Tipo di token non valido: atteso {token_type}")
+    return payload
+
+async def load_authenticated_user(db: AsyncSession, user_id) -> Optional[AuthenticatedUser]:
+    """Legge i campi di autorizzazione dalla cache, o dal database se mancanti"""
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    user = auth_user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    row = (await db.execute(
+        select(User.id, User.email, User.is_active, User.is_admin).where(User.id == user_id)
+    )).first()
+    if row is None:
+        return None
+
+    user = AuthenticatedUser(*row)
+    auth_user_cache.set(user)
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenziali non valide",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await load_authenticated_user(db, user_id)
     if user is None:
         raise credentials_exception
     
@@ -72,11 +111,26 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         
     return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user(current_user: AuthenticatedUser = Depends(get_current_user)):
     return current_user
 
+async def get_current_user_model(
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Carica il modello User completo, per gli endpoint che ne hanno bisogno"""
+    user = await db.get(User, current_user.id)
+    if user is None:
+        auth_user_cache.invalidate(current_user.id)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Credenziali non valide",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
 # Funzione per verificare ruolo admin
-async def get_current_admin_user(current_user: User = Depends(get_current_user)):
+async def get_current_admin_user(current_user: AuthenticatedUser = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, 
@@ -122,21 +176,21 @@ optional_oauth2_scheme = OptionalOAuth2PasswordBearer(tokenUrl=f"{settings.API_P
 
 async def get_current_user_optional(
     token: Optional[str] = Depends(optional_oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Come get_current_user, ma non solleva eccezioni se il token è assente o non valido"""
     if not token:
         return None
     
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             return None
     except JWTError:
         return None
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await load_authenticated_user(db, user_id)
     if user is None or not user.is_active:
         return None
     
@@ -0,0 +1,230 @@
+# app/utils/catalog.py
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.catalog import CatalogVersion
+from app.models.product import Category, Design
+from app.models.subscription import SubscriptionPlan
+from app.schemas import product as product_schemas
+from app.schemas import subscription as subscription_schemas
+
+logger = logging.getLogger(__name__)
+
+def plan_to_schema(plan: SubscriptionPlan) -> subscription_schemas.SubscriptionPlan:
+    """Converte un piano con le feature già deserializzate"""
+    data = {column.name: getattr(plan, column.name) for column in SubscriptionPlan.__table__.columns}
+    data["features"] = json.loads(plan.features) if plan.features else []
+    return subscription_schemas.SubscriptionPlan(**data)
+
+def _digest(parts) -> str:
+    content = hashlib.sha256()
+    for part in parts:
+        content.update(part if isinstance(part, bytes) else part.json().encode())
+    return content.hexdigest()
+
+def _same_items(items: list, previous_items: list) -> bool:
+    return len(items) == len(previous_items) and all(item is previous for item, previous in zip(items, previous_items))
+
+class CatalogSnapshot:
+    """
+    Piani, categorie e design attivi a una certa versione del catalogo.
+
+    Ogni sezione (piani, categorie, design di ciascuna categoria) ha la sua
+    impronta: l'ETag di una risposta dipende solo dalla sezione che contiene,
+    così un voto cambia l'ETag dei design della sua categoria ma non quello
+    di piani e categorie.
+    """
+
+    # Numero massimo di risposte serializzate conservate (combinazioni di filtri e paginazione)
+    MAX_RENDERED = 64
+
+    def __init__(self, version: int, plans: list, categories: list, designs: list,
+                 previous: Optional["CatalogSnapshot"] = None):
+        self.version = version
+        self.plans: List[subscription_schemas.SubscriptionPlan] = plans
+        self.plans_by_slug = {plan.slug: plan for plan in plans}
+        self.categories: List[product_schemas.Category] = categories
+        self.categories_by_slug = {category.slug: category for category in categories}
+        self.designs: List[product_schemas.Design] = designs
+        self.designs_by_category: Dict[int, List[product_schemas.Design]] = {}
+        for design in designs:
+            self.designs_by_category.setdefault(design.category_id, []).append(design)
+
+        # Impronte del contenuto; le sezioni con gli stessi oggetti di previous non vengono ricalcolate
+        if previous is not None and _same_items(plans, previous.plans):
+            self.plans_hash = previous.plans_hash
+        else:
+            self.plans_hash = _digest(plans)
+        if previous is not None and _same_items(categories, previous.categories):
+            self.categories_hash = previous.categories_hash
+        else:
+            self.categories_hash = _digest(categories)
+        self.designs_hash_by_category: Dict[int, str] = {}
+        for category_id, category_designs in self.designs_by_category.items():
+            if previous is not None and _same_items(category_designs, previous.designs_by_category.get(category_id, [])):
+                self.designs_hash_by_category[category_id] = previous.designs_hash_by_category[category_id]
+            else:
+                self.designs_hash_by_category[category_id] = _digest(category_designs)
+        self.designs_hash = _digest(
+            self.designs_hash_by_category[category_id].encode() for category_id in sorted(self.designs_hash_by_category)
+        )
+
+        self._rendered: "OrderedDict[str, bytes]" = OrderedDict()
+        if previous is not None:
+            # Le risposte delle sezioni non cambiate restano valide
+            for key, body in previous._rendered.items():
+                if self.section_hash(key) == previous.section_hash(key):
+                    self._rendered[key] = body
+
+    def section_hash(self, key: str) -> str:
+        """
+        Impronta della sezione da cui dipende la risposta key: "plans:..." e
+        "plan:<slug>" → piani, "categories:..." e "category:<slug>" → categorie,
+        "designs:<category_id>:..." → design della categoria (o tutti se None).
+        """
+        kind, _, rest = key.partition(":")
+        if kind in ("plans", "plan"):
+            return self.plans_hash
+        if kind in ("categories", "category"):
+            return self.categories_hash
+        if kind == "designs":
+            category_id = rest.split(":", 1)[0]
+            # Come in get_designs: category_id assente o 0 = tutti i design
+            if category_id.isdigit() and int(category_id):
+                return self.designs_hash_by_category.get(int(category_id), "")
+            return self.designs_hash
+        # Chiave sconosciuta: dipende da tutto il catalogo
+        return _digest([self.plans_hash.encode(), self.categories_hash.encode(), self.designs_hash.encode()])
+
+    def etag(self, key: str) -> str:
+        """ETag forte della risposta identificata da key (endpoint e parametri)"""
+        return '"' + hashlib.sha256(f"{self.section_hash(key)}:{key}".encode()).hexdigest()[:32] + '"'
+
+    def render(self, key: str, build_content) -> bytes:
+        """Corpo JSON della risposta, serializzato una sola volta finché la sua sezione non cambia"""
+        body = self._rendered.get(key)
+        if body is None:
+            body = JSONResponse(content=jsonable_encoder(build_content())).body
+            self._rendered[key] = body
+            while len(self._rendered) > self.MAX_RENDERED:
+                self._rendered.popitem(last=False)
+        else:
+            self._rendered.move_to_end(key)
+        return body
+
+    def with_votes(self, votes: Dict[int, int]) -> "CatalogSnapshot":
+        """Copia con i conteggi voti aggiornati (o se stessa se non sono cambiati)"""
+        if all(votes.get(design.id, design.votes_count) == design.votes_count for design in self.designs):
+            return self
+        # Solo i design con un conteggio diverso vengono copiati: le altre sezioni restano identiche
+        designs = [
+            design if votes.get(design.id, design.votes_count) == design.votes_count
+            else design.copy(update={"votes_count": votes[design.id]})
+            for design in self.designs
+        ]
+        return CatalogSnapshot(self.version, self.plans, self.categories, designs, previous=self)
+
+class CatalogCache:
+    """
+    Cache read-through del catalogo pubblico.
+
+    La riga catalog_version viene letta al massimo ogni check_interval secondi:
+    se la versione è cambiata il catalogo viene ricaricato, altrimenti si
+    aggiornano solo i conteggi voti dei design.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self, db: AsyncSession) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+
+        async with self._lock:
+            # Un'altra richiesta potrebbe aver già aggiornato il catalogo
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._snapshot
+
+            version = await db.scalar(select(CatalogVersion.version).where(CatalogVersion.id == 1)) or 0
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = await self._load(db, version)
+            else:
+                votes = dict((await db.execute(
+                    select(Design.id, Design.votes_count).where(Design.is_active == True)
+                )).all())
+                self._snapshot = self._snapshot.with_votes(votes)
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+    async def _load(self, db: AsyncSession, version: int) -> CatalogSnapshot:
+        plans = (await db.scalars(
+            select(SubscriptionPlan)
+            .where(SubscriptionPlan.is_active == True)
+            .order_by(SubscriptionPlan.id)
+        )).all()
+        categories = (await db.scalars(
+            select(Category)
+            .where(Category.is_active == True)
+            .order_by(Category.id)
+        )).all()
+        designs = (await db.scalars(
+            select(Design).join(Category)
+            .where(Design.is_active == True, Category.is_active == True)
+            .order_by(Design.id)
+        )).all()
+
+        logger.info(f"Catalogo caricato (versione {version}): {len(plans)} piani, {len(categories)} categorie, {len(designs)} design")
+        return CatalogSnapshot(
+            version=version,
+            plans=[plan_to_schema(plan) for plan in plans],
+            categories=[product_schemas.Category.from_orm(category) for category in categories],
+            designs=[product_schemas.Design.from_orm(design) for design in designs]
+        )
+
+    def invalidate(self):
+        """Forza il controllo della versione alla prossima richiesta"""
+        self._checked_at = 0.0
+
+catalog_cache = CatalogCache(check_interval=settings.CATALOG_VERSION_CHECK_SECONDS)
+
+def _bump_statement():
+    return (
+        update(CatalogVersion)
+        .where(CatalogVersion.id == 1)
+        .values(version=CatalogVersion.version + 1, updated_at=datetime.utcnow())
+    )
+
+async def bump_catalog_version(db: AsyncSession):
+    """
+    Da chiamare dopo ogni modifica a piani, categorie o design: salva le
+    modifiche in sospeso insieme al nuovo numero di versione.
+    """
+    result = await db.execute(_bump_statement())
+    if result.rowcount == 0:
+        db.add(CatalogVersion(id=1, version=1))
+    await db.commit()
+    catalog_cache.invalidate()
+
+def bump_catalog_version_sync(db: Session):
+    """Versione sincrona di bump_catalog_version, per gli script"""
+    result = db.execute(_bump_statement())
+    if result.rowcount == 0:
+        db.add(CatalogVersion(id=1, version=1))
+    db.commit()
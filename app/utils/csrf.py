@@ -1,50 +1,88 @@
 # app/utils/csrf.py
-from fastapi import Request, HTTPException, status, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import base64
+import hashlib
+import heapq
+import hmac
 import secrets
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Set
 
-# Bearer token security
-security = HTTPBearer()
+from app.config import settings
 
-# Token store (in-memory per semplicità, usare Redis in produzione)
-csrf_tokens: Dict[str, float] = {}
 TOKEN_EXPIRY = 3600  # 1 ora
 
-def generate_csrf_token() -> str:
-    """Genera un nuovo token CSRF"""
-    token = secrets.token_urlsafe(32)
-    csrf_tokens[token] = time.time() + TOKEN_EXPIRY
-    return token
-
-def clean_expired_tokens():
-    """Pulisce i token scaduti"""
-    current_time = time.time()
-    expired = [token for token, expiry in csrf_tokens.items() if expiry < current_time]
-    for token in expired:
-        csrf_tokens.pop(token, None)
-
-def validate_csrf_token(token: str) -> bool:
-    """Valida un token CSRF"""
-    clean_expired_tokens()
-    if token not in csrf_tokens:
+# Chiave dedicata, derivata da SECRET_KEY: un token CSRF non è mai un JWT valido e viceversa
+_signing_key = hashlib.sha256(b"cookieflix-csrf:" + settings.SECRET_KEY.encode()).digest()
+
+class ReplayCache:
+    """
+    Nonce dei token già usati, raggruppati in bucket per istante di scadenza.
+    Un bucket viene eliminato in blocco quando tutti i suoi token sono scaduti
+    (il min-heap dà il bucket più vecchio in O(1)), quindi la pulizia costa
+    O(1) ammortizzato per token invece di una scansione completa.
+
+    La cache è per processo: con più worker un token può essere riusato al
+    massimo una volta per worker prima della scadenza.
+    """
+
+    def __init__(self, bucket_seconds: int = 60):
+        self.bucket_seconds = bucket_seconds
+        self._buckets: Dict[int, Set[str]] = {}
+        self._heap: List[int] = []
+
+    def _expire(self, now: float):
+        while self._heap and (self._heap[0] + 1) * self.bucket_seconds < now:
+            del self._buckets[heapq.heappop(self._heap)]
+
+    def add(self, nonce: str, expires_at: int) -> bool:
+        """Registra il nonce; False se era già stato usato"""
+        self._expire(time.time())
+
+        bucket = expires_at // self.bucket_seconds
+        nonces = self._buckets.get(bucket)
+        if nonces is None:
+            nonces = set()
+            self._buckets[bucket] = nonces
+            heapq.heappush(self._heap, bucket)
+        elif nonce in nonces:
+            return False
+        nonces.add(nonce)
+        return True
+
+    def __len__(self):
+        return sum(len(nonces) for nonces in self._buckets.values())
+
+used_tokens = ReplayCache()
+
+def _sign(message: str) -> str:
+    digest = hmac.new(_signing_key, message.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+def generate_csrf_token(user_id: Optional[int] = None) -> str:
+    """
+    Genera un token CSRF firmato: "<user_id>.<scadenza>.<nonce>.<firma>".
+    Non viene salvato nulla: la validità si verifica ricalcolando la firma.
+    """
+    expires_at = int(time.time()) + TOKEN_EXPIRY
+    message = f"{user_id or 0}.{expires_at}.{secrets.token_urlsafe(16)}"
+    return f"{message}.{_sign(message)}"
+
+def validate_csrf_token(token: str, user_id: Optional[int] = None) -> bool:
+    """Valida un token CSRF (firma, scadenza, utente) e lo consuma"""
+    try:
+        message, signature = token.rsplit(".", 1)
+        token_user_id, expires_at, nonce = message.split(".", 2)
+        expires_at = int(expires_at)
+    except (AttributeError, ValueError):
+        return False
+
+    # Confronto tra bytes: compare_digest rifiuta (TypeError) stringhe non ASCII
+    if not hmac.compare_digest(signature.encode(), _sign(message).encode()):
+        return False
+    if expires_at < time.time():
         return False
-    
-    # Token usato una sola volta (rimuovi dopo l'uso)
-    expiry = csrf_tokens.pop(token)
-    return time.time() < expiry
-
-async def csrf_protection(
-    request: Request,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
-):
-    """Middleware per la protezione CSRF"""
-    if request.method in ["POST", "PUT", "DELETE", "PATCH"]:
-        token = credentials.credentials
-        if not validate_csrf_token(token):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Token CSRF non valido o scaduto"
-            )
-    return True
\ No newline at end of file
+    if token_user_id != str(user_id or 0):
+        return False
+
+    # Token usato una sola volta
+    return used_tokens.add(nonce, expires_at)
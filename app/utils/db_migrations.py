@@ -23,9 +23,23 @@ def add_missing_columns(engine: Engine):
             "country": "VARCHAR(255) NULL",
             "birthdate": "TIMESTAMP NULL"
         },
+        "designs": {
+            "votes_count": "INTEGER NOT NULL DEFAULT 0"
+        },
+        "shipments": {
+            "box_month": "VARCHAR(7) NULL"
+        },
         # Puoi aggiungere altre tabelle e colonne qui
     }
     
+    # Query da eseguire subito dopo l'aggiunta di una colonna per popolarla
+    backfill_queries = {
+        ("designs", "votes_count"): (
+            "UPDATE designs SET votes_count = "
+            "(SELECT COUNT(votes.id) FROM votes WHERE votes.design_id = designs.id)"
+        ),
+    }
+    
     conn = engine.raw_connection()
     try:
         for table, columns in required_columns.items():
@@ -43,10 +57,36 @@ def add_missing_columns(engine: Engine):
                             # quindi dobbiamo eliminare la parte DEFAULT
                             add_column_sql = f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
                             conn.execute(add_column_sql)
+                            backfill_sql = backfill_queries.get((table, column))
+                            if backfill_sql:
+                                conn.execute(backfill_sql)
                             conn.commit()
                             logger.info(f"Colonna {column} aggiunta alla tabella {table}")
                         except Exception as e:
                             logger.error(f"Errore nell'aggiunta della colonna {column}: {str(e)}")
                             conn.rollback()
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+def add_missing_indexes(engine: Engine):
+    """Crea gli indici definiti nei modelli che mancano nelle tabelle esistenti"""
+    # create_all crea gli indici solo insieme a tabelle nuove
+    from app.database import Base
+    
+    inspector = inspect(engine)
+    existing_tables = inspector.get_table_names()
+    
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            logger.info(f"Creazione indice {index.name} sulla tabella {table.name}")
+            try:
+                index.create(bind=engine)
+            except Exception as e:
+                # Es. voti duplicati che violano un indice univoco
+                logger.error(f"Errore nella creazione dell'indice {index.name}: {str(e)}")
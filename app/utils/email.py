@@ -1,51 +1,375 @@
 # app/utils/email.py
+import asyncio
 import smtplib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from typing import Dict, List, Optional, Tuple
 import logging
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.outbound_email import OutboundEmail
 
 logger = logging.getLogger(__name__)
 
+# Le email non vengono più inviate durante la richiesta: queue_email le salva
+# nella tabella outbound_emails e email_outbox le invia in background, a
+# gruppi, su connessioni SMTP riutilizzate, con limite di velocità e nuovi
+# tentativi con backoff esponenziale.
+
+class PermanentEmailError(Exception):
+    """Errore che un nuovo tentativo non può risolvere (es. destinatario rifiutato dal server)"""
+
+def is_email_configured() -> bool:
+    return bool(settings.EMAIL_SERVER and settings.EMAIL_SENDER)
+
+def build_message(recipient_email: str, subject: str, body: str, html_body: Optional[str] = None) -> str:
+    """Messaggio MIME (testo e, se fornito, HTML) pronto per l'invio"""
+    message = MIMEMultipart("alternative")
+    message["From"] = settings.EMAIL_SENDER
+    message["To"] = recipient_email
+    message["Subject"] = subject
+
+    # Aggiungi versione testo
+    message.attach(MIMEText(body, "plain"))
+
+    # Aggiungi versione HTML se fornita
+    if html_body:
+        message.attach(MIMEText(html_body, "html"))
+    return message.as_string()
+
+def open_smtp_connection() -> smtplib.SMTP:
+    """Connessione autenticata al server SMTP configurato"""
+    if settings.EMAIL_USE_SSL:
+        server = smtplib.SMTP_SSL(settings.EMAIL_SERVER, settings.EMAIL_PORT, timeout=settings.EMAIL_TIMEOUT_SECONDS)
+    else:
+        server = smtplib.SMTP(settings.EMAIL_SERVER, settings.EMAIL_PORT, timeout=settings.EMAIL_TIMEOUT_SECONDS)
+        if settings.EMAIL_USE_STARTTLS:
+            server.starttls()
+    try:
+        if settings.EMAIL_PASSWORD:
+            server.login(settings.EMAIL_SENDER, settings.EMAIL_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+def _close_quietly(server: smtplib.SMTP):
+    try:
+        server.quit()
+    except Exception:
+        server.close()
+
 def send_email(recipient_email: str, subject: str, body: str, html_body: str = None):
     """
-    Invia un'email utilizzando le credenziali configurate
-    
+    Invia subito un'email su una connessione dedicata (per script e comandi).
+    Dall'applicazione usare queue_email.
+
     Args:
         recipient_email: L'indirizzo email del destinatario
         subject: L'oggetto dell'email
         body: Il corpo dell'email in formato testo
         html_body: Il corpo dell'email in formato HTML (opzionale)
-    
+
     Returns:
         bool: True se l'invio è riuscito, False altrimenti
     """
     try:
-        # Verifica che le credenziali siano configurate
-        if not all([settings.EMAIL_SENDER, settings.EMAIL_PASSWORD, settings.EMAIL_SERVER]):
+        # Verifica che la configurazione sia presente
+        if not is_email_configured():
             logger.error("Configurazione email mancante")
             return False
-        
-        # Crea il messaggio
-        message = MIMEMultipart("alternative")
-        message["From"] = settings.EMAIL_SENDER
-        message["To"] = recipient_email
-        message["Subject"] = subject
-        
-        # Aggiungi versione testo
-        message.attach(MIMEText(body, "plain"))
-        
-        # Aggiungi versione HTML se fornita
-        if html_body:
-            message.attach(MIMEText(html_body, "html"))
-        
-        # Connetti al server e invia
-        with smtplib.SMTP_SSL(settings.EMAIL_SERVER, settings.EMAIL_PORT) as server:
-            server.login(settings.EMAIL_SENDER, settings.EMAIL_PASSWORD)
-            server.sendmail(settings.EMAIL_SENDER, recipient_email, message.as_string())
-            logger.info(f"Email inviata a {recipient_email}: {subject}")
-            return True
-            
+
+        server = open_smtp_connection()
+        try:
+            server.sendmail(settings.EMAIL_SENDER, [recipient_email], build_message(recipient_email, subject, body, html_body))
+        finally:
+            _close_quietly(server)
+        logger.info(f"Email inviata a {recipient_email}: {subject}")
+        return True
+
     except Exception as e:
         logger.error(f"Errore nell'invio dell'email: {e}")
-        return False
\ No newline at end of file
+        return False
+
+class SMTPConnectionPool:
+    """
+    Connessioni SMTP persistenti, usate da un pool di thread (una per thread
+    attivo). Ogni gruppo di email viene inviato di fila sulla stessa
+    connessione; quelle rimaste inattive oltre idle_timeout vengono chiuse e
+    riaperte, così non si usa una connessione già chiusa dal server.
+    """
+
+    def __init__(self, size: int, idle_timeout: float, rate_per_second: float):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._interval = 1 / rate_per_second if rate_per_second > 0 else 0
+        self._lock = threading.Lock()
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._next_slot = 0.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _acquire(self) -> smtplib.SMTP:
+        stale = []
+        with self._lock:
+            while self._idle:
+                server, released_at = self._idle.pop()
+                if time.monotonic() - released_at < self.idle_timeout:
+                    break
+                stale.append(server)
+            else:
+                server = None
+        for stale_server in stale:
+            _close_quietly(stale_server)
+        return server or open_smtp_connection()
+
+    def _release(self, server: smtplib.SMTP):
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+
+    def _wait_for_slot(self):
+        """Limite di velocità condiviso da tutte le connessioni"""
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def send_batch(self, messages: List[Tuple[int, str, str]]) -> Dict[int, Optional[Exception]]:
+        """
+        Invia (id, destinatario, messaggio) su una sola connessione.
+        Restituisce per ogni id None (inviata) oppure l'errore.
+        """
+        results: Dict[int, Optional[Exception]] = {}
+        server: Optional[smtplib.SMTP] = None
+        for message_id, recipient, content in messages:
+            self._wait_for_slot()
+            for reconnect in (False, True):
+                if server is None:
+                    try:
+                        server = self._acquire()
+                    except OSError as e:
+                        # Server irraggiungibile o login rifiutato: tutto il gruppo verrà ritentato
+                        for pending_id, _, _ in messages:
+                            results.setdefault(pending_id, e)
+                        return results
+                try:
+                    server.sendmail(settings.EMAIL_SENDER, [recipient], content)
+                    results[message_id] = None
+                    break
+                except smtplib.SMTPRecipientsRefused as e:
+                    codes = [code for code, _ in e.recipients.values()]
+                    results[message_id] = PermanentEmailError(str(e)) if all(code >= 500 for code in codes) else e
+                    break
+                except smtplib.SMTPResponseException as e:
+                    results[message_id] = PermanentEmailError(str(e)) if 500 <= e.smtp_code < 600 else e
+                    try:
+                        server.rset()
+                    except Exception:
+                        _close_quietly(server)
+                        server = None
+                    break
+                except OSError as e:
+                    # Connessione caduta: si riprova una volta su una nuova
+                    server.close()
+                    server = None
+                    if reconnect:
+                        results[message_id] = e
+        if server is not None:
+            self._release(server)
+        return results
+
+    async def send(self, messages: List[Tuple[int, str, str]]) -> Dict[int, Optional[Exception]]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="smtp")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.send_batch, messages)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            _close_quietly(server)
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff esponenziale: base, 2*base, 4*base, ... fino a un'ora"""
+    seconds = settings.EMAIL_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(seconds, 3600))
+
+class EmailOutbox:
+    """
+    Svuota la tabella outbound_emails: a ogni ciclo prende in carico fino a
+    batch_size email per connessione e le invia in parallelo sulle connessioni
+    del pool. La presa in carico avviene con un UPDATE condizionato, quindi più
+    processi possono lavorare sulla stessa coda.
+    """
+
+    def __init__(self, pool: SMTPConnectionPool, batch_size: int, poll_interval: float, max_attempts: int, lock_timeout: float = 300):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lock_timeout = lock_timeout
+        self._wakeup = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._current: Optional[asyncio.Task] = None
+
+    def notify(self):
+        """Segnala che ci sono nuove email da inviare"""
+        self._wakeup.set()
+
+    def start(self):
+        if self._dispatcher is not None:
+            return
+        if not is_email_configured():
+            logger.warning("Configurazione email mancante: le email restano in coda senza essere inviate")
+            return
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        self.pool.close()
+
+    async def _dispatch_loop(self):
+        while True:
+            # Azzerato prima della lettura: una notify() durante l'invio non va persa
+            self._wakeup.clear()
+            try:
+                # Un invio già iniziato viene completato anche in fase di arresto
+                self._current = asyncio.ensure_future(self._send_pending())
+                sent = await asyncio.shield(self._current)
+            except asyncio.CancelledError:
+                if self._current is not None:
+                    await asyncio.gather(self._current, return_exceptions=True)
+                raise
+            except Exception as e:
+                logger.error(f"Errore nell'invio della coda email: {e}")
+                sent = 0
+
+            if sent == 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _claim(self, db: AsyncSession) -> List[OutboundEmail]:
+        now = datetime.utcnow()
+        # Rilascia le email rimaste in "sending" dopo un crash
+        await db.execute(
+            update(OutboundEmail)
+            .where(
+                OutboundEmail.status == "sending",
+                OutboundEmail.locked_at < now - timedelta(seconds=self.lock_timeout)
+            )
+            .values(status="pending", locked_by=None, locked_at=None)
+        )
+
+        candidates = select(OutboundEmail.id).where(
+            OutboundEmail.status == "pending",
+            OutboundEmail.next_attempt_at <= now
+        ).order_by(OutboundEmail.next_attempt_at).limit(self.batch_size * self.pool.size)
+        claim_id = uuid.uuid4().hex
+        await db.execute(
+            update(OutboundEmail)
+            .where(OutboundEmail.id.in_(candidates.scalar_subquery()), OutboundEmail.status == "pending")
+            .values(status="sending", locked_by=claim_id, locked_at=now, attempts=OutboundEmail.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        return (await db.scalars(
+            select(OutboundEmail).where(OutboundEmail.locked_by == claim_id, OutboundEmail.status == "sending")
+        )).all()
+
+    async def _send_pending(self) -> int:
+        async with AsyncSessionLocal() as db:
+            emails = await self._claim(db)
+            if not emails:
+                return 0
+
+            messages = [
+                (email.id, email.recipient, build_message(email.recipient, email.subject, email.body, email.html_body))
+                for email in emails
+            ]
+            batches = [messages[start:start + self.batch_size] for start in range(0, len(messages), self.batch_size)]
+            results: Dict[int, Optional[Exception]] = {}
+            for batch_results in await asyncio.gather(*[self.pool.send(batch) for batch in batches]):
+                results.update(batch_results)
+
+            now = datetime.utcnow()
+            sent_ids = [email.id for email in emails if results.get(email.id, False) is None]
+            if sent_ids:
+                await db.execute(
+                    update(OutboundEmail)
+                    .where(OutboundEmail.id.in_(sent_ids))
+                    .values(status="sent", locked_by=None, locked_at=None, last_error=None, sent_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+            for email in emails:
+                error = results.get(email.id, False)
+                if error is None:
+                    continue
+                if error is False:
+                    error = RuntimeError("Email non inviata")
+                values = {"locked_by": None, "locked_at": None, "last_error": str(error)}
+                if isinstance(error, PermanentEmailError) or email.attempts >= self.max_attempts:
+                    values["status"] = "failed"
+                    logger.error(f"Email {email.id} a {email.recipient} fallita definitivamente: {error}")
+                else:
+                    values["status"] = "pending"
+                    values["next_attempt_at"] = now + retry_delay(email.attempts)
+                    logger.warning(f"Email {email.id} non inviata (tentativo {email.attempts}), nuovo tentativo più tardi: {error}")
+                await db.execute(
+                    update(OutboundEmail)
+                    .where(OutboundEmail.id == email.id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+
+            if sent_ids:
+                logger.info(f"Inviate {len(sent_ids)} email su {len(batches)} connessioni")
+            return len(emails)
+
+email_outbox = EmailOutbox(
+    pool=SMTPConnectionPool(
+        size=max(settings.EMAIL_CONNECTIONS, 1),
+        idle_timeout=settings.EMAIL_IDLE_TIMEOUT_SECONDS,
+        rate_per_second=settings.EMAIL_RATE_PER_SECOND
+    ),
+    batch_size=settings.EMAIL_BATCH_SIZE,
+    poll_interval=settings.EMAIL_POLL_INTERVAL_SECONDS,
+    max_attempts=settings.EMAIL_MAX_ATTEMPTS
+)
+
+async def queue_email(db: AsyncSession, recipient_email: str, subject: str, body: str, html_body: Optional[str] = None) -> OutboundEmail:
+    """Accoda un'email: viene salvata subito e inviata in background da email_outbox"""
+    email = OutboundEmail(
+        recipient=recipient_email,
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.add(email)
+    await db.commit()
+    email_outbox.notify()
+    return email
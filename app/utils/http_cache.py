@@ -0,0 +1,44 @@
+# app/utils/http_cache.py
+from typing import Optional
+
+from fastapi import Request, Response
+
+from app.config import settings
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Confronto debole come previsto per If-None-Match (RFC 9110)"""
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def public_cache_control() -> str:
+    return (
+        f"public, max-age={settings.CATALOG_CACHE_MAX_AGE}, "
+        f"stale-while-revalidate={settings.CATALOG_STALE_WHILE_REVALIDATE}"
+    )
+
+def catalog_response(request: Request, snapshot, key: str, build_content, next_cursor: Optional[str] = None) -> Response:
+    """
+    Risposta di un endpoint pubblico del catalogo con ETag e Cache-Control.
+    Se il client ha già la versione corrente risponde 304 senza serializzare nulla.
+    """
+    etag = snapshot.etag(key)
+    headers = {"ETag": etag, "Cache-Control": public_cache_control()}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(
+        content=snapshot.render(key, build_content),
+        media_type="application/json",
+        headers=headers
+    )
@@ -0,0 +1,341 @@
+# app/utils/jobs.py
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models.job import Job
+
+logger = logging.getLogger(__name__)
+
+# Coda di job persistente: enqueue_job salva il job nella tabella jobs e
+# job_worker_pool lo esegue, nel processo web oppure nel processo separato
+# "python -m app worker". I job falliti vengono ritentati con backoff; dopo
+# max_attempts restano in stato "dead" finché un admin non li rimette in coda.
+
+JobHandler = Callable[[AsyncSession, dict], Awaitable[Any]]
+
+job_handlers: Dict[str, JobHandler] = {}
+
+class PermanentJobError(Exception):
+    """Errore che un nuovo tentativo non può risolvere: il job passa subito nello stato dead"""
+
+def job(name: str):
+    """Registra un gestore: async def handler(db, payload) -> risultato serializzabile in JSON"""
+    def decorator(handler: JobHandler) -> JobHandler:
+        job_handlers[name] = handler
+        return handler
+    return decorator
+
+async def enqueue_job(
+    db: AsyncSession,
+    name: str,
+    payload: Optional[dict] = None,
+    run_at: Optional[datetime] = None,
+    max_attempts: Optional[int] = None
+) -> Job:
+    """Accoda un job registrato; viene salvato subito ed eseguito in background"""
+    if name not in job_handlers:
+        raise ValueError(f"Job non registrato: {name}")
+    new_job = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_at=run_at or datetime.utcnow()
+    )
+    db.add(new_job)
+    await db.commit()
+    job_worker_pool.notify()
+    return new_job
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff esponenziale: base, 2*base, 4*base, ... fino a un'ora"""
+    seconds = settings.JOB_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(seconds, 3600))
+
+class JobWorkerPool:
+    """
+    Esegue i job della tabella jobs con al massimo `workers` job contemporanei.
+
+    La presa in carico usa SELECT ... FOR UPDATE SKIP LOCKED sui database che
+    lo supportano (PostgreSQL), così più processi worker non si contendono le
+    stesse righe; su SQLite la clausola viene ignorata e la correttezza è
+    garantita dall'UPDATE condizionato sullo stato.
+
+    Mentre un job è in esecuzione il worker aggiorna locked_at ogni
+    heartbeat_interval secondi: solo un job senza heartbeat da lock_timeout
+    secondi (processo terminato) viene rimesso in coda, quindi i job lunghi
+    (es. generate_monthly_boxes) non vengono eseguiti due volte.
+    """
+
+    def __init__(self, workers: int, poll_interval: float, lock_timeout: float = 900, heartbeat_interval: float = 60):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self._wakeup = asyncio.Event()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def notify(self):
+        """Segnala che ci sono nuovi job da eseguire"""
+        self._wakeup.set()
+
+    def start(self):
+        if self._dispatcher is None and self.workers > 0:
+            self._slots = asyncio.Semaphore(self.workers)
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        # Attende i job in corso: quelli interrotti verrebbero ripresi solo dopo lock_timeout
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _dispatch_loop(self):
+        while True:
+            # Azzerato prima della lettura: una notify() durante il claim non va persa
+            self._wakeup.clear()
+            await self._slots.acquire()
+            self._slots.release()
+            try:
+                claimed = await self._claim_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Errore nella lettura della coda dei job: {e}")
+                claimed = 0
+
+            if claimed == 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _claim_batch(self) -> int:
+        free_slots = self.workers - len(self._tasks)
+        if free_slots <= 0:
+            return 0
+
+        now = datetime.utcnow()
+        claim_id = uuid.uuid4().hex
+        async with AsyncSessionLocal() as db:
+            # Rilascia i job rimasti in "running" dopo un crash (nessun heartbeat da lock_timeout)
+            await db.execute(
+                update(Job)
+                .where(Job.status == "running", Job.locked_at < now - timedelta(seconds=self.lock_timeout))
+                .values(status="queued", locked_by=None, locked_at=None)
+            )
+
+            job_ids = (await db.scalars(
+                select(Job.id)
+                .where(Job.status == "queued", Job.run_at <= now)
+                .order_by(Job.run_at, Job.id)
+                .limit(free_slots)
+                .with_for_update(skip_locked=True)
+            )).all()
+            if job_ids:
+                await db.execute(
+                    update(Job)
+                    .where(Job.id.in_(job_ids), Job.status == "queued")
+                    .values(status="running", locked_by=claim_id, locked_at=now, started_at=now, attempts=Job.attempts + 1)
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+            if not job_ids:
+                return 0
+
+            claimed = (await db.scalars(select(Job.id).where(Job.locked_by == claim_id))).all()
+
+        for job_id in claimed:
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(job_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return len(claimed)
+
+    async def _run(self, job_id: int):
+        try:
+            await self._execute(job_id)
+        except Exception as e:
+            logger.error(f"Errore nell'aggiornamento del job {job_id}: {e}")
+        finally:
+            self._slots.release()
+            self.notify()
+
+    async def _heartbeat(self, job_id: int, locked_by: str):
+        """Aggiorna locked_at finché il job è in esecuzione"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(Job)
+                        .where(Job.id == job_id, Job.status == "running", Job.locked_by == locked_by)
+                        .values(locked_at=datetime.utcnow())
+                        .execution_options(synchronize_session=False)
+                    )
+                    await db.commit()
+            except Exception as e:
+                # Un heartbeat perso non è grave finché il successivo arriva prima di lock_timeout
+                logger.warning(f"Heartbeat del job {job_id} non riuscito: {e}")
+
+    async def _execute(self, job_id: int):
+        async with AsyncSessionLocal() as db:
+            current = await db.get(Job, job_id)
+            name, attempts, max_attempts = current.name, current.attempts, current.max_attempts
+            heartbeat = asyncio.create_task(self._heartbeat(job_id, current.locked_by))
+            try:
+                handler = job_handlers.get(name)
+                if handler is None:
+                    raise PermanentJobError(f"Job non registrato: {name}")
+                result = await handler(db, json.loads(current.payload or "{}"))
+            except Exception as e:
+                await db.rollback()
+                values = {"locked_by": None, "locked_at": None, "last_error": str(e)}
+                if isinstance(e, PermanentJobError) or attempts >= max_attempts:
+                    values["status"] = "dead"
+                    values["finished_at"] = datetime.utcnow()
+                    logger.error(f"Job {job_id} ({name}) fallito definitivamente: {e}")
+                else:
+                    values["status"] = "queued"
+                    values["run_at"] = datetime.utcnow() + retry_delay(attempts)
+                    logger.warning(f"Job {job_id} ({name}) fallito (tentativo {attempts}), nuovo tentativo più tardi: {e}")
+            else:
+                values = {
+                    "status": "succeeded",
+                    "locked_by": None,
+                    "locked_at": None,
+                    "last_error": None,
+                    "result": json.dumps(result, default=str) if result is not None else None,
+                    "finished_at": datetime.utcnow()
+                }
+            finally:
+                heartbeat.cancel()
+                await asyncio.gather(heartbeat, return_exceptions=True)
+
+            await db.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+job_worker_pool = JobWorkerPool(
+    workers=settings.JOB_WORKERS,
+    poll_interval=settings.JOB_POLL_INTERVAL_SECONDS,
+    lock_timeout=settings.JOB_LOCK_TIMEOUT_SECONDS,
+    heartbeat_interval=settings.JOB_HEARTBEAT_SECONDS
+)
+
+class JobScheduler:
+    """Accoda periodicamente i job ricorrenti registrati con every()"""
+
+    def __init__(self, check_interval: float = 60):
+        self.check_interval = check_interval
+        self.schedules: Dict[str, Tuple[float, dict]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def every(self, name: str, seconds: float, payload: Optional[dict] = None):
+        self.schedules[name] = (seconds, payload or {})
+
+    def start(self):
+        if self._task is None and self.schedules:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            for name, (interval, payload) in self.schedules.items():
+                try:
+                    async with AsyncSessionLocal() as db:
+                        last_created = await db.scalar(select(func.max(Job.created_at)).where(Job.name == name))
+                        # Con più processi basta che uno solo accodi il job
+                        if last_created is None or datetime.utcnow() - last_created >= timedelta(seconds=interval):
+                            await enqueue_job(db, name, payload)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Errore nella pianificazione del job {name}: {e}")
+            await asyncio.sleep(self.check_interval)
+
+job_scheduler = JobScheduler()
+
+# Job disponibili
+
+@job("refresh_stats")
+async def refresh_stats_job(db: AsyncSession, payload: dict):
+    """Ricalcola uno snapshot delle statistiche admin (payload: {"name": "users"})"""
+    from app.utils.admin_stats import STATS, refresh_snapshot
+
+    name = payload.get("name")
+    if name not in STATS:
+        raise PermanentJobError(f"Statistica sconosciuta: {name}")
+    return await refresh_snapshot(db, name)
+
+@job("generate_monthly_boxes")
+async def generate_monthly_boxes_job(db: AsyncSession, payload: dict):
+    """Genera le box del mese (payload: {"month": "YYYY-MM", "chunk_size": 1000, "dry_run": false})"""
+    from app.utils.monthly_boxes import generate_monthly_boxes
+
+    month = payload.get("month") or datetime.utcnow().strftime("%Y-%m")
+    try:
+        datetime.strptime(month, "%Y-%m")
+    except (TypeError, ValueError):
+        raise PermanentJobError(f"Mese non valido: {month}")
+
+    def run():
+        with SessionLocal() as sync_db:
+            return generate_monthly_boxes(
+                sync_db,
+                month,
+                chunk_size=payload.get("chunk_size", 1000),
+                dry_run=payload.get("dry_run", False)
+            )
+
+    # Il batch usa la sessione sincrona: gira in un thread per non bloccare il loop
+    return await run_in_threadpool(run)
+
+@job("archive_activities")
+async def archive_activities_job(db: AsyncSession, payload: dict):
+    """Archivia le attività vecchie e aggiorna i conteggi giornalieri (payload: {"retention_days": 90, "dry_run": false})"""
+    from app.utils.activity_retention import archive_activities
+
+    retention_days = payload.get("retention_days", settings.ACTIVITY_RETENTION_DAYS)
+    if not isinstance(retention_days, int) or retention_days < 1:
+        raise PermanentJobError(f"retention_days non valido: {retention_days}")
+
+    def run():
+        with SessionLocal() as sync_db:
+            return archive_activities(
+                sync_db,
+                retention_days,
+                settings.ACTIVITY_ARCHIVE_DIR,
+                chunk_size=payload.get("chunk_size", 5000),
+                dry_run=payload.get("dry_run", False)
+            )
+
+    return await run_in_threadpool(run)
+
+if settings.ACTIVITY_ARCHIVE_INTERVAL_HOURS > 0:
+    job_scheduler.every("archive_activities", settings.ACTIVITY_ARCHIVE_INTERVAL_HOURS * 3600)
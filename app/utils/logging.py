@@ -1,50 +1,155 @@
 # app/utils/logging.py
+import atexit
+import copy
 import logging
 import json
-from datetime import datetime
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # Dipendenza opzionale: senza si usa il modulo json
+    orjson = None
+
+# Attributi presenti in ogni LogRecord: le altre chiavi arrivano da extra={...}
+_RECORD_ATTRIBUTES = frozenset(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {"message", "asctime"}
 
 class JsonFormatter(logging.Formatter):
-    """Formattatore che produce log in formato JSON"""
+    """Formattatore che produce log in formato JSON (con orjson se installato)"""
+    def __init__(self, use_orjson: bool = True):
+        super().__init__()
+        self.use_orjson = use_orjson and orjson is not None
+        # (secondo, "YYYY-MM-DDTHH:MM:SS"): la parte fino ai secondi cambia al più una volta al secondo
+        self._second = (None, "")
+
+    def _timestamp(self, created: float) -> str:
+        second = int(created)
+        cached = self._second
+        if cached[0] != second:
+            cached = (second, datetime.utcfromtimestamp(second).strftime("%Y-%m-%dT%H:%M:%S"))
+            self._second = cached
+        return f"{cached[1]}.{int((created - second) * 1000000):06d}"
+
     def format(self, record):
         log_record = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
+            "logger": record.name,
             "message": record.getMessage(),
             "module": record.module,
             "function": record.funcName,
             "line": record.lineno
         }
-        
-        # Aggiungi eccezione se presente
-        if record.exc_info:
-            log_record["exception"] = self.formatException(record.exc_info)
-        
+
+        # Aggiungi eccezione se presente (già formattata se il record arriva dalla coda)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            log_record["exception"] = record.exc_text
+
         # Aggiungi campi extra
-        for key, value in record.__dict__.items():
-            if key not in ["args", "exc_info", "exc_text", "levelname", "levelno", 
-                           "lineno", "module", "msecs", "message", "msg", "name", 
-                           "pathname", "process", "processName", "relativeCreated", 
-                           "thread", "threadName", "funcName"]:
-                log_record[key] = value
-        
-        return json.dumps(log_record)
-
-def setup_logging(app_name="cookieflix", log_level=logging.INFO):
-    """Configura il logging dell'applicazione"""
+        for key in record.__dict__.keys() - _RECORD_ATTRIBUTES:
+            log_record[key] = record.__dict__[key]
+
+        if self.use_orjson:
+            return orjson.dumps(log_record, default=str).decode()
+        return json.dumps(log_record, default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Tiene solo una frazione dei record dei logger indicati (es. {"app.access": 0.1});
+    avvisi ed errori passano sempre.
+    """
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Da "app.access=0.1,altro.logger=0.5" a {"app.access": 0.1, "altro.logger": 0.5}"""
+    rates = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+class LogQueueHandler(QueueHandler):
+    """
+    Mette i record in coda senza mai bloccare il chiamante: se la coda è piena
+    (disco lento) il record viene scartato e contato in dropped.
+    """
+    _exception_formatter = logging.Formatter()
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Messaggio e traceback si risolvono qui, dove gli argomenti sono ancora validi;
+        # la formattazione completa avviene nel thread del listener
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: Optional[QueueListener] = None
+
+def stop_logging():
+    """Scrive i record ancora in coda e ferma il thread del listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
+
+def setup_logging(
+    app_name="cookieflix",
+    log_level=logging.INFO,
+    queue_size: int = 10000,
+    sample_rates: Optional[Dict[str, float]] = None,
+    use_orjson: bool = True
+):
+    """
+    Configura il logging dell'applicazione. Il root logger ha solo un
+    QueueHandler: console e file con rotazione vengono scritti dal thread di
+    un QueueListener, così nessun I/O su file avviene nel loop asyncio.
+    """
     # Crea directory logs se non esiste
     os.makedirs("logs", exist_ok=True)
-    
-    # Configura logger root
+    stop_logging()
+
+    # Configura logger root, rimuovendo gli handler diretti (es. di logging.basicConfig)
     logger = logging.getLogger()
     logger.setLevel(log_level)
-    
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
     # Handler per console
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-    logger.addHandler(console_handler)
-    
+
     # Handler per file con rotazione
     file_handler = RotatingFileHandler(
         filename=f"logs/{app_name}.log",
@@ -52,11 +157,20 @@ def setup_logging(app_name="cookieflix", log_level=logging.INFO):
         backupCount=10,
         encoding="utf8"
     )
-    file_handler.setFormatter(JsonFormatter())
-    logger.addHandler(file_handler)
-    
+    file_handler.setFormatter(JsonFormatter(use_orjson=use_orjson))
+
+    # Coda tra chi registra e il thread che scrive (queue_size 0 = illimitata)
+    queue_handler = LogQueueHandler(queue.Queue(maxsize=queue_size))
+    if sample_rates:
+        queue_handler.addFilter(SamplingFilter(sample_rates))
+    logger.addHandler(queue_handler)
+
+    global _listener
+    _listener = QueueListener(queue_handler.queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+
     # Imposta livelli specifici per moduli terze parti troppo verbosi
     logging.getLogger("urllib3").setLevel(logging.WARNING)
     logging.getLogger("sqlalchemy").setLevel(logging.WARNING)
-    
-    return logger
\ No newline at end of file
+
+    return logger
@@ -0,0 +1,388 @@
+# app/utils/metrics.py
+import asyncio
+import bisect
+import collections
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Metriche in formato Prometheus. Ogni worker uvicorn tiene contatori e
+# istogrammi in memoria e li scrive periodicamente in un file SQLite condiviso;
+# /metrics somma i valori di tutti i processi. I contatori dei processi
+# terminati restano nella somma, i gauge valgono solo per i processi attivi.
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_HOLD_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Nome -> (tipo, descrizione) per le righe # TYPE e # HELP
+METRICS = {
+    "http_requests_total": ("counter", "Richieste HTTP per metodo, route e classe di stato"),
+    "http_request_duration_seconds": ("histogram", "Durata delle richieste HTTP per metodo e route"),
+    "db_pool_checkouts_total": ("counter", "Connessioni prese dal pool del database"),
+    "db_pool_connections_created_total": ("counter", "Connessioni al database aperte dal pool"),
+    "db_pool_connection_hold_seconds": ("histogram", "Tempo per cui una connessione resta fuori dal pool"),
+    "db_pool_size": ("gauge", "Dimensione configurata del pool"),
+    "db_pool_checked_out": ("gauge", "Connessioni attualmente in uso"),
+    "db_pool_overflow": ("gauge", "Connessioni aperte oltre la dimensione del pool"),
+    "stripe_call_duration_seconds": ("histogram", "Durata delle chiamate Stripe per operazione"),
+    "stripe_call_errors_total": ("counter", "Chiamate Stripe fallite o scadute per operazione"),
+    "password_hash_pending": ("gauge", "Hash e verifiche bcrypt in attesa o in corso"),
+    "password_hash_max_pending": ("gauge", "Limite di hash e verifiche bcrypt in attesa"),
+    "event_loop_lag_seconds": ("histogram", "Ritardo dell'event loop rispetto al timer"),
+    "event_loop_lag_max_seconds": ("gauge", "Ritardo massimo dell'event loop nell'ultimo intervallo"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+# (nome del campione, etichette già formattate, modo di aggregazione, valore)
+# modo: "counter" = somma su tutti i processi, "sum"/"max" = gauge dei processi attivi
+Sample = Tuple[str, str, str, float]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(labels: Labels) -> str:
+    return ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels)
+
+def histogram_samples(name: str, labels: Labels, buckets: Iterable[float], counts: List[int], total: float) -> List[Sample]:
+    """Campioni _bucket (cumulativi), _sum e _count; counts ha un elemento in più per +Inf"""
+    samples = []
+    cumulative = 0
+    for upper_bound, count in zip([*buckets, "+Inf"], counts):
+        cumulative += count
+        samples.append((f"{name}_bucket", format_labels(labels + (("le", str(upper_bound)),)), "counter", cumulative))
+    samples.append((f"{name}_sum", format_labels(labels), "counter", total))
+    samples.append((f"{name}_count", format_labels(labels), "counter", cumulative))
+    return samples
+
+class MetricsRegistry:
+    """Contatori e istogrammi del processo corrente, più i collector letti a ogni raccolta"""
+
+    def __init__(self):
+        # Alcuni eventi (es. pool del database) arrivano da thread diversi dal loop
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], list] = {}  # [conteggi per intervallo..., somma]
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float, buckets: Tuple[float, ...]):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                self._buckets[name] = buckets
+                histogram = self._histograms[key] = [0] * (len(buckets) + 2)
+            histogram[bisect.bisect_left(buckets, value)] += 1
+            histogram[-1] += value
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.append(collector)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, list(values)) for key, values in self._histograms.items()]
+
+        samples = [(name, format_labels(labels), "counter", value) for (name, labels), value in counters]
+        for (name, labels), values in histograms:
+            samples.extend(histogram_samples(name, labels, self._buckets[name], values[:-1], values[-1]))
+        for collector in self._collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                logger.error(f"Errore nella raccolta delle metriche: {e}")
+        return samples
+
+metrics_registry = MetricsRegistry()
+
+def observe_request(method: str, route: str, status_code: int, duration: float):
+    """Registra una richiesta HTTP (chiamata da SecurityMiddleware)"""
+    metrics_registry.inc("http_requests_total", (("method", method), ("route", route), ("status", f"{status_code // 100}xx")))
+    metrics_registry.observe("http_request_duration_seconds", (("method", method), ("route", route)), duration, REQUEST_BUCKETS)
+
+def install_pool_metrics(engine: Engine, name: str):
+    """Conta checkout e connessioni del pool di engine e ne espone lo stato"""
+    labels = (("engine", name),)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics_registry.inc("db_pool_connections_created_total", labels)
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checkout_time"] = time.perf_counter()
+        metrics_registry.inc("db_pool_checkouts_total", labels)
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checkout_time = connection_record.info.pop("checkout_time", None)
+        if checkout_time is not None:
+            metrics_registry.observe("db_pool_connection_hold_seconds", labels, time.perf_counter() - checkout_time, POOL_HOLD_BUCKETS)
+
+    def collect_pool() -> List[Sample]:
+        pool = engine.pool
+        text = format_labels(labels)
+        samples = []
+        # Non tutti i pool (es. NullPool) hanno dimensione e overflow
+        if hasattr(pool, "checkedout"):
+            samples.append(("db_pool_size", text, "sum", pool.size()))
+            samples.append(("db_pool_checked_out", text, "sum", pool.checkedout()))
+            # overflow() è negativo finché le connessioni aperte sono meno di size
+            samples.append(("db_pool_overflow", text, "sum", max(pool.overflow(), 0)))
+        return samples
+
+    metrics_registry.add_collector(collect_pool)
+
+def collect_stripe() -> List[Sample]:
+    from app.utils.stripe_gateway import LATENCY_BUCKETS, stripe_gateway
+
+    samples = []
+    for operation, stats in stripe_gateway.metrics.snapshot().items():
+        labels = (("operation", operation),)
+        samples.extend(histogram_samples(
+            "stripe_call_duration_seconds", labels, LATENCY_BUCKETS,
+            list(stats["histogram"].values()), stats["avg_seconds"] * stats["count"]
+        ))
+        samples.append(("stripe_call_errors_total", format_labels(labels), "counter", stats["errors"]))
+    return samples
+
+def collect_password_hasher() -> List[Sample]:
+    from app.utils.password_hasher import password_hasher
+
+    return [
+        ("password_hash_pending", "", "sum", password_hasher.pending),
+        ("password_hash_max_pending", "", "sum", password_hasher.max_pending),
+    ]
+
+metrics_registry.add_collector(collect_stripe)
+metrics_registry.add_collector(collect_password_hasher)
+
+class LoopLagMonitor:
+    """Misura di quanto l'event loop ritarda un timer di `interval` secondi"""
+
+    def __init__(self, interval: float = 0.5, window: float = 30):
+        self.interval = interval
+        self._recent = collections.deque(maxlen=max(int(window / interval), 1))
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def collect(self) -> List[Sample]:
+        return [("event_loop_lag_max_seconds", "", "max", max(self._recent, default=0.0))]
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - started - self.interval, 0.0)
+            self._recent.append(lag)
+            metrics_registry.observe("event_loop_lag_seconds", (), lag, LOOP_LAG_BUCKETS)
+
+loop_lag_monitor = LoopLagMonitor()
+metrics_registry.add_collector(loop_lag_monitor.collect)
+
+_LE_RE = re.compile(r'(?:^|,)le="([^"]*)"')
+
+def _sort_key(row):
+    name, labels = row[0], row[1]
+    match = _LE_RE.search(labels)
+    upper_bound = float(match.group(1)) if match else 0.0
+    return _family(name), name, _LE_RE.sub("", labels), upper_bound
+
+def _family(name: str) -> str:
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return name
+
+def render(rows: Iterable[Tuple[str, str, float]]) -> str:
+    """Testo in formato di esposizione Prometheus 0.0.4"""
+    lines = []
+    current_family = None
+    for name, labels, value in sorted(rows, key=_sort_key):
+        family = _family(name)
+        if family != current_family:
+            current_family = family
+            metric_type, description = METRICS.get(family, ("untyped", ""))
+            lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {metric_type}")
+        value_text = repr(float(value)) if value != int(value) else str(int(value))
+        lines.append(f"{name}{{{labels}}} {value_text}" if labels else f"{name} {value_text}")
+    return "\n".join(lines) + "\n"
+
+# Senza METRICS_TOKEN /metrics risponde solo a chi si collega direttamente da localhost
+LOCAL_ADDRESSES = frozenset({"127.0.0.1", "::1"})
+FORWARDING_HEADERS = ("forwarded", "x-forwarded-for", "x-real-ip")
+
+def is_local_request(client_host: Optional[str], headers) -> bool:
+    """
+    True se la richiesta arriva da localhost senza passare da un proxy: un
+    reverse proxy sulla stessa macchina si collega da 127.0.0.1 ma aggiunge
+    gli header di inoltro, quindi le sue richieste non contano come locali.
+    """
+    if client_host not in LOCAL_ADDRESSES:
+        return False
+    return not any(header in headers for header in FORWARDING_HEADERS)
+
+class MetricsStore:
+    """
+    File SQLite condiviso dai worker della stessa macchina: ogni processo vi
+    scrive i propri campioni ogni flush_interval secondi (e a ogni lettura di
+    /metrics), identificato da un id univoco anche se il pid viene riusato.
+    """
+
+    # Oltre questo tempo senza aggiornamenti un processo è considerato terminato
+    STALE_AFTER_INTERVALS = 3
+    # Dopo un'ora i contatori dei processi terminati vengono accorpati in una sola riga
+    MERGE_AFTER_SECONDS = 3600
+
+    def __init__(self, path: str, flush_interval: float, registry: MetricsRegistry):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.registry = registry
+        self.process_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metrics")
+        self._connection: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS metric_samples (
+                    process_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    mode TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (process_id, name, labels)
+                )
+            """)
+        return self._connection
+
+    def _write(self, final: bool = False):
+        samples = self.registry.samples()
+        if final:
+            # Processo in arresto: restano solo i contatori, i gauge spariscono subito
+            samples = [sample for sample in samples if sample[2] == "counter"]
+        connection = self._connect()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            # I gauge non più presenti (es. pool chiuso) non devono restare
+            connection.execute("DELETE FROM metric_samples WHERE process_id = ?", (self.process_id,))
+            connection.executemany(
+                "INSERT INTO metric_samples (process_id, name, labels, mode, value, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.process_id, name, labels, mode, value, now) for name, labels, mode, value in samples]
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _merge_dead_processes(self):
+        connection = self._connect()
+        threshold = time.time() - self.MERGE_AFTER_SECONDS
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("""
+                INSERT INTO metric_samples (process_id, name, labels, mode, value, updated_at)
+                SELECT 'merged', name, labels, mode, SUM(value), MAX(updated_at)
+                FROM metric_samples
+                WHERE mode = 'counter' AND process_id != 'merged' AND updated_at < :threshold
+                GROUP BY name, labels, mode
+                ON CONFLICT(process_id, name, labels) DO UPDATE SET value = value + excluded.value
+            """, {"threshold": threshold})
+            connection.execute(
+                "DELETE FROM metric_samples WHERE process_id != 'merged' AND updated_at < ?", (threshold,)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _collect(self) -> str:
+        self._write()
+        live_after = time.time() - self.flush_interval * self.STALE_AFTER_INTERVALS
+        rows = self._connect().execute("""
+            SELECT name, labels,
+                   CASE WHEN mode = 'max' THEN MAX(value) ELSE SUM(value) END
+            FROM metric_samples
+            WHERE mode = 'counter' OR updated_at >= ?
+            GROUP BY name, labels, mode
+        """, (live_after,)).fetchall()
+        return render(rows)
+
+    async def collect(self) -> str:
+        """Metriche di tutti i processi, in formato Prometheus"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._collect)
+
+    def start(self):
+        if self._task is None:
+            loop_lag_monitor.start()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            await loop_lag_monitor.stop()
+            # Ultimo salvataggio: i contatori di questo processo restano nella somma
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self._executor, partial(self._write, final=True))
+            except Exception as e:
+                logger.error(f"Errore nel salvataggio finale delle metriche: {e}")
+        self._executor.shutdown(wait=True)
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._merge_dead_processes)
+        except Exception as e:
+            logger.error(f"Errore nell'accorpamento delle metriche dei processi terminati: {e}")
+        while True:
+            try:
+                await loop.run_in_executor(self._executor, self._write)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Errore nel salvataggio delle metriche: {e}")
+            await asyncio.sleep(self.flush_interval)
+
+metrics_store = MetricsStore(settings.METRICS_DB_PATH, settings.METRICS_FLUSH_SECONDS, metrics_registry)
@@ -0,0 +1,164 @@
+# app/utils/monthly_boxes.py
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Sequence, Tuple
+
+from sqlalchemy import and_, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.product import Category, Design, Vote
+from app.models.shipment import Shipment, ShipmentItem
+from app.models.subscription import Subscription, SubscriptionPlan
+from app.models.user import User, user_category_preference
+
+logger = logging.getLogger(__name__)
+
+# Generazione in blocco delle box mensili: gli abbonati attivi vengono letti a
+# blocchi di chunk_size (keyset su user_id) e per ogni blocco spedizioni e item
+# vengono inseriti con due INSERT multipli in un'unica transazione. Gli utenti
+# che hanno già la box del mese vengono saltati, quindi un'esecuzione interrotta
+# si riprende semplicemente rilanciando il comando.
+
+def month_range(month: str) -> Tuple[datetime, datetime]:
+    """Inizio del mese "YYYY-MM" e inizio del mese successivo"""
+    start = datetime.strptime(month, "%Y-%m")
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+def load_design_rankings(db: Session, month: str) -> Dict[int, List[int]]:
+    """
+    Design attivi per categoria, dal più votato nel mese al meno votato
+    (a parità di voti: più votato in assoluto, poi il più vecchio)
+    """
+    start, end = month_range(month)
+    month_votes = func.count(Vote.id)
+    rows = db.execute(
+        select(Design.category_id, Design.id)
+        .join(Category, Category.id == Design.category_id)
+        .outerjoin(Vote, and_(
+            Vote.design_id == Design.id,
+            Vote.created_at >= start,
+            Vote.created_at < end
+        ))
+        .where(Design.is_active == True, Category.is_active == True)
+        .group_by(Design.id, Design.category_id, Design.votes_count)
+        .order_by(Design.category_id, month_votes.desc(), Design.votes_count.desc(), Design.id)
+    ).all()
+
+    rankings: Dict[int, List[int]] = {}
+    for category_id, design_id in rows:
+        rankings.setdefault(category_id, []).append(design_id)
+    return rankings
+
+class BoxComposer:
+    """
+    Calcola il contenuto della box: i design vincitori delle categorie preferite,
+    presi a turno tra le categorie (il primo di ognuna, poi il secondo, ...).
+    Se i design non bastano per items_per_month si riparte dall'inizio
+    aumentando le quantità. Senza preferenze si usano tutte le categorie.
+    """
+
+    def __init__(self, rankings: Dict[int, List[int]]):
+        self.rankings = rankings
+        # Molti utenti hanno le stesse preferenze: l'ordine di scelta si calcola una volta
+        self._sequences: Dict[Tuple[int, ...], List[int]] = {}
+
+    def _sequence(self, category_ids: Sequence[int]) -> List[int]:
+        key = tuple(sorted(set(category_ids) & self.rankings.keys())) or tuple(sorted(self.rankings))
+        sequence = self._sequences.get(key)
+        if sequence is None:
+            ranked = [self.rankings[category_id] for category_id in key]
+            depth = max((len(designs) for designs in ranked), default=0)
+            sequence = [designs[rank] for rank in range(depth) for designs in ranked if rank < len(designs)]
+            self._sequences[key] = sequence
+        return sequence
+
+    def compose(self, items_per_month: int, category_ids: Sequence[int]) -> List[Tuple[int, int]]:
+        """Lista di (design_id, quantità) della box"""
+        sequence = self._sequence(category_ids)
+        if not sequence or not items_per_month:
+            return []
+        quantities = Counter(sequence[index % len(sequence)] for index in range(items_per_month))
+        return list(quantities.items())
+
+def _subscribers_chunk(db: Session, after_user_id: int, chunk_size: int) -> List[Tuple[int, int]]:
+    """(user_id, items_per_month) degli abbonati attivi successivi ad after_user_id"""
+    return db.execute(
+        select(Subscription.user_id, func.max(SubscriptionPlan.items_per_month))
+        .join(SubscriptionPlan, SubscriptionPlan.id == Subscription.plan_id)
+        .join(User, User.id == Subscription.user_id)
+        .where(
+            Subscription.is_active == True,
+            User.is_active == True,
+            Subscription.user_id > after_user_id
+        )
+        .group_by(Subscription.user_id)
+        .order_by(Subscription.user_id)
+        .limit(chunk_size)
+    ).all()
+
+def generate_monthly_boxes(db: Session, month: str, chunk_size: int = 1000, dry_run: bool = False) -> dict:
+    """
+    Crea le spedizioni (stato "processed") del mese per tutti gli abbonati attivi.
+    Con dry_run calcola le box senza scrivere nulla.
+    """
+    composer = BoxComposer(load_design_rankings(db, month))
+    result = {"month": month, "dry_run": dry_run, "subscribers": 0, "created": 0,
+              "already_generated": 0, "without_designs": 0, "items": 0, "chunks": 0}
+
+    after_user_id = 0
+    while True:
+        subscribers = _subscribers_chunk(db, after_user_id, chunk_size)
+        if not subscribers:
+            break
+        after_user_id = subscribers[-1][0]
+        user_ids = [user_id for user_id, _ in subscribers]
+        result["subscribers"] += len(subscribers)
+        result["chunks"] += 1
+
+        done = set(db.scalars(
+            select(Shipment.user_id).where(Shipment.box_month == month, Shipment.user_id.in_(user_ids))
+        ))
+        preferences: Dict[int, List[int]] = {}
+        for user_id, category_id in db.execute(
+            select(user_category_preference.c.user_id, user_category_preference.c.category_id)
+            .where(user_category_preference.c.user_id.in_(user_ids))
+        ):
+            preferences.setdefault(user_id, []).append(category_id)
+
+        boxes = {}
+        for user_id, items_per_month in subscribers:
+            if user_id in done:
+                result["already_generated"] += 1
+                continue
+            box = composer.compose(items_per_month or 0, preferences.get(user_id, []))
+            if not box:
+                result["without_designs"] += 1
+                continue
+            boxes[user_id] = box
+
+        result["created"] += len(boxes)
+        result["items"] += sum(len(box) for box in boxes.values())
+        if dry_run or not boxes:
+            continue
+
+        created_at = datetime.utcnow()
+        db.execute(insert(Shipment), [
+            {"user_id": user_id, "status": "processed", "box_month": month, "created_at": created_at}
+            for user_id in boxes
+        ])
+        shipment_ids = dict(db.execute(
+            select(Shipment.user_id, Shipment.id)
+            .where(Shipment.box_month == month, Shipment.user_id.in_(list(boxes)))
+        ).all())
+        db.execute(insert(ShipmentItem), [
+            {"shipment_id": shipment_ids[user_id], "design_id": design_id, "quantity": quantity}
+            for user_id, box in boxes.items()
+            for design_id, quantity in box
+        ])
+        db.commit()
+        logger.info(f"Box {month}: blocco fino all'utente {after_user_id} salvato ({result['created']} spedizioni finora)")
+
+    return result
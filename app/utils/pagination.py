@@ -0,0 +1,135 @@
+# app/utils/pagination.py
+import base64
+import bisect
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import DateTime, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+
+# Paginazione a cursore (keyset): il cursore contiene i valori delle colonne di
+# ordinamento dell'ultimo elemento restituito, e la pagina successiva parte da
+# lì con una condizione sull'indice invece di un OFFSET che scorre tutte le
+# righe precedenti. I parametri skip/limit restano supportati.
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Cursore opaco a partire dai valori delle colonne di ordinamento"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).rstrip(b"=").decode()
+
+def _invalid_cursor():
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Cursore di paginazione non valido"
+    )
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise _invalid_cursor()
+    return values
+
+def _cursor_values(cursor: str, columns) -> list:
+    """Valori del cursore convertiti e verificati secondo il tipo delle colonne"""
+    values = []
+    for column, value in zip(columns, decode_cursor(cursor, len(columns))):
+        if isinstance(column.type, DateTime):
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError):
+                raise _invalid_cursor()
+        elif not isinstance(value, column.type.python_type) or isinstance(value, bool):
+            raise _invalid_cursor()
+        values.append(value)
+    return values
+
+async def fetch_page(
+    db: AsyncSession,
+    query,
+    columns: Sequence,
+    limit: Optional[int],
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    descending: bool = False
+) -> Tuple[list, Optional[str]]:
+    """
+    Esegue query ordinata per columns (es. (Model.created_at, Model.id) oppure
+    (Model.id,)) e restituisce (elementi, cursore della pagina successiva).
+    Con un cursore skip viene ignorato; senza, si usa l'OFFSET come prima.
+    Con limit None restituisce tutte le righe (nessuna pagina successiva).
+    """
+    if cursor:
+        values = _cursor_values(cursor, columns)
+        if len(columns) == 1:
+            key, bound = columns[0], values[0]
+        else:
+            key, bound = tuple_(*columns), tuple_(*values)
+        query = query.where(key < bound if descending else key > bound)
+    elif skip:
+        query = query.offset(skip)
+
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+    if limit is None:
+        return (await db.scalars(query)).all(), None
+
+    # Una riga in più dice se esiste una pagina successiva
+    limit = max(limit, 0)
+    rows = (await db.scalars(query.limit(limit + 1))).all()
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit and items:
+        next_cursor = encode_cursor([getattr(items[-1], column.key) for column in columns])
+    return items, next_cursor
+
+async def count_rows(db: AsyncSession, query, mode: str = "approximate") -> Tuple[Optional[int], bool]:
+    """
+    Conta le righe di query secondo mode:
+    - "none": nessun conteggio
+    - "exact": COUNT completo
+    - "approximate": conta al massimo PAGINATION_COUNT_CAP righe, così il costo
+      resta limitato anche su tabelle grandi
+    Restituisce (totale, esatto).
+    """
+    if mode == "none":
+        return None, False
+    if mode == "exact":
+        return await db.scalar(select(func.count()).select_from(query.order_by(None).subquery())), True
+
+    cap = settings.PAGINATION_COUNT_CAP
+    total = await db.scalar(select(func.count()).select_from(query.order_by(None).limit(cap + 1).subquery()))
+    if total > cap:
+        return cap, False
+    return total, True
+
+def paginate_sorted(
+    items: List[Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    key: Callable[[Any], int] = lambda item: item.id
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Come fetch_page, per liste in memoria già ordinate per key crescente
+    (es. il catalogo): la posizione del cursore si trova con una ricerca binaria.
+    """
+    if cursor:
+        (last_key,) = decode_cursor(cursor, 1)
+        if not isinstance(last_key, int) or isinstance(last_key, bool):
+            raise _invalid_cursor()
+        start = bisect.bisect_right(items, last_key, key=key)
+    else:
+        start = max(skip, 0)
+
+    page = items[start:start + max(limit, 0)]
+    next_cursor = None
+    if page and start + len(page) < len(items):
+        next_cursor = encode_cursor([key(page[-1])])
+    return page, next_cursor
@@ -0,0 +1,106 @@
+# app/utils/password_hasher.py
+# Nota: questo modulo viene importato anche dai processi del pool, quindi
+# non deve dipendere dal database o dai router.
+import asyncio
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.config import settings
+
+# Password hashing
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+class PasswordHasher:
+    """
+    Esegue hash e verifica bcrypt in un pool di processi, fuori dall'event loop.
+
+    Le richieste in attesa sono limitate da max_pending: oltre il limite si
+    risponde subito con 503 invece di accodare login che scadrebbero comunque.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: i processi figli non ereditano thread e connessioni del worker web
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def _submit(self, func, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servizio temporaneamente sovraccarico. Riprova tra qualche secondo.",
+                headers={"Retry-After": "1"}
+            )
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(_verify, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int = 4, max_rounds: int = 16, samples: int = 5):
+    """
+    Misura la durata di una verifica bcrypt per ogni costo e restituisce il
+    costo più alto la cui mediana resta entro target_ms.
+
+    Returns:
+        tuple: (costo scelto, {costo: mediana in ms})
+    """
+    timings = {}
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+        hashed = context.hash("calibration-password")
+
+        durations = []
+        for _ in range(samples):
+            start_time = time.perf_counter()
+            context.verify("calibration-password", hashed)
+            durations.append((time.perf_counter() - start_time) * 1000)
+
+        timings[rounds] = statistics.median(durations)
+        if timings[rounds] > target_ms:
+            break
+        chosen = rounds
+    return chosen, timings
+
+_workers = settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1
+password_hasher = PasswordHasher(
+    workers=_workers,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING or _workers * 4
+)
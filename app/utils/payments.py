@@ -8,6 +8,8 @@ from app.config import settings
 
 # Configurazione Stripe
 stripe.api_key = settings.STRIPE_API_KEY
+if settings.STRIPE_API_BASE:
+    stripe.api_base = settings.STRIPE_API_BASE
 logger = logging.getLogger(__name__)
 
 # Mapping dei piani Cookieflix vs product/price IDs di Stripe
@@ -0,0 +1,75 @@
+# app/utils/query_stats.py
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Statistiche della richiesta corrente (None fuori da una richiesta HTTP)
+_current_stats: ContextVar[Optional["QueryStats"]] = ContextVar("query_stats", default=None)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+class QueryStats:
+    """Conteggio e durata delle query SQL eseguite durante una richiesta"""
+    __slots__ = ("count", "duration", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0  # secondi
+        self.statements = Counter()
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.statements[fingerprint(statement)] += 1
+
+    def most_repeated(self):
+        """Restituisce (fingerprint, ripetizioni) della query più ripetuta"""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+def fingerprint(statement: str) -> str:
+    """Normalizza uno statement per riconoscere le query ripetute"""
+    statement = _WHITESPACE_RE.sub(" ", statement).strip()
+    # IN (?, ?, ?) con lunghezze diverse è comunque la stessa query
+    return _IN_LIST_RE.sub("(?...)", statement)
+
+def start_query_stats() -> QueryStats:
+    """Inizia a raccogliere le statistiche per la richiesta corrente"""
+    stats = QueryStats()
+    _current_stats.set(stats)
+    return stats
+
+def get_query_stats() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+def install_query_hooks(engine: Engine):
+    """Registra gli hook che misurano ogni statement eseguito dall'engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start_times = conn.info.get("query_start_time")
+        if not start_times:
+            return
+        elapsed = time.perf_counter() - start_times.pop()
+
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.record(statement, elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # Statement fallito: after_cursor_execute non viene chiamato
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start_time"):
+            conn.info["query_start_time"].pop()
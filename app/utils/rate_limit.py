@@ -1,38 +1,200 @@
 # app/utils/rate_limit.py
-from fastapi import HTTPException, Request, status
+import asyncio
+import logging
+import math
+import sqlite3
 import time
-from collections import defaultdict
-import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Algoritmo: sliding window counter. Per ogni chiave si conservano solo il
+# contatore della finestra corrente e quello della precedente; la stima delle
+# richieste nell'ultimo periodo è
+#     precedente * (tempo mancante alla fine della finestra / periodo) + corrente
+# quindi ogni controllo costa O(1), indipendentemente dal limite.
+
+class MemoryBackend:
+    """Contatori nel processo corrente, con eviction LRU e scadenza"""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        # chiave -> [finestra, corrente, precedente, scadenza]
+        self._windows: "OrderedDict[str, list]" = OrderedDict()
+
+    async def increment(self, key: str, window: int, ttl: float) -> Tuple[int, int]:
+        now = time.time()
+        entry = self._windows.get(key)
+        if entry is None or entry[0] < window - 1:
+            entry = [window, 1, 0, now + ttl]
+        elif entry[0] == window - 1:
+            entry = [window, 1, entry[1], now + ttl]
+        else:
+            entry[1] += 1
+            entry[3] = now + ttl
+        self._windows[key] = entry
+        self._windows.move_to_end(key)
+
+        # Le chiavi meno usate di recente stanno in testa: si eliminano quelle scadute
+        # e, oltre max_keys, le più vecchie
+        while self._windows:
+            oldest_key, oldest = next(iter(self._windows.items()))
+            if oldest[3] > now and len(self._windows) <= self.max_keys:
+                break
+            del self._windows[oldest_key]
+
+        return entry[1], entry[2]
+
+    def close(self):
+        self._windows.clear()
+
+class SQLiteBackend:
+    """
+    Contatori in un file SQLite condiviso dai worker della stessa macchina.
+    Le query girano in un thread dedicato con una sola connessione.
+    """
+
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rate-limit")
+        self._connection: Optional[sqlite3.Connection] = None
+        self._calls = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limit_windows (
+                    key TEXT PRIMARY KEY,
+                    window_id INTEGER NOT NULL,
+                    current INTEGER NOT NULL,
+                    previous INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+        return self._connection
+
+    def _increment(self, key: str, window: int, ttl: float) -> Tuple[int, int]:
+        connection = self._connect()
+        now = time.time()
+        # Nelle espressioni di SET le colonne hanno ancora il valore precedente all'aggiornamento
+        current, previous = connection.execute("""
+            INSERT INTO rate_limit_windows (key, window_id, current, previous, expires_at)
+            VALUES (:key, :window, 1, 0, :expires_at)
+            ON CONFLICT(key) DO UPDATE SET
+                previous = CASE
+                    WHEN window_id = :window THEN previous
+                    WHEN window_id = :window - 1 THEN current
+                    ELSE 0
+                END,
+                current = CASE WHEN window_id = :window THEN current + 1 ELSE 1 END,
+                window_id = :window,
+                expires_at = :expires_at
+            RETURNING current, previous
+        """, {"key": key, "window": window, "expires_at": now + ttl}).fetchone()
+
+        self._calls += 1
+        if self._calls % self.CLEANUP_EVERY == 0:
+            connection.execute("DELETE FROM rate_limit_windows WHERE expires_at < ?", (now,))
+        return current, previous
+
+    async def increment(self, key: str, window: int, ttl: float) -> Tuple[int, int]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._increment, key, window, ttl)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+class RedisBackend:
+    """
+    Contatori su un server che parla il protocollo Redis (Redis, Valkey, KeyDB, ...).
+    Usa solo INCR, EXPIRE e GET; richiede il pacchetto opzionale "redis".
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis richiede il pacchetto 'redis' (pip install redis)")
+        self.prefix = prefix
+        self._client = redis_asyncio.from_url(url)
+
+    async def increment(self, key: str, window: int, ttl: float) -> Tuple[int, int]:
+        current_key = f"{self.prefix}{key}:{window}"
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, math.ceil(ttl))
+            pipe.get(f"{self.prefix}{key}:{window - 1}")
+            current, _, previous = await pipe.execute()
+        return int(current), int(previous or 0)
+
+    def close(self):
+        # La connessione viene chiusa con il processo
+        pass
+
+def build_backend():
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        return SQLiteBackend(settings.RATE_LIMIT_SQLITE_PATH)
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend(settings.RATE_LIMIT_REDIS_URL)
+    return MemoryBackend(settings.RATE_LIMIT_MAX_KEYS)
+
+rate_limit_backend = build_backend()
 
-# Semplice implementazione di rate limiting in-memory
-# In produzione, usare Redis o altro sistema distribuito
 class RateLimiter:
-    def __init__(self, times: int, seconds: int):
+    """
+    Limita a `times` richieste ogni `seconds` secondi per IP.
+    Si usa come dipendenza: dependencies=[Depends(login_limiter)]
+    """
+
+    def __init__(self, name: str, times: int, seconds: int, backend=None):
+        self.name = name
         self.times = times  # Numero massimo di richieste
         self.seconds = seconds  # Periodo di tempo in secondi
-        self.requests = defaultdict(list)  # IP -> lista di timestamp
-        self.lock = threading.Lock()
-        
+        self.backend = backend
+
     async def check(self, request: Request):
-        client_ip = request.client.host
-        current_time = time.time()
-        
-        with self.lock:
-            # Rimuovi i timestamp più vecchi del periodo
-            self.requests[client_ip] = [
-                timestamp for timestamp in self.requests[client_ip]
-                if current_time - timestamp < self.seconds
-            ]
-            
-            # Verifica se l'utente ha superato il limite
-            if len(self.requests[client_ip]) >= self.times:
-                raise HTTPException(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail="Troppe richieste. Riprova più tardi."
-                )
-            
-            # Aggiungi il timestamp attuale
-            self.requests[client_ip].append(current_time)
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+
+        client_ip = request.client.host if request.client else "unknown"
+        now = time.time()
+        window = int(now // self.seconds)
+        elapsed = now - window * self.seconds
+
+        backend = self.backend or rate_limit_backend
+        try:
+            current, previous = await backend.increment(f"{self.name}:{client_ip}", window, 2 * self.seconds)
+        except Exception as e:
+            # Meglio lasciar passare la richiesta che bloccare il servizio
+            logger.error(f"Errore nel rate limiter {self.name}: {e}")
+            return
+
+        estimated = previous * (self.seconds - elapsed) / self.seconds + current
+        if estimated > self.times:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Troppe richieste. Riprova più tardi.",
+                headers={"Retry-After": str(math.ceil(self.seconds - elapsed))}
+            )
+
+    async def __call__(self, request: Request):
+        await self.check(request)
 
 # Rate limiter per endpoint di login: 5 tentativi ogni 60 secondi
-login_limiter = RateLimiter(times=5, seconds=60)
\ No newline at end of file
+login_limiter = RateLimiter("login", times=5, seconds=60)
+register_limiter = RateLimiter("register", times=10, seconds=3600)
+vote_limiter = RateLimiter("vote", times=30, seconds=60)
+checkout_limiter = RateLimiter("checkout", times=10, seconds=60)
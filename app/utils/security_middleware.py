@@ -0,0 +1,78 @@
+# app/utils/security_middleware.py
+import logging
+import time
+
+from app.config import settings
+from app.utils.metrics import observe_request
+from app.utils.query_stats import start_query_stats
+
+logger = logging.getLogger(__name__)
+# Una riga per richiesta: campionabile con LOG_SAMPLE_RATES="app.access=..."
+access_logger = logging.getLogger("app.access")
+
+# Header di sicurezza aggiunti a ogni risposta, già codificati per ASGI
+SECURITY_HEADERS = [
+    (b"x-content-type-options", b"nosniff"),
+    (b"x-frame-options", b"DENY"),
+    (b"content-security-policy", b"default-src 'self'; script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; img-src 'self' data:;"),
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains"),
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+]
+
+class SecurityMiddleware:
+    """
+    Middleware ASGI per logging e sicurezza: header di sicurezza, numero di
+    query (X-DB-Queries), riga di log per richiesta e avviso sulle query
+    ripetute (possibile N+1). A differenza di @app.middleware("http") non
+    crea task né stream intermedi e non bufferizza le risposte in streaming.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter_ns()
+        query_stats = start_query_stats()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    *SECURITY_HEADERS,
+                    (b"x-db-queries", str(query_stats.count).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._log_request(scope, status_code, time.perf_counter_ns() - start_time, query_stats)
+
+    def _log_request(self, scope, status_code: int, elapsed_ns: int, query_stats):
+        method, path = scope["method"], scope["path"]
+        if settings.METRICS_ENABLED:
+            # Route con i parametri (es. /api/admin/jobs/{job_id}), non l'URL: etichette in numero limitato
+            route = scope.get("route")
+            observe_request(method, getattr(route, "path", "<unmatched>"), status_code, elapsed_ns / 1e9)
+
+        access_logger.info(
+            f"{method} {path} - {status_code} - {elapsed_ns / 1e9:.4f}s "
+            f"- {query_stats.count} query ({query_stats.duration:.4f}s)",
+            extra={"db_queries": query_stats.count, "db_time": round(query_stats.duration, 6)}
+        )
+
+        # Rilevamento N+1: la stessa query ripetuta troppe volte nella stessa richiesta
+        repeated_statement, repetitions = query_stats.most_repeated()
+        if settings.SQL_REPEATED_QUERY_THRESHOLD and repetitions > settings.SQL_REPEATED_QUERY_THRESHOLD:
+            logger.warning(
+                f"Possibile N+1 in {method} {path}: "
+                f"query ripetuta {repetitions} volte: {repeated_statement}",
+                extra={"db_repeated_query": repeated_statement, "db_repetitions": repetitions}
+            )
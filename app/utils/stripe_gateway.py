@@ -0,0 +1,154 @@
+# app/utils/stripe_gateway.py
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Optional
+
+import requests
+import stripe
+from fastapi import HTTPException, status
+from requests.adapters import HTTPAdapter
+
+from app.config import settings
+from app.utils.payments import create_stripe_customer, create_stripe_checkout_session
+
+logger = logging.getLogger(__name__)
+
+# Limiti superiori (secondi) degli intervalli dell'istogramma delle latenze
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class StripeCallMetrics:
+    """Latenze ed errori delle chiamate Stripe, per operazione"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations: Dict[str, dict] = {}
+
+    def record(self, operation: str, duration: float, error: bool = False):
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                stats = {
+                    "count": 0,
+                    "errors": 0,
+                    "total_seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+                }
+                self._operations[operation] = stats
+
+            stats["count"] += 1
+            stats["total_seconds"] += duration
+            stats["max_seconds"] = max(stats["max_seconds"], duration)
+            if error:
+                stats["errors"] += 1
+
+            for index, upper_bound in enumerate(LATENCY_BUCKETS):
+                if duration <= upper_bound:
+                    stats["buckets"][index] += 1
+                    break
+            else:
+                stats["buckets"][-1] += 1
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Copia delle statistiche con latenza media e istogramma leggibile"""
+        with self._lock:
+            result = {}
+            for operation, stats in self._operations.items():
+                labels = [f"<={upper_bound}s" for upper_bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+                result[operation] = {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "avg_seconds": stats["total_seconds"] / stats["count"] if stats["count"] else 0.0,
+                    "max_seconds": stats["max_seconds"],
+                    "histogram": dict(zip(labels, stats["buckets"])),
+                }
+            return result
+
+def build_http_session(pool_size: int) -> requests.Session:
+    """Sessione HTTP condivisa: le connessioni keep-alive verso Stripe vengono riutilizzate"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class StripeGateway:
+    """
+    Esegue le chiamate (sincrone) della libreria Stripe in un pool di thread
+    dedicato e limitato, così da non bloccare l'event loop.
+    """
+
+    def __init__(self, max_workers: int, timeout: float):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.metrics = StripeCallMetrics()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # Client HTTP della libreria Stripe con connessioni riutilizzate e timeout
+        stripe.default_http_client = stripe.http_client.RequestsClient(
+            timeout=timeout,
+            session=build_http_session(max_workers)
+        )
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stripe")
+        return self._executor
+
+    async def call(self, operation: str, func, *args, timeout: Optional[float] = None, **kwargs):
+        """Esegue func nel pool e ne registra la latenza sotto il nome operation"""
+        loop = asyncio.get_running_loop()
+        start_time = time.perf_counter()
+        error = False
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self.executor, partial(func, *args, **kwargs)),
+                timeout=timeout or self.timeout
+            )
+        except asyncio.TimeoutError:
+            error = True
+            logger.error(f"Timeout nella chiamata Stripe {operation}")
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="Il servizio di pagamento non ha risposto in tempo"
+            )
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.metrics.record(operation, time.perf_counter() - start_time, error)
+
+    async def create_customer(self, email, name, metadata=None, timeout: Optional[float] = None):
+        """Crea un cliente Stripe (vedi create_stripe_customer)"""
+        return await self.call(
+            "customer.create", create_stripe_customer, email, name, metadata, timeout=timeout
+        )
+
+    async def create_checkout_session(self, customer_id, price_id, success_url, cancel_url,
+                                      metadata=None, timeout: Optional[float] = None):
+        """Crea una sessione di checkout Stripe (vedi create_stripe_checkout_session)"""
+        return await self.call(
+            "checkout.session.create", create_stripe_checkout_session,
+            customer_id, price_id, success_url, cancel_url, metadata, timeout=timeout
+        )
+
+    async def retrieve_checkout_session(self, session_id, timeout: Optional[float] = None):
+        """Recupera una sessione di checkout Stripe"""
+        return await self.call(
+            "checkout.session.retrieve", stripe.checkout.Session.retrieve, session_id, timeout=timeout
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+stripe_gateway = StripeGateway(
+    max_workers=settings.STRIPE_MAX_CONCURRENCY,
+    timeout=settings.STRIPE_TIMEOUT_SECONDS
+)
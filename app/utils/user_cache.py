@@ -0,0 +1,62 @@
+# app/utils/user_cache.py
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import settings
+
+class AuthenticatedUser:
+    """Campi dell'utente necessari per l'autorizzazione, senza sessione ORM"""
+    __slots__ = ("id", "email", "is_active", "is_admin")
+
+    def __init__(self, id: int, email: str, is_active: bool, is_admin: bool):
+        self.id = id
+        self.email = email
+        self.is_active = is_active
+        self.is_admin = is_admin
+
+    def __repr__(self):
+        return f"AuthenticatedUser(id={self.id}, email={self.email!r}, is_admin={self.is_admin})"
+
+class AuthUserCache:
+    """
+    Cache LRU con scadenza degli utenti autenticati, indicizzata per id.
+
+    L'invalidazione è locale al processo: con più worker il TTL limita per
+    quanto tempo un worker può vedere dati non aggiornati.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[AuthenticatedUser]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return user
+
+    def set(self, user: AuthenticatedUser):
+        if self.maxsize <= 0:
+            return
+        self._entries[user.id] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+auth_user_cache = AuthUserCache(
+    maxsize=settings.AUTH_USER_CACHE_SIZE,
+    ttl=settings.AUTH_USER_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,350 @@
+# app/utils/webhook_inbox.py
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Set
+
+from sqlalchemy import and_, exists, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.subscription import Subscription
+from app.models.user import User
+from app.models.webhook_event import WebhookEvent
+from app.utils.payments import calculate_next_billing_date
+from app.utils.activity import log_activity
+
+logger = logging.getLogger(__name__)
+
+class PermanentWebhookError(Exception):
+    """Errore che un nuovo tentativo non può risolvere (es. metadati mancanti)"""
+
+def get_ordering_key(event) -> str:
+    """Chiave che ordina gli eventi dello stesso abbonamento Stripe"""
+    data_object = event["data"]["object"]
+    if event["type"].startswith("customer.subscription."):
+        return data_object["id"]
+    subscription_id = data_object.get("subscription")
+    if subscription_id:
+        return subscription_id
+    return event["id"]
+
+async def store_event(db: AsyncSession, event, payload: str) -> bool:
+    """
+    Salva un evento Stripe (già verificato) nella inbox.
+
+    Returns:
+        bool: False se l'evento era già stato ricevuto (consegna ripetuta)
+    """
+    db.add(WebhookEvent(
+        id=event["id"],
+        type=event["type"],
+        payload=payload,
+        ordering_key=get_ordering_key(event),
+        stripe_created=event.get("created") or 0,
+        status="pending",
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    ))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return False
+    return True
+
+# Gestori degli eventi
+
+async def handle_checkout_completed(db: AsyncSession, event):
+    session = event["data"]["object"]
+
+    # Ottieni i metadati della sessione
+    metadata = session.get("metadata") or {}
+    user_id = metadata.get("user_id")
+    plan_id = metadata.get("plan_id")
+    billing_period = metadata.get("billing_period")
+
+    if not all([user_id, plan_id, billing_period]):
+        raise PermanentWebhookError("Metadati mancanti nel checkout session")
+
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if not user:
+        raise PermanentWebhookError(f"Utente non trovato: {user_id}")
+
+    # L'abbonamento potrebbe essere già stato creato da verify-session
+    if session.get("subscription"):
+        existing_subscription = await db.scalar(select(Subscription).where(
+            Subscription.stripe_subscription_id == session["subscription"]
+        ))
+        if existing_subscription:
+            logger.info(f"Abbonamento già esistente per {session['subscription']}")
+            return
+
+    try:
+        end_date = calculate_next_billing_date(billing_period)
+    except ValueError as e:
+        raise PermanentWebhookError(str(e))
+
+    subscription = Subscription(
+        user_id=user_id,
+        plan_id=plan_id,
+        start_date=datetime.utcnow(),
+        end_date=end_date,
+        is_active=True,
+        billing_period=billing_period,
+        next_billing_date=end_date,
+        stripe_customer_id=session.get("customer"),
+        stripe_subscription_id=session.get("subscription")
+    )
+    db.add(subscription)
+    await db.commit()
+    logger.info(f"Abbonamento creato per l'utente {user_id}")
+    await log_activity(
+        "subscription",
+        "Abbonamento attivato",
+        user_id=user.id,
+        metadata={"subscription_id": subscription.id, "plan_id": subscription.plan_id, "billing_period": billing_period}
+    )
+
+async def get_subscription(db: AsyncSession, stripe_subscription_id: str) -> Optional[Subscription]:
+    subscription = await db.scalar(select(Subscription).where(
+        Subscription.stripe_subscription_id == stripe_subscription_id
+    ))
+    if not subscription:
+        # Non si riprova: l'evento resterebbe "pending" per la sua ordering_key e
+        # bloccherebbe il checkout.session.completed, l'unico che crea l'abbonamento
+        logger.error(f"Abbonamento non trovato: {stripe_subscription_id}")
+    return subscription
+
+async def handle_subscription_updated(db: AsyncSession, event):
+    stripe_subscription = event["data"]["object"]
+    subscription = await get_subscription(db, stripe_subscription["id"])
+    if not subscription:
+        return
+
+    # Aggiorna lo stato dell'abbonamento
+    subscription.is_active = stripe_subscription.get("status") == "active"
+
+    # Se attivo, aggiorna la data di fine
+    if subscription.is_active and stripe_subscription.get("current_period_end"):
+        current_period_end = datetime.fromtimestamp(stripe_subscription["current_period_end"])
+        subscription.end_date = current_period_end
+        subscription.next_billing_date = current_period_end
+
+    await db.commit()
+    logger.info(f"Abbonamento {stripe_subscription['id']} aggiornato")
+
+async def handle_subscription_deleted(db: AsyncSession, event):
+    stripe_subscription = event["data"]["object"]
+    subscription = await get_subscription(db, stripe_subscription["id"])
+    if not subscription:
+        return
+
+    subscription.is_active = False
+    await db.commit()
+    logger.info(f"Abbonamento {stripe_subscription['id']} disattivato")
+
+async def handle_payment_failed(db: AsyncSession, event):
+    invoice = event["data"]["object"]
+    if invoice.get("subscription"):
+        subscription = await db.scalar(select(Subscription).where(
+            Subscription.stripe_subscription_id == invoice["subscription"]
+        ))
+        if subscription:
+            logger.warning(f"Pagamento fallito per l'abbonamento {subscription.id} dell'utente {subscription.user_id}")
+
+EVENT_HANDLERS = {
+    "checkout.session.completed": handle_checkout_completed,
+    "customer.subscription.updated": handle_subscription_updated,
+    "customer.subscription.deleted": handle_subscription_deleted,
+    "invoice.payment_failed": handle_payment_failed,
+}
+
+async def process_event(db: AsyncSession, event):
+    handler = EVENT_HANDLERS.get(event["type"])
+    if handler is None:
+        logger.info(f"Evento ricevuto: {event['type']}")
+        return
+    await handler(db, event)
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff esponenziale: base, 2*base, 4*base, ... fino a un'ora"""
+    seconds = settings.WEBHOOK_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(seconds, 3600))
+
+class WebhookWorkerPool:
+    """
+    Svuota la tabella webhook_events con un pool di task asyncio.
+
+    Un evento viene preso in carico solo se non esistono eventi precedenti con
+    la stessa ordering_key ancora da elaborare, quindi gli eventi dello stesso
+    abbonamento vengono applicati in ordine anche con più processi worker.
+    """
+
+    def __init__(self, workers: int, poll_interval: float, max_attempts: int, lock_timeout: float = 300):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lock_timeout = lock_timeout
+        self._wakeup = asyncio.Event()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def notify(self):
+        """Segnala che ci sono nuovi eventi da elaborare"""
+        self._wakeup.set()
+
+    def start(self):
+        if self._dispatcher is None:
+            self._slots = asyncio.Semaphore(self.workers)
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        # Attende gli eventi in corso: quelli interrotti verrebbero ripresi solo dopo lock_timeout
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _dispatch_loop(self):
+        while True:
+            # Azzerato prima della lettura: una notify() durante il claim non va persa
+            self._wakeup.clear()
+            try:
+                claimed = await self._claim_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Errore nella lettura della inbox webhook: {e}")
+                claimed = 0
+
+            if claimed == 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _claim_batch(self) -> int:
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            # Rilascia gli eventi rimasti in "processing" dopo un crash
+            await db.execute(
+                update(WebhookEvent)
+                .where(
+                    WebhookEvent.status == "processing",
+                    WebhookEvent.locked_at < now - timedelta(seconds=self.lock_timeout)
+                )
+                .values(status="pending", locked_at=None)
+            )
+            await db.commit()
+
+            candidates = (await db.execute(
+                select(WebhookEvent.id, WebhookEvent.ordering_key)
+                .where(WebhookEvent.status == "pending", WebhookEvent.next_attempt_at <= now)
+                .order_by(WebhookEvent.stripe_created, WebhookEvent.received_at)
+                .limit(self.workers * 4)
+            )).all()
+
+            claimed = 0
+            for event_id, ordering_key in candidates:
+                if self._slots.locked():
+                    # Tutti i worker occupati: si riprende quando uno termina
+                    break
+                if ordering_key in self._in_flight:
+                    continue
+                await self._slots.acquire()
+                if await self._claim(db, event_id):
+                    self._in_flight.add(ordering_key)
+                    task = asyncio.create_task(self._run(event_id, ordering_key))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                    claimed += 1
+                else:
+                    self._slots.release()
+            return claimed
+
+    async def _claim(self, db: AsyncSession, event_id: str) -> bool:
+        earlier = aliased(WebhookEvent)
+        has_earlier_pending = exists().where(
+            earlier.ordering_key == WebhookEvent.ordering_key,
+            earlier.status.in_(("pending", "processing")),
+            or_(
+                earlier.stripe_created < WebhookEvent.stripe_created,
+                and_(
+                    earlier.stripe_created == WebhookEvent.stripe_created,
+                    earlier.received_at < WebhookEvent.received_at
+                )
+            )
+        )
+        result = await db.execute(
+            update(WebhookEvent)
+            .where(
+                WebhookEvent.id == event_id,
+                WebhookEvent.status == "pending",
+                ~has_earlier_pending
+            )
+            .values(
+                status="processing",
+                locked_at=datetime.utcnow(),
+                attempts=WebhookEvent.attempts + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+    async def _run(self, event_id: str, ordering_key: str):
+        try:
+            await self._process(event_id)
+        finally:
+            self._in_flight.discard(ordering_key)
+            self._slots.release()
+            # L'evento successivo con la stessa chiave ora può essere preso in carico
+            self.notify()
+
+    async def _process(self, event_id: str):
+        async with AsyncSessionLocal() as db:
+            webhook_event = await db.get(WebhookEvent, event_id)
+            attempts = webhook_event.attempts
+            try:
+                await process_event(db, json.loads(webhook_event.payload))
+            except Exception as e:
+                await db.rollback()
+                permanent = isinstance(e, PermanentWebhookError) or attempts >= self.max_attempts
+                values = {"locked_at": None, "last_error": str(e)}
+                if permanent:
+                    values["status"] = "failed"
+                    logger.error(f"Evento webhook {event_id} fallito definitivamente: {e}")
+                else:
+                    values["status"] = "pending"
+                    values["next_attempt_at"] = datetime.utcnow() + retry_delay(attempts)
+                    logger.warning(f"Evento webhook {event_id} fallito (tentativo {attempts}), nuovo tentativo più tardi: {e}")
+            else:
+                values = {
+                    "status": "processed",
+                    "locked_at": None,
+                    "last_error": None,
+                    "processed_at": datetime.utcnow()
+                }
+
+            await db.execute(
+                update(WebhookEvent)
+                .where(WebhookEvent.id == event_id)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+webhook_worker_pool = WebhookWorkerPool(
+    workers=settings.WEBHOOK_WORKERS,
+    poll_interval=settings.WEBHOOK_POLL_INTERVAL_SECONDS,
+    max_attempts=settings.WEBHOOK_MAX_ATTEMPTS
+)
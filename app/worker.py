@@ -0,0 +1,62 @@
+# app/worker.py
+# Processo worker: esegue fuori dai worker web le attività in background
+# (job, webhook Stripe, coda email, statistiche admin).
+# Avvio: python -m app worker [--concurrency N], con WEB_RUNS_BACKGROUND_TASKS=False per il web
+import asyncio
+import logging
+import signal
+from typing import Optional
+
+from app.config import settings
+from app.utils.activity import activity_writer
+from app.utils.admin_stats import stats_refresher
+from app.utils.email import email_outbox
+from app.utils.jobs import job_scheduler, job_worker_pool
+from app.utils.webhook_inbox import webhook_worker_pool
+
+logger = logging.getLogger(__name__)
+
+def start_background_tasks():
+    """Avvia le attività in background abilitate dalle impostazioni"""
+    if job_worker_pool.workers > 0:
+        job_worker_pool.start()
+        job_scheduler.start()
+    if settings.WEBHOOK_WORKERS > 0:
+        webhook_worker_pool.start()
+    if settings.STATS_REFRESH_SECONDS > 0:
+        stats_refresher.start()
+    if settings.EMAIL_CONNECTIONS > 0:
+        email_outbox.start()
+
+async def stop_background_tasks():
+    """Arresta le attività in background, attendendo quelle in corso"""
+    await stats_refresher.stop()
+    await job_scheduler.stop()
+    await job_worker_pool.stop()
+    await email_outbox.stop()
+    await webhook_worker_pool.stop()
+
+async def run_worker(concurrency: Optional[int] = None):
+    """Esegue le attività in background fino a SIGINT/SIGTERM"""
+    # Importa tutti i modelli così che le relazioni siano configurate
+    import app.models  # noqa: F401
+    import app.models.shipment  # noqa: F401
+    from app.database import async_engine
+
+    if concurrency is not None:
+        job_worker_pool.workers = concurrency
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    activity_writer.start()
+    start_background_tasks()
+    logger.info(f"Worker avviato: {job_worker_pool.workers} job contemporanei")
+    await stop_event.wait()
+
+    logger.info("Arresto del worker...")
+    await stop_background_tasks()
+    await activity_writer.stop()
+    await async_engine.dispose()
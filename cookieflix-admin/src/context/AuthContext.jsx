@@ -2,6 +2,7 @@
 import { createContext, useContext, useEffect, useState } from 'react';
 import { jwtDecode } from 'jwt-decode';
 import axios from 'axios';
+import { refreshTokens } from '../services/apiConfig';
 
 const AuthContext = createContext();
 
@@ -15,30 +16,34 @@ export const AuthProvider = ({ children }) => {
   const [error, setError] = useState(null);
 
   useEffect(() => {
-    const token = localStorage.getItem('admin_token');
-    if (token) {
-      try {
-        const decoded = jwtDecode(token);
-        const currentTime = Date.now() / 1000;
-        
-        if (decoded.exp && decoded.exp < currentTime) {
-          // Token scaduto
-          localStorage.removeItem('admin_token');
-          setCurrentUser(null);
-        } else {
+    const initAuth = async () => {
+      let token = localStorage.getItem('admin_token');
+      if (token) {
+        try {
+          const decoded = jwtDecode(token);
+          const currentTime = Date.now() / 1000;
+          
+          if (decoded.exp && decoded.exp < currentTime) {
+            // Token scaduto: si prova a rinnovarlo con il refresh token
+            token = await refreshTokens();
+          }
+          
           // Token valido
-          setCurrentUser(decoded);
+          setCurrentUser(jwtDecode(token));
           
           // Verifica che l'utente sia effettivamente admin
           fetchUserProfile(token);
+        } catch (err) {
+          console.error('Invalid or expired token:', err);
+          localStorage.removeItem('admin_token');
+          localStorage.removeItem('admin_refresh_token');
+          setCurrentUser(null);
         }
-      } catch (err) {
-        console.error('Invalid token:', err);
-        localStorage.removeItem('admin_token');
-        setError('Sessione non valida');
       }
-    }
-    setIsLoading(false);
+      setIsLoading(false);
+    };
+
+    initAuth();
   }, []);
   
   const fetchUserProfile = async (token) => {
@@ -75,8 +80,9 @@ export const AuthProvider = ({ children }) => {
         }
       });
       
-      const { access_token } = response.data;
+      const { access_token, refresh_token } = response.data;
       localStorage.setItem('admin_token', access_token);
+      localStorage.setItem('admin_refresh_token', refresh_token);
       
       // Decodifica token e imposta utente
       const decoded = jwtDecode(access_token);
@@ -105,6 +111,7 @@ export const AuthProvider = ({ children }) => {
 
   const logout = () => {
     localStorage.removeItem('admin_token');
+    localStorage.removeItem('admin_refresh_token');
     setCurrentUser(null);
   };
 
@@ -28,15 +28,52 @@ api.interceptors.request.use(
   }
 );
 
+// Rinnovo dell'access token (breve durata) con il refresh token: le richieste
+// che ricevono 401 nello stesso momento condividono un'unica chiamata a /auth/refresh
+let refreshPromise = null;
+
+export const refreshTokens = () => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem('admin_refresh_token');
+    refreshPromise = (refreshToken
+      ? axios.post(`${API_URL}/auth/refresh`, { refresh_token: refreshToken })
+      : Promise.reject(new Error('Refresh token mancante'))
+    )
+      .then((response) => {
+        localStorage.setItem('admin_token', response.data.access_token);
+        localStorage.setItem('admin_refresh_token', response.data.refresh_token);
+        return response.data.access_token;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 // Interceptor per gestire gli errori di risposta
 api.interceptors.response.use(
   (response) => {
     return response;
   },
-  (error) => {
-    // Se riceviamo un 401 (non autorizzato), l'utente deve effettuare il login
+  async (error) => {
+    const originalRequest = error.config;
     if (error.response && error.response.status === 401) {
+      // Access token scaduto: un solo tentativo di rinnovo, poi si ripete la richiesta
+      if (originalRequest && !originalRequest._retried && localStorage.getItem('admin_refresh_token')) {
+        originalRequest._retried = true;
+        try {
+          const token = await refreshTokens();
+          originalRequest.headers.Authorization = `Bearer ${token}`;
+          return api(originalRequest);
+        } catch (refreshError) {
+          // Refresh token scaduto o revocato: l'utente deve effettuare il login
+        }
+      }
+
+      // Se riceviamo un 401 (non autorizzato), l'utente deve effettuare il login
       localStorage.removeItem('admin_token');
+      localStorage.removeItem('admin_refresh_token');
       
       // Verifichiamo di non essere già sulla pagina di login per evitare loop
       if (!window.location.pathname.includes('/login')) {
@@ -27,6 +27,7 @@ export const AuthProvider = ({ children }) => {
       } catch (err) {
         console.error('Error initializing auth:', err);
         localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
       } finally {
         setLoading(false);
       }
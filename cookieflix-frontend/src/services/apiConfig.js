@@ -22,13 +22,50 @@ api.interceptors.request.use(
   }
 );
 
+// Rinnovo dell'access token (breve durata) con il refresh token: le richieste
+// che ricevono 401 nello stesso momento condividono un'unica chiamata a /auth/refresh
+let refreshPromise = null;
+
+export const refreshTokens = () => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem('refresh_token');
+    refreshPromise = (refreshToken
+      ? axios.post(`${api.defaults.baseURL}/auth/refresh`, { refresh_token: refreshToken })
+      : Promise.reject(new Error('Refresh token mancante'))
+    )
+      .then((response) => {
+        localStorage.setItem('token', response.data.access_token);
+        localStorage.setItem('refresh_token', response.data.refresh_token);
+        return response.data.access_token;
+      })
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 // Interceptor per gestire errori di risposta
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
-    // Se il token è scaduto (401), logout automatico
+  async (error) => {
+    const originalRequest = error.config;
     if (error.response && error.response.status === 401) {
+      // Access token scaduto: un solo tentativo di rinnovo, poi si ripete la richiesta
+      if (originalRequest && !originalRequest._retried && localStorage.getItem('refresh_token')) {
+        originalRequest._retried = true;
+        try {
+          const token = await refreshTokens();
+          originalRequest.headers['Authorization'] = `Bearer ${token}`;
+          return api(originalRequest);
+        } catch (refreshError) {
+          // Refresh token scaduto o revocato: si procede con il logout
+        }
+      }
+
+      // Sessione scaduta (401), logout automatico
       localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
       localStorage.removeItem('user');
       window.location.href = '/login';
     }
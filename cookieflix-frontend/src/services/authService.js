@@ -22,6 +22,8 @@ export const loginUser = async (credentials) => {
     // Salva temporaneamente il token per ottenere i dati utente
     const token = response.data.access_token;
     localStorage.setItem('token', token);
+    // Refresh token: rinnova l'access token (breve durata) senza un nuovo login
+    localStorage.setItem('refresh_token', response.data.refresh_token);
     
     // Esegue una richiesta per ottenere i dati dell'utente
     try {
@@ -36,6 +38,7 @@ export const loginUser = async (credentials) => {
       console.error('Error fetching user data:', userError);
       // Rimuovi il token se non riesci a ottenere i dati utente
       localStorage.removeItem('token');
+      localStorage.removeItem('refresh_token');
       throw new Error('Impossibile ottenere i dati utente dopo il login');
     }
   } catch (error) {
@@ -87,6 +90,7 @@ export const getCurrentUser = async () => {
 
 // Funzione di logout (lato client)
 export const logoutUser = () => {
-  // Nel nostro caso è sufficiente rimuovere il token dal localStorage
+  // Nel nostro caso è sufficiente rimuovere i token dal localStorage
+  localStorage.removeItem('refresh_token');
   return true;
 };
\ No newline at end of file
@@ -0,0 +1,125 @@
+# explain_queries.py
+# Stampa EXPLAIN QUERY PLAN (SQLite) per le query più frequenti dei router.
+#
+# Senza argomenti crea un database in memoria e mostra i piani prima e dopo
+# gli indici della migrazione 7c2e41f0a9d3; con --database-url mostra i piani
+# sul database indicato, così com'è.
+#
+#   python explain_queries.py
+#   python explain_queries.py --database-url sqlite:///./cookieflix.db
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, select
+
+from app.database import Base
+from app.models import User, Subscription, Category, Design, Vote
+from app.models.shipment import Shipment
+
+# Indici aggiunti per i percorsi più caldi
+INDEX_PACK = [
+    "uq_votes_user_id_design_id",
+    "ix_votes_design_id",
+    "ix_votes_user_id_created_at",
+    "ix_subscriptions_user_id_is_active",
+    "ix_subscriptions_stripe_subscription_id",
+    "ix_designs_category_id_is_active",
+    "ix_shipments_user_id_created_at",
+]
+
+def router_queries():
+    """Query equivalenti a quelle eseguite dai router, con parametri di esempio"""
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+
+    return [
+        ("auth.get_current_user", select(User).where(User.id == 1)),
+        ("auth.login", select(User).where(User.email == "user@example.com")),
+        ("products.get_designs", select(Design).join(Category).where(
+            Design.is_active == True, Category.is_active == True, Design.category_id == 1
+        ).offset(0).limit(100)),
+        ("products.vote_for_design (abbonamento)", select(Subscription).where(
+            Subscription.user_id == 1, Subscription.is_active == True
+        )),
+        ("products.vote_for_design (voto esistente)", select(Vote).where(
+            Vote.user_id == 1, Vote.design_id == 1
+        )),
+        ("products.vote_for_design (voti del mese)", select(func.count(Vote.id))
+            .join(Design, Vote.design_id == Design.id)
+            .where(
+                Vote.user_id == 1,
+                Design.category_id == 1,
+                Vote.created_at >= month_start,
+                Vote.created_at < next_month_start
+            )),
+        ("products.get_my_votes", select(Design).join(Vote, Design.id == Vote.design_id).where(
+            Vote.user_id == 1, Design.is_active == True
+        )),
+        ("reconcile_votes (voti per design)", select(func.count(Vote.id)).where(Vote.design_id == 1)),
+        ("subscriptions.get_my_subscription", select(Subscription).where(
+            Subscription.user_id == 1, Subscription.is_active == True
+        )),
+        ("webhooks.stripe_webhook", select(Subscription).where(
+            Subscription.stripe_subscription_id == "sub_123"
+        )),
+        ("shipments.get_my_shipments", select(Shipment).where(
+            Shipment.user_id == 1
+        ).order_by(Shipment.created_at.desc())),
+        ("admin.get_admin_designs", select(Design).where(
+            Design.category_id == 1, Design.is_active == True
+        ).offset(0).limit(100)),
+    ]
+
+def explain(connection, statement):
+    """Restituisce le righe di EXPLAIN QUERY PLAN per uno statement SQLAlchemy"""
+    compiled = statement.compile(dialect=connection.dialect)
+    params = []
+    for name in compiled.positiontup:
+        value = compiled.params[name]
+        params.append(value.isoformat(" ") if isinstance(value, datetime) else value)
+    return connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", tuple(params)).fetchall()
+
+def print_plans(connection, title):
+    print(f"\n===== {title} =====")
+    for label, statement in router_queries():
+        print(f"\n-- {label}")
+        for row in explain(connection, statement):
+            # Righe: (id, parent, notused, detail)
+            print(f"   {row[-1]}")
+
+def compare_in_memory():
+    """Piani prima e dopo gli indici su uno schema vuoto in memoria"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    indexes = [
+        index
+        for table in Base.metadata.sorted_tables
+        for index in table.indexes
+        if index.name in INDEX_PACK
+    ]
+
+    with engine.connect() as connection:
+        for index in indexes:
+            index.drop(bind=connection)
+        print_plans(connection, "PRIMA degli indici")
+
+        for index in indexes:
+            index.create(bind=connection)
+        # Statistiche aggiornate per il query planner
+        connection.exec_driver_sql("ANALYZE")
+        print_plans(connection, "DOPO gli indici")
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN per le query dei router")
+    parser.add_argument("--database-url", help="Database SQLite da analizzare (es. sqlite:///./cookieflix.db)")
+    args = parser.parse_args()
+
+    if args.database_url:
+        engine = create_engine(args.database_url)
+        with engine.connect() as connection:
+            print_plans(connection, args.database_url)
+    else:
+        compare_in_memory()
+
+if __name__ == "__main__":
+    main()
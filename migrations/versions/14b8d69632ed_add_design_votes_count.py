@@ -0,0 +1,34 @@
+"""add design votes_count
+
+Revision ID: 14b8d69632ed
+Revises: 60a8ce084d6e
+Create Date: 2026-10-17 21:10:02.113624
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '14b8d69632ed'
+down_revision: Union[str, None] = '60a8ce084d6e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('designs', sa.Column('votes_count', sa.Integer(), server_default='0', nullable=False))
+    # Popola il contatore con i voti già presenti
+    op.execute(
+        "UPDATE designs SET votes_count = "
+        "(SELECT COUNT(votes.id) FROM votes WHERE votes.design_id = designs.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('designs') as batch_op:
+        batch_op.drop_column('votes_count')
@@ -0,0 +1,50 @@
+"""add hot path indexes
+
+Revision ID: 7c2e41f0a9d3
+Revises: 14b8d69632ed
+Create Date: 2026-10-17 21:32:47.508211
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e41f0a9d3'
+down_revision: Union[str, None] = '14b8d69632ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Rimuove eventuali voti duplicati prima di creare l'indice univoco
+    op.execute(
+        "DELETE FROM votes WHERE id NOT IN "
+        "(SELECT MIN(id) FROM votes GROUP BY user_id, design_id)"
+    )
+    op.execute(
+        "UPDATE designs SET votes_count = "
+        "(SELECT COUNT(votes.id) FROM votes WHERE votes.design_id = designs.id)"
+    )
+
+    op.create_index('uq_votes_user_id_design_id', 'votes', ['user_id', 'design_id'], unique=True)
+    op.create_index('ix_votes_design_id', 'votes', ['design_id'], unique=False)
+    op.create_index('ix_votes_user_id_created_at', 'votes', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_subscriptions_user_id_is_active', 'subscriptions', ['user_id', 'is_active'], unique=False)
+    op.create_index('ix_subscriptions_stripe_subscription_id', 'subscriptions', ['stripe_subscription_id'], unique=False)
+    op.create_index('ix_designs_category_id_is_active', 'designs', ['category_id', 'is_active'], unique=False)
+    op.create_index('ix_shipments_user_id_created_at', 'shipments', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_shipments_user_id_created_at', table_name='shipments')
+    op.drop_index('ix_designs_category_id_is_active', table_name='designs')
+    op.drop_index('ix_subscriptions_stripe_subscription_id', table_name='subscriptions')
+    op.drop_index('ix_subscriptions_user_id_is_active', table_name='subscriptions')
+    op.drop_index('ix_votes_user_id_created_at', table_name='votes')
+    op.drop_index('ix_votes_design_id', table_name='votes')
+    op.drop_index('uq_votes_user_id_design_id', table_name='votes')
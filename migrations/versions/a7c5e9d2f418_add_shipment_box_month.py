@@ -0,0 +1,32 @@
+"""add shipments.box_month
+
+Revision ID: a7c5e9d2f418
+Revises: 5d8b3e6f1c27
+Create Date: 2026-10-18 09:14:37.120584
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c5e9d2f418'
+down_revision: Union[str, None] = '5d8b3e6f1c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('shipments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('box_month', sa.String(), nullable=True))
+        batch_op.create_index('uq_shipments_user_id_box_month', ['user_id', 'box_month'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('shipments', schema=None) as batch_op:
+        batch_op.drop_index('uq_shipments_user_id_box_month')
+        batch_op.drop_column('box_month')
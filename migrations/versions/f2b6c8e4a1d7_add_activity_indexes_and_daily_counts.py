@@ -0,0 +1,39 @@
+"""add activity indexes and daily counts
+
+Revision ID: f2b6c8e4a1d7
+Revises: d4a1b7e9c3f5
+Create Date: 2026-10-18 15:04:37.219604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b6c8e4a1d7'
+down_revision: Union[str, None] = 'd4a1b7e9c3f5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_activities_user_id_created_at', 'activities', ['user_id', 'created_at'], unique=False)
+    op.create_index('ix_activities_type_created_at', 'activities', ['type', 'created_at'], unique=False)
+    op.create_index('ix_activities_created_at', 'activities', ['created_at'], unique=False)
+    op.create_table('activity_daily_counts',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('type', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'type')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('activity_daily_counts')
+    op.drop_index('ix_activities_created_at', table_name='activities')
+    op.drop_index('ix_activities_type_created_at', table_name='activities')
+    op.drop_index('ix_activities_user_id_created_at', table_name='activities')
@@ -0,0 +1,23 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# Database e file condivisi in una directory temporanea: vanno impostati prima
+# che app.config venga importato
+_tmp_dir = tempfile.mkdtemp(prefix="cookieflix-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp_dir}/test.db"
+os.environ["METRICS_DB_PATH"] = os.path.join(_tmp_dir, "metrics.db")
+os.environ["RATE_LIMIT_SQLITE_PATH"] = os.path.join(_tmp_dir, "rate_limits.db")
+
+import pytest
+
+@pytest.fixture
+def db_tables():
+    """Crea tutte le tabelle su un database vuoto e le elimina a fine test"""
+    import app.models  # noqa: F401
+    import app.models.shipment  # noqa: F401
+    from app.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,85 @@
+# tests/fake_stripe.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+class FakeStripeServer:
+    """
+    Server HTTP locale che risponde come l'API Stripe a POST /v1/customers,
+    dopo un ritardo configurabile. Registra le richieste contemporanee e le
+    connessioni TCP usate, per verificare limiti di concorrenza e keep-alive.
+    Si usa impostando stripe.api_base = server.url.
+    """
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.requests = 0
+        self.max_in_flight = 0
+        self.connections = set()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive: una connessione serve più richieste
+
+            def do_POST(self):
+                with fake._lock:
+                    fake.requests += 1
+                    fake._in_flight += 1
+                    fake.max_in_flight = max(fake.max_in_flight, fake._in_flight)
+                    fake.connections.add(self.client_address)
+                    number = fake.requests
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    params = parse_qs(self.rfile.read(length).decode())
+                    time.sleep(fake.delay)
+                    if self.path != "/v1/customers":
+                        self._reply(404, {"error": {"type": "invalid_request_error", "message": "Not found"}})
+                        return
+                    self._reply(200, {
+                        "id": f"cus_fake_{number}",
+                        "object": "customer",
+                        "email": params.get("email", [None])[0],
+                        "name": params.get("name", [None])[0],
+                        "metadata": {},
+                    })
+                finally:
+                    with fake._lock:
+                        fake._in_flight -= 1
+
+            def _reply(self, status_code: int, body: dict):
+                data = json.dumps(body).encode()
+                try:
+                    self.send_response(status_code)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Il client ha già rinunciato (timeout)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
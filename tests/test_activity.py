@@ -0,0 +1,40 @@
+# tests/test_activity.py
+import asyncio
+
+from app.utils import activity
+from app.utils.activity import ActivityLogWriter
+
+def record(n: int) -> dict:
+    return {"user_id": None, "type": "test", "description": str(n)}
+
+def test_failed_flush_keeps_buffer_within_max_buffer(monkeypatch):
+    async def scenario():
+        release = asyncio.Event()
+
+        class FailingSession:
+            async def __aenter__(self):
+                # Il database risponde con un errore solo dopo che il buffer si è riempito di nuovo
+                await release.wait()
+                raise RuntimeError("database non raggiungibile")
+
+            async def __aexit__(self, *exc):
+                return False
+
+        monkeypatch.setattr(activity, "AsyncSessionLocal", FailingSession)
+
+        writer = ActivityLogWriter(flush_size=1000, flush_interval=60, max_buffer=10, enqueue_timeout=0.1)
+        for n in range(10):
+            await writer.add(record(n))
+
+        flush = asyncio.create_task(writer.flush())
+        await asyncio.sleep(0)
+        for n in range(10, 20):
+            await writer.add(record(n))
+        release.set()
+        assert not await flush
+        return writer
+
+    writer = asyncio.run(scenario())
+
+    assert len(writer) == writer.max_buffer
+    assert writer.dropped == 10
@@ -0,0 +1,72 @@
+# tests/test_admin_stats.py
+import asyncio
+
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models.job import Job
+from app.models.subscription import Subscription
+from app.models.user import User
+from app.utils import admin_stats
+from app.utils.admin_stats import get_stats, refresh_snapshot
+
+def add_users(db, count: int, **values):
+    users = [User(email=f"{values.get('is_admin', False)}-{n}-{id(values)}@example.com", hashed_password="x", **values) for n in range(count)]
+    db.add_all(users)
+    db.commit()
+    return users
+
+def run(coroutine_function, *args):
+    async def call():
+        async with AsyncSessionLocal() as db:
+            return await coroutine_function(db, *args)
+    return asyncio.run(call())
+
+def test_stats_are_maintained_incrementally(db_tables, monkeypatch):
+    with SessionLocal() as db:
+        users = add_users(db, 3)
+        db.add(Subscription(user_id=users[0].id, plan_id=1, billing_period="monthly"))
+        db.commit()
+
+    # Contatori non ancora inizializzati: valori a zero e ricalcolo accodato, non eseguito nella richiesta
+    stats = run(get_stats, "users")
+    assert (stats["total"], stats["computed_at"]) == (0, None)
+    with SessionLocal() as db:
+        assert db.scalar(select(Job.name).where(Job.status == "queued")) == "refresh_stats"
+
+    run(refresh_snapshot, "users")
+    run(refresh_snapshot, "subscriptions")
+
+    with SessionLocal() as db:
+        add_users(db, 2, is_admin=True)
+        users = db.scalars(select(User).order_by(User.id)).all()
+        users[1].is_active = False
+        db.delete(users[2])
+        subscription = db.scalar(select(Subscription))
+        subscription.billing_period = "annual"
+        db.add(Subscription(user_id=users[1].id, plan_id=1, billing_period="monthly", is_active=False))
+        db.commit()
+
+    # Modifica tramite AsyncSession, come nei gestori dei webhook
+    async def cancel_subscription(db):
+        subscription = await db.scalar(select(Subscription).where(Subscription.is_active == True))
+        subscription.is_active = False
+        await db.commit()
+    run(cancel_subscription)
+
+    expected_users = run(admin_stats.compute_users_stats)
+    expected_subscriptions = run(admin_stats.compute_subscriptions_stats)
+
+    # Le letture non eseguono gli aggregati completi
+    def no_full_scan(db):
+        raise AssertionError("aggregato completo durante la richiesta")
+    monkeypatch.setitem(admin_stats.STATS, "users", no_full_scan)
+    monkeypatch.setitem(admin_stats.STATS, "subscriptions", no_full_scan)
+
+    users_stats = run(get_stats, "users")
+    subscriptions_stats = run(get_stats, "subscriptions")
+    users_stats.pop("computed_at")
+    subscriptions_stats.pop("computed_at")
+    assert users_stats == expected_users == {"total": 4, "active": 3, "inactive": 1, "admins": 2, "recent": 4}
+    assert subscriptions_stats == expected_subscriptions
+    assert (subscriptions_stats["total"], subscriptions_stats["active"]) == (2, 0)
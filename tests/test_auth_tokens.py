@@ -0,0 +1,29 @@
+# tests/test_auth_tokens.py
+import asyncio
+from datetime import datetime
+
+from app.config import settings
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models.user import User
+from app.routers.auth import refresh_access_token
+from app.schemas.user import RefreshTokenRequest
+from app.utils.auth import create_token_pair, decode_token
+
+def test_access_token_is_short_lived_and_refreshable(db_tables):
+    assert settings.ACCESS_TOKEN_EXPIRE_MINUTES <= 15
+
+    with SessionLocal() as db:
+        user = User(email="token@example.com", hashed_password="x", full_name="Test", is_active=True)
+        db.add(user)
+        db.commit()
+        tokens = create_token_pair(user)
+
+    access = decode_token(tokens["access_token"])
+    assert access["exp"] - datetime.utcnow().timestamp() <= settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    async def refresh():
+        async with AsyncSessionLocal() as db:
+            return await refresh_access_token(RefreshTokenRequest(refresh_token=tokens["refresh_token"]), db=db)
+
+    renewed = asyncio.run(refresh())
+    assert decode_token(renewed["access_token"])["sub"] == access["sub"]
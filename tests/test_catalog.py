@@ -0,0 +1,43 @@
+# tests/test_catalog.py
+from datetime import datetime
+
+from app.schemas import product as product_schemas
+from app.schemas import subscription as subscription_schemas
+from app.utils.catalog import CatalogSnapshot
+
+def make_snapshot() -> CatalogSnapshot:
+    plans = [subscription_schemas.SubscriptionPlan(
+        id=1, name="Starter", slug="starter", description="", categories_count=1, items_per_month=1,
+        monthly_price=1, quarterly_price=3, semiannual_price=6, annual_price=12, features=[],
+        is_popular=False, is_active=True
+    )]
+    categories = [
+        product_schemas.Category(
+            id=category_id, name=f"Categoria {category_id}", description="", slug=f"cat-{category_id}", is_active=True
+        )
+        for category_id in (1, 2)
+    ]
+    designs = [
+        product_schemas.Design(
+            id=design_id, name=f"Design {design_id}", description="", category_id=1 + design_id % 2,
+            image_url="", created_at=datetime(2024, 1, 1), is_active=True, votes_count=0
+        )
+        for design_id in range(1, 7)
+    ]
+    return CatalogSnapshot(1, plans, categories, designs)
+
+def test_vote_changes_only_the_etag_of_its_category():
+    snapshot = make_snapshot()
+    keys = ["plans:None:0:100", "plan:starter", "categories:None:0:100", "category:cat-1",
+            "designs:1:None:0:100", "designs:2:None:0:100", "designs:None:None:0:100"]
+    for key in keys:
+        snapshot.render(key, lambda: [])
+
+    # Il design 1 appartiene alla categoria 2
+    updated = snapshot.with_votes({1: 5})
+
+    changed = {key for key in keys if updated.etag(key) != snapshot.etag(key)}
+    assert changed == {"designs:2:None:0:100", "designs:None:None:0:100"}
+    # Le risposte delle sezioni non cambiate restano serializzate
+    assert set(updated._rendered) == set(keys) - changed
+    assert updated.with_votes({1: 5}) is updated
@@ -0,0 +1,14 @@
+# tests/test_csrf.py
+from app.utils.csrf import generate_csrf_token, validate_csrf_token
+
+def test_valid_token_is_accepted_once():
+    token = generate_csrf_token(42)
+    assert validate_csrf_token(token, 42)
+    assert not validate_csrf_token(token, 42)
+
+def test_token_is_bound_to_user():
+    assert not validate_csrf_token(generate_csrf_token(42), 7)
+
+def test_malformed_and_non_ascii_tokens_are_rejected():
+    for token in ("", "abc", "0.99999999999.n.é", "0.99999999999.é.sig", None):
+        assert not validate_csrf_token(token)
@@ -0,0 +1,152 @@
+# tests/test_email.py
+import asyncio
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+from aiosmtpd.controller import Controller
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models.outbound_email import OutboundEmail
+from app.utils.email import EmailOutbox, SMTPConnectionPool, queue_email
+
+class RecordingHandler:
+    """Sink SMTP: registra le email ricevute e la connessione usata; rifiuta alcuni destinatari"""
+
+    def __init__(self):
+        self.messages = []
+        self.peers = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("rifiutata"):
+            return "550 Mailbox inesistente"
+        if address.startswith("occupata"):
+            return "451 Riprovare più tardi"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos[0], envelope.content))
+        self.peers.add(session.peer)
+        return "250 OK"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def smtp_sink(monkeypatch):
+    """Server SMTP aiosmtpd in processo, con le impostazioni email che puntano a esso"""
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    monkeypatch.setattr(settings, "EMAIL_SERVER", "127.0.0.1")
+    monkeypatch.setattr(settings, "EMAIL_PORT", controller.port)
+    monkeypatch.setattr(settings, "EMAIL_SENDER", "noreply@cookieflix.test")
+    monkeypatch.setattr(settings, "EMAIL_PASSWORD", "")
+    monkeypatch.setattr(settings, "EMAIL_USE_SSL", False)
+    monkeypatch.setattr(settings, "EMAIL_USE_STARTTLS", False)
+    monkeypatch.setattr(settings, "EMAIL_RETRY_BASE_SECONDS", 30)
+    yield handler
+    controller.stop()
+
+def make_outbox(max_attempts: int = 6) -> EmailOutbox:
+    pool = SMTPConnectionPool(size=2, idle_timeout=60, rate_per_second=0)
+    return EmailOutbox(pool, batch_size=5, poll_interval=0.05, max_attempts=max_attempts)
+
+async def queue(recipients):
+    async with AsyncSessionLocal() as db:
+        for recipient in recipients:
+            await queue_email(db, recipient, "Oggetto", "Testo")
+
+def emails_by_recipient():
+    with SessionLocal() as db:
+        return {email.recipient: email for email in db.scalars(select(OutboundEmail))}
+
+def test_batches_are_sent_on_reused_connections(db_tables, smtp_sink):
+    outbox = make_outbox()
+
+    async def scenario():
+        await queue([f"utente{n}@example.com" for n in range(10)])
+        first = await outbox._send_pending()
+        await queue([f"altro{n}@example.com" for n in range(4)])
+        second = await outbox._send_pending()
+        await outbox.stop()
+        return first, second
+
+    # 10 email = 2 gruppi da 5, uno per connessione
+    assert asyncio.run(scenario()) == (10, 4)
+    assert len(smtp_sink.messages) == 14
+    # Il secondo ciclo riusa le connessioni del primo
+    assert len(smtp_sink.peers) <= 2
+    assert {email.status for email in emails_by_recipient().values()} == {"sent"}
+
+def test_rejections_fail_permanently_or_are_retried_with_backoff(db_tables, smtp_sink):
+    outbox = make_outbox()
+
+    async def scenario():
+        await queue(["rifiutata@example.com", "occupata@example.com", "ok@example.com"])
+        await outbox._send_pending()
+        await outbox.stop()
+
+    before = datetime.utcnow()
+    asyncio.run(scenario())
+    emails = emails_by_recipient()
+
+    assert emails["ok@example.com"].status == "sent"
+    # 5xx: nessun nuovo tentativo
+    assert emails["rifiutata@example.com"].status == "failed"
+    assert "550" in emails["rifiutata@example.com"].last_error
+    # 4xx: di nuovo in coda dopo EMAIL_RETRY_BASE_SECONDS
+    transient = emails["occupata@example.com"]
+    assert (transient.status, transient.attempts) == ("pending", 1)
+    assert transient.next_attempt_at >= before + timedelta(seconds=settings.EMAIL_RETRY_BASE_SECONDS)
+    assert [recipient for recipient, _ in smtp_sink.messages] == ["ok@example.com"]
+
+def test_transient_error_fails_after_max_attempts(db_tables, smtp_sink):
+    outbox = make_outbox(max_attempts=2)
+
+    async def scenario():
+        await queue(["occupata@example.com"])
+        for _ in range(2):
+            await outbox._send_pending()
+            async with AsyncSessionLocal() as db:
+                # Simula il passare del backoff
+                email = await db.scalar(select(OutboundEmail))
+                email.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+                await db.commit()
+        await outbox.stop()
+
+    asyncio.run(scenario())
+    email = emails_by_recipient()["occupata@example.com"]
+    assert (email.status, email.attempts) == ("failed", 2)
+
+def test_email_stuck_in_sending_is_released(db_tables, smtp_sink):
+    outbox = make_outbox()
+    with SessionLocal() as db:
+        # Presa in carico da un processo terminato prima dell'invio
+        db.add(OutboundEmail(
+            recipient="bloccata@example.com", subject="Oggetto", body="Testo", status="sending",
+            attempts=1, locked_by="processo-terminato", locked_at=datetime.utcnow() - timedelta(seconds=outbox.lock_timeout + 1),
+            next_attempt_at=datetime.utcnow() - timedelta(minutes=10)
+        ))
+        db.add(OutboundEmail(
+            recipient="in-corso@example.com", subject="Oggetto", body="Testo", status="sending",
+            attempts=1, locked_by="altro-processo", locked_at=datetime.utcnow(),
+            next_attempt_at=datetime.utcnow() - timedelta(minutes=10)
+        ))
+        db.commit()
+
+    async def scenario():
+        sent = await outbox._send_pending()
+        await outbox.stop()
+        return sent
+
+    assert asyncio.run(scenario()) == 1
+    emails = emails_by_recipient()
+    assert (emails["bloccata@example.com"].status, emails["bloccata@example.com"].attempts) == ("sent", 2)
+    # Un invio ancora in corso in un altro processo non viene toccato
+    assert emails["in-corso@example.com"].status == "sending"
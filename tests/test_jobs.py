@@ -0,0 +1,45 @@
+# tests/test_jobs.py
+import asyncio
+
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.models.job import Job
+from app.utils.jobs import JobWorkerPool, enqueue_job, job, job_handlers
+
+def test_long_running_job_is_not_reclaimed_while_heartbeat_runs(db_tables):
+    runs = []
+
+    @job("test_slow")
+    async def slow_job(db, payload):
+        runs.append(payload)
+        # Dura molte volte lock_timeout: senza heartbeat verrebbe rimesso in coda ed eseguito di nuovo
+        await asyncio.sleep(1.5)
+        return "ok"
+
+    async def scenario():
+        pool = JobWorkerPool(workers=2, poll_interval=0.05, lock_timeout=0.5, heartbeat_interval=0.1)
+        async with AsyncSessionLocal() as db:
+            queued = await enqueue_job(db, "test_slow", {"n": 1})
+        pool.start()
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + 5
+            while loop.time() < deadline:
+                async with AsyncSessionLocal() as db:
+                    current = await db.scalar(select(Job).where(Job.id == queued.id))
+                if current.status == "succeeded":
+                    break
+                await asyncio.sleep(0.05)
+            return current
+        finally:
+            await pool.stop()
+
+    try:
+        finished = asyncio.run(scenario())
+    finally:
+        job_handlers.pop("test_slow", None)
+
+    assert finished.status == "succeeded"
+    assert finished.attempts == 1
+    assert runs == [{"n": 1}]
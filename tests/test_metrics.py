@@ -0,0 +1,47 @@
+# tests/test_metrics.py
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.utils.metrics import is_local_request
+
+def client_from(host: str) -> TestClient:
+    """TestClient che presenta all'app l'indirizzo del chiamante indicato"""
+    async def with_client(scope, receive, send):
+        if scope["type"] == "http":
+            scope = {**scope, "client": (host, 50000)}
+        await app(scope, receive, send)
+    return TestClient(with_client)
+
+@pytest.fixture
+def metrics_settings(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_ENABLED", True)
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "")
+    return monkeypatch
+
+def test_metrics_without_token_are_hidden_from_remote_clients(metrics_settings):
+    remote = client_from("203.0.113.7")
+    assert remote.get("/metrics").status_code == 404
+
+def test_metrics_without_token_are_served_to_localhost_only_without_proxy(metrics_settings):
+    local = client_from("127.0.0.1")
+    response = local.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    # Reverse proxy sulla stessa macchina: la richiesta arriva da fuori
+    assert local.get("/metrics", headers={"X-Forwarded-For": "203.0.113.7"}).status_code == 404
+
+def test_metrics_token_is_required_when_configured(metrics_settings):
+    metrics_settings.setattr(settings, "METRICS_TOKEN", "segreto")
+    local = client_from("127.0.0.1")
+    assert local.get("/metrics").status_code == 401
+    assert local.get("/metrics", headers={"Authorization": "Bearer sbagliato"}).status_code == 401
+    assert local.get("/metrics", headers={"Authorization": "Bearer segreto"}).status_code == 200
+
+def test_is_local_request():
+    assert is_local_request("127.0.0.1", {})
+    assert is_local_request("::1", {})
+    assert not is_local_request("127.0.0.1", {"x-forwarded-for": "203.0.113.7"})
+    assert not is_local_request("203.0.113.7", {})
+    assert not is_local_request(None, {})
@@ -0,0 +1,57 @@
+# tests/test_shipments.py
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi import Response
+
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models.shipment import Shipment
+from app.models.user import User
+from app.routers.shipments import get_my_shipments
+
+def create_shipments(count: int) -> int:
+    with SessionLocal() as db:
+        user = User(email="spedizioni@example.com", hashed_password="x", full_name="Test")
+        db.add(user)
+        db.flush()
+        start = datetime(2020, 1, 1)
+        db.add_all(
+            Shipment(user_id=user.id, status="delivered", created_at=start + timedelta(days=i))
+            for i in range(count)
+        )
+        db.commit()
+        return user.id
+
+def list_shipments(user_id: int, **params):
+    async def call():
+        response = Response()
+        async with AsyncSessionLocal() as db:
+            shipments = await get_my_shipments(
+                response,
+                db=db,
+                current_user=SimpleNamespace(id=user_id),
+                **{"limit": None, "cursor": None, "compact": True, **params}
+            )
+        return shipments, response.headers.get("X-Next-Cursor")
+    return asyncio.run(call())
+
+def test_my_shipments_without_pagination_returns_all(db_tables):
+    user_id = create_shipments(60)
+
+    shipments, next_cursor = list_shipments(user_id)
+
+    assert len(shipments) == 60
+    assert next_cursor is None
+
+def test_my_shipments_cursor_pages_cover_all(db_tables):
+    user_id = create_shipments(60)
+
+    first, next_cursor = list_shipments(user_id, limit=25)
+    seen = [shipment.id for shipment in first]
+    while next_cursor:
+        page, next_cursor = list_shipments(user_id, cursor=next_cursor)
+        seen.extend(shipment.id for shipment in page)
+
+    assert len(first) == 25
+    assert len(seen) == len(set(seen)) == 60
@@ -0,0 +1,64 @@
+# tests/test_stripe_gateway.py
+import asyncio
+import time
+
+import pytest
+import stripe
+from fastapi import HTTPException
+
+from app.utils.stripe_gateway import StripeGateway
+from tests.fake_stripe import FakeStripeServer
+
+@pytest.fixture
+def fake_stripe():
+    """Punta la libreria Stripe a un FakeStripeServer locale, ripristinando la configurazione"""
+    previous = (stripe.api_base, stripe.api_key, stripe.default_http_client)
+    with FakeStripeServer() as server:
+        stripe.api_base = server.url
+        stripe.api_key = "sk_test_fake"
+        yield server
+    stripe.api_base, stripe.api_key, stripe.default_http_client = previous
+
+def test_create_customer_against_fake_server(fake_stripe):
+    gateway = StripeGateway(max_workers=2, timeout=5)
+    try:
+        customer_id = asyncio.run(gateway.create_customer("test@example.com", "Test"))
+    finally:
+        gateway.shutdown()
+
+    assert customer_id == "cus_fake_1"
+    assert gateway.metrics.snapshot()["customer.create"]["count"] == 1
+
+def test_slow_stripe_returns_504(fake_stripe):
+    fake_stripe.delay = 1.0
+    gateway = StripeGateway(max_workers=2, timeout=0.2)
+    start = time.perf_counter()
+    try:
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(gateway.create_customer("test@example.com", "Test"))
+    finally:
+        gateway.shutdown()
+
+    assert error.value.status_code == 504
+    assert time.perf_counter() - start < fake_stripe.delay
+    stats = gateway.metrics.snapshot()["customer.create"]
+    assert (stats["count"], stats["errors"]) == (1, 1)
+
+def test_concurrency_is_bounded_and_connections_are_reused(fake_stripe):
+    fake_stripe.delay = 0.1
+    gateway = StripeGateway(max_workers=2, timeout=5)
+
+    async def create_many():
+        return await asyncio.gather(*(
+            gateway.create_customer(f"user{n}@example.com", f"User {n}") for n in range(8)
+        ))
+
+    try:
+        customer_ids = asyncio.run(create_many())
+    finally:
+        gateway.shutdown()
+
+    assert len(set(customer_ids)) == 8
+    assert fake_stripe.max_in_flight == 2
+    # Sessione HTTP condivisa: al massimo una connessione per thread del pool
+    assert len(fake_stripe.connections) <= 2
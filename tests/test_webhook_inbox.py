@@ -0,0 +1,66 @@
+# tests/test_webhook_inbox.py
+import asyncio
+import json
+
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models.subscription import Subscription
+from app.models.user import User
+from app.models.webhook_event import WebhookEvent
+from app.utils.webhook_inbox import WebhookWorkerPool, store_event
+
+def make_event(event_id: str, event_type: str, created: int, data_object: dict) -> dict:
+    return {"id": event_id, "type": event_type, "created": created, "data": {"object": data_object}}
+
+async def run_until_settled(pool: WebhookWorkerPool, timeout: float = 5) -> dict:
+    """Avvia il pool e attende che nessun evento sia più pending/processing"""
+    pool.start()
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            async with AsyncSessionLocal() as db:
+                statuses = dict((await db.execute(select(WebhookEvent.id, WebhookEvent.status))).all())
+            if not {"pending", "processing"} & set(statuses.values()):
+                return statuses
+            await asyncio.sleep(0.05)
+        return statuses
+    finally:
+        await pool.stop()
+
+def test_subscription_updated_before_checkout_does_not_block_checkout(db_tables):
+    with SessionLocal() as db:
+        user = User(email="ordine@example.com", hashed_password="x", full_name="Test")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+
+    # Stripe crea customer.subscription.updated prima di checkout.session.completed:
+    # stessa ordering_key (sub_123), l'aggiornamento arriva per primo
+    updated = make_event("evt_updated", "customer.subscription.updated", 100, {
+        "id": "sub_123", "status": "active", "current_period_end": 2000000000
+    })
+    checkout = make_event("evt_checkout", "checkout.session.completed", 101, {
+        "id": "cs_123",
+        "subscription": "sub_123",
+        "customer": "cus_123",
+        "metadata": {"user_id": str(user_id), "plan_id": "1", "billing_period": "monthly"}
+    })
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            for event in (updated, checkout):
+                assert await store_event(db, event, json.dumps(event))
+
+        pool = WebhookWorkerPool(workers=2, poll_interval=0.05, max_attempts=8)
+        return await run_until_settled(pool)
+
+    statuses = asyncio.run(scenario())
+
+    assert statuses == {"evt_updated": "processed", "evt_checkout": "processed"}
+    with SessionLocal() as db:
+        subscription = db.scalar(select(Subscription).where(Subscription.stripe_subscription_id == "sub_123"))
+        assert subscription is not None
+        assert subscription.user_id == user_id
+        assert subscription.is_active